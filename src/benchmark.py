@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from itertools import combinations
+
+from data_sources import LocalDataSource
+from profiling import StageTimer
+from results import ResultsCalculator
+from strategy import Strategy
+
+
+class NullCollection:
+    """
+    Stands in for the strategy collection : the trades are serialized as for MongoDB but not written anywhere.
+    """
+    def insert_one(self, document):
+        return
+
+    def insert_many(self, documents, ordered=True):
+        return
+
+
+def generate_universe(sectors, stocks_per_sector, days, cointegrated_fraction=0.5, seed=0):
+    """
+    Synthetic daily data laid out like the documents of the SP500 collection.
+    In every sector, cointegrated_fraction of the stocks load on a common random walk plus a stationary AR(1) deviation
+    (so that their pairs are cointegrated) and the other stocks are independent random walks.
+    Returns {stock: DataFrame}.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2010-01-01', periods=days)
+    universe = {}
+    for sector_idx in range(sectors):
+        common = np.cumsum(rng.normal(0, 1, days))
+        n_cointegrated = int(round(stocks_per_sector * cointegrated_fraction))
+        for stock_idx in range(stocks_per_sector):
+            if stock_idx < n_cointegrated:
+                deviation = np.zeros(days)
+                shocks = rng.normal(0, 1, days)
+                for day in range(1, days):
+                    deviation[day] = 0.9 * deviation[day - 1] + shocks[day]
+                close = 100 + rng.uniform(0.5, 2) * common + deviation
+            else:
+                close = 100 + np.cumsum(rng.normal(0, 1, days))
+            close = np.maximum(close, 1)
+            stock = f'SEC{sector_idx}_STK{stock_idx}'
+            universe[stock] = pd.DataFrame({
+                'date': dates,
+                'instrument_name': f'EQTSTK_{stock}_XXXXXXXXX_XX_0',
+                'underlying': stock,
+                'open': close + rng.normal(0, 0.2, days),
+                'close': close,
+                'sector': f'SEC{sector_idx}'
+            })
+    return universe
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_benchmark(config, sectors=2, stocks_per_sector=10, days=1500, cointegrated_fraction=0.5, seed=0, store_path=None):
+    """
+    Runs Strategy.trade_pairs on every pair of a synthetic universe read from a local store (no MongoDB involved) and
+    ResultsCalculator on the trades, timing each stage.
+    Returns the benchmark record - universe, stage times and calls, pairs/sec and windows/sec.
+    """
+    if pa == None:
+        raise Exception("pyarrow is required for the benchmark.")
+    temp_dir = tempfile.TemporaryDirectory()
+    store_path = os.path.join(temp_dir.name, 'store') if store_path == None else store_path
+    data_source = LocalDataSource(store_path)
+    universe = generate_universe(sectors, stocks_per_sector, days, cointegrated_fraction, seed)
+    for stock, data in universe.items():
+        data_source.write_table(stock, pa.Table.from_pandas(data, preserve_index=False))
+    config = json.loads(json.dumps(config))
+    config['date_parameters'] = {'start_date': '', 'end_date': ''}
+    config['data_parameters'] = {'source': 'local', 'local_store': {'path': store_path, 'format': 'parquet'}}
+    config.setdefault('run_parameters', {})['incremental'] = False
+    # Every run times the statistical stage, rather than reading it from the window cache.
+    config['window_cache_parameters'] = {'enabled': False}
+    # The stages are timed one after the other, without the prefetch threads.
+    config['pipeline_parameters'] = {'enabled': False}
+    config['database_parameters']['mongo'].pop('trade_sink', None)
+
+    timer = StageTimer()
+    stages = ['fetch', 'pair_data', 'hedge_ratio', 'adf', 'signals', 'simulate', 'save']
+    all_trades_list, windows, pairs = [], 0, 0
+    run_start = time.perf_counter()
+    for sector_idx in range(sectors):
+        sector = f'SEC{sector_idx}'
+        stock_list = [stock for stock in universe if stock.startswith(f'{sector}_')]
+        strat = Strategy(config, sector, stock_list)
+        strat.mongo_interactor.strategy_collection = NullCollection()
+        for stage, obj, method in zip(stages, [strat.data_processor, strat, strat, strat, strat, strat, strat.mongo_interactor],
+                ['build_price_panel', 'get_pair_data', 'create_pair_windows', 'perform_adfuller_tests', 'calculate_signals', 'generate_trades', 'save_trades']):
+            setattr(obj, method, timer.wrap(stage, getattr(obj, method)))
+        stock_pairs = list(combinations(stock_list, 2))
+        all_trades_list.extend(strat.trade_stock_pairs(stock_pairs))
+        windows += strat.adf_report['windows']
+        pairs += len(stock_pairs)
+    backtest_time = time.perf_counter() - run_start
+
+    results_calculator = ResultsCalculator({'capital': config['capital_parameters']['total_capital']})
+    for stage, method in [('results_mtm', 'get_mtm_metrics'), ('results_trades', 'get_trade_metrics')]:
+        setattr(results_calculator, method, timer.wrap(stage, getattr(results_calculator, method)))
+    results_start = time.perf_counter()
+    if not all_trades_list == []:
+        results_calculator.calculate_results(all_trades_list, temp_dir.name, 'Benchmark')
+    results_time = time.perf_counter() - results_start
+    temp_dir.cleanup()
+
+    return {
+        'commit': get_commit(),
+        'timestamp': dt.datetime.now().isoformat(timespec='seconds'),
+        'universe': {'sectors': sectors, 'stocks_per_sector': stocks_per_sector, 'days': days, 'cointegrated_fraction': cointegrated_fraction, 'seed': seed},
+        'pairs': pairs,
+        'windows': windows,
+        'trades': len(all_trades_list),
+        'backtest_seconds': backtest_time,
+        'results_seconds': results_time,
+        'pairs_per_sec': pairs / backtest_time,
+        'windows_per_sec': windows / backtest_time,
+        'stage_seconds': dict(timer.times),
+        'stage_calls': dict(timer.calls)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Times the stages of the backtest on a synthetic universe read from a local store.")
+    parser.add_argument('--sectors', type=int, default=2)
+    parser.add_argument('--stocks', type=int, default=10, help="stocks per sector")
+    parser.add_argument('--days', type=int, default=1500)
+    parser.add_argument('--cointegrated', type=float, default=0.5, help="fraction of the stocks of a sector that are cointegrated")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmarks.jsonl', help="file the benchmark record is appended to")
+    args = parser.parse_args()
+
+    with open('config.json') as jfile:
+        config = json.load(jfile)
+
+    record = run_benchmark(config, sectors=args.sectors, stocks_per_sector=args.stocks, days=args.days, cointegrated_fraction=args.cointegrated, seed=args.seed)
+    with open(args.output, 'a') as jfile:
+        jfile.write(json.dumps(record) + '\n')
+    print(f"{record['pairs']} pairs, {record['windows']} windows, {record['trades']} trades - "
+          f"{record['pairs_per_sec']:.1f} pairs/sec, {record['windows_per_sec']:.1f} windows/sec, results in {record['results_seconds']:.2f}s.")
+    for stage, seconds in sorted(record['stage_seconds'].items(), key=lambda item: -item[1]):
+        print(f"    {stage:<15}{seconds:>10.3f}s{record['stage_calls'][stage]:>10} calls")
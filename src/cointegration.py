@@ -0,0 +1,69 @@
+import numpy as np
+from collections import defaultdict
+from statsmodels.tsa.adfvalues import mackinnoncrit
+
+
+def fixed_lag_adf_statistics(spreads, lags=1):
+    """
+    Augmented Dickey Fuller t-statistics (constant, no trend) with a fixed number of lags for many series at once.
+    spreads : (series x length) array, all the series having the same length.
+    Regresses diff(y)_t on [1, y_(t-1), diff(y)_(t-1), ..., diff(y)_(t-lags)] for every series with one batched solve.
+    Returns the t-statistics and the number of observations used in the regression.
+    """
+    spreads = np.asarray(spreads, dtype=np.float64)
+    length = spreads.shape[1]
+    diffs = np.diff(spreads, axis=1)
+    n_obs = length - 1 - lags
+    target = diffs[:, lags:]
+    columns = [np.ones_like(target), spreads[:, lags:-1]]
+    for lag in range(1, lags + 1):
+        columns.append(diffs[:, lags - lag:-lag])
+    design = np.stack(columns, axis=2)
+    n_params = design.shape[2]
+
+    xtx = np.einsum('wti,wtj->wij', design, design)
+    xty = np.einsum('wti,wt->wi', design, target)
+    xtx_inv = np.linalg.pinv(xtx)
+    params = np.einsum('wij,wj->wi', xtx_inv, xty)
+    residuals = target - np.einsum('wti,wi->wt', design, params)
+    sigma_2 = np.einsum('wt,wt->w', residuals, residuals) / (n_obs - n_params)
+    t_stats = params[:, 1] / np.sqrt(sigma_2 * xtx_inv[:, 1, 1])
+    return t_stats, n_obs
+
+
+def screen_adf(spread_list, lags=1, tolerance=0.5, return_statistics=False):
+    """
+    Pre-screens the spreads with a fixed lag ADF statistic against the 5% critical value.
+    Returns a verdict per spread -
+    -> 'reject' : statistic above critical value + tolerance, clearly non-stationary.
+    -> 'accept' : statistic below critical value - tolerance, clearly stationary.
+    -> 'exact' : too close to call; the exact test (statsmodels adfuller with automatic lag selection) is required.
+    Spreads of equal length are screened together in one batch.
+    The fixed lag statistic is not that of the exact test, so 'accept' and 'reject' can disagree with its verdict whatever
+    the tolerance - screened runs do not reproduce the trades of unscreened ones.
+    return_statistics : if True, the fixed lag statistics (None for the spreads too short to screen) are returned along with the verdicts.
+    """
+    verdicts = [None] * len(spread_list)
+    statistics = [None] * len(spread_list)
+    groups = defaultdict(list)
+    for idx, spread in enumerate(spread_list):
+        groups[len(spread)].append(idx)
+    for length, indices in groups.items():
+        if length - 1 - lags <= lags + 2:
+            # Too short to screen.
+            for idx in indices:
+                verdicts[idx] = 'exact'
+            continue
+        t_stats, n_obs = fixed_lag_adf_statistics(np.stack([spread_list[idx] for idx in indices]), lags=lags)
+        critical_value = mackinnoncrit(N=1, regression='c', nobs=n_obs)[1]
+        for idx, t_stat in zip(indices, t_stats):
+            statistics[idx] = float(t_stat)
+            if t_stat > critical_value + tolerance:
+                verdicts[idx] = 'reject'
+            elif t_stat < critical_value - tolerance:
+                verdicts[idx] = 'accept'
+            else:
+                verdicts[idx] = 'exact'
+    if return_statistics:
+        return verdicts, statistics
+    return verdicts
@@ -1,38 +1,61 @@
-import json
+import numpy as np
 import pandas as pd
 
+from price_panel import PricePanel
+
 
 class DataProcessor:
     """
     Module to - 
-    -> obtain data from the local MongoDB or from Yahoo Finance.
+    -> obtain data from the data source (local MongoDB or the local columnar store, see data_sources).
     -> match the dates for both the stocks
     -> combine the data for the 2 stocks
+    -> build the price panel of a group of stocks
     """
-    def __init__(self, mongo_interactor) -> None:
-        self.mongo_interactor = mongo_interactor
+    def __init__(self, data_source) -> None:
+        self.data_source = data_source
+
+    def sort_by_date(self, df):
+        """
+        Sorts the dataframe by date and drops the repeated dates. Returns it along with its dates as int64 (ns since epoch).
+        """
+        if not df['date'].is_monotonic_increasing:
+            df = df.sort_values(by='date', kind='stable')
+        dates = df['date'].values.astype('datetime64[ns]').view('int64')
+        repeated = np.zeros(len(dates), dtype=bool)
+        repeated[1:] = dates[1:] == dates[:-1]
+        if repeated.any():
+            df, dates = df[~repeated], dates[~repeated]
+        return df, dates
 
     def perform_date_matching(self, df_1, df_2):
         """
         This function matches the dates in the 2 dataframes. Dates present in one and absent in the other dataframe are omitted.
+        The dates are joined as sorted int64 arrays (np.intersect1d), so the rows of the returned dataframes are aligned by
+        date - sorted, whatever the order of the input rows.
         """
-        dates_1, dates_2 = df_1['date'], df_2['date']
-        common_dates = list(set.intersection(set(dates_1), set(dates_2)))
-        df_1 = df_1[df_1['date'].isin(common_dates)]
-        df_2 = df_2[df_2['date'].isin(common_dates)]
-        df_1.reset_index(inplace=True, drop=True)
-        df_2.reset_index(inplace=True, drop=True)
+        df_1, dates_1 = self.sort_by_date(df_1)
+        df_2, dates_2 = self.sort_by_date(df_2)
+        _, idx_1, idx_2 = np.intersect1d(dates_1, dates_2, assume_unique=True, return_indices=True)
+        df_1 = df_1.iloc[idx_1].reset_index(drop=True)
+        df_2 = df_2.iloc[idx_2].reset_index(drop=True)
         return df_1, df_2
 
     def get_data(self, stock_1, stock_2, start_date=None, end_date=None):
         """
         This function - 
-        1) Fetches data for the 2 stocks from MongoDB.
+        1) Fetches data for the 2 stocks from the data source.
         2) Performs date matching.
         3) Creates a new single dataframe with relevant data of both the stocks.
         """
-        stock_1_data = self.mongo_interactor.fetch_data(stock_1, start_date, end_date)
-        stock_2_data = self.mongo_interactor.fetch_data(stock_2, start_date, end_date)
+        stock_1_data = self.data_source.fetch_data(stock_1, start_date, end_date)
+        stock_2_data = self.data_source.fetch_data(stock_2, start_date, end_date)
+        return self.combine_data(stock_1_data, stock_2_data)
+
+    def combine_data(self, stock_1_data, stock_2_data):
+        """
+        Matches the dates of the data of the 2 stocks and combines them into the single dataframe returned by get_data.
+        """
         stock_1_data, stock_2_data = self.perform_date_matching(stock_1_data, stock_2_data)
         combined_stock_df = pd.DataFrame()
         combined_stock_df['date'] = stock_1_data['date']
@@ -48,4 +71,10 @@ class DataProcessor:
         combined_stock_df.reset_index(inplace=True, drop=True)
         return combined_stock_df
 
-
+    def build_price_panel(self, stock_list, start_date=None, end_date=None):
+        """
+        Fetches the data for all the stocks in stock_list from the data source in one go and pivots it into a PricePanel.
+        Pair data can then be obtained from the panel without querying the data source again.
+        """
+        data = self.data_source.fetch_sector_data(stock_list, start_date, end_date)
+        return PricePanel.from_records(data, stock_list)
@@ -0,0 +1,153 @@
+import os
+import json
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+
+from utils import MongoInteractor
+
+
+class LocalDataSource:
+    """
+    Local columnar store of the daily data, one file per ticker, laid out like the documents of the SP500 collection.
+    -> file_format 'parquet' : <path>/<ticker>.parquet, read with memory mapping.
+    -> file_format 'arrow' : <path>/<ticker>.arrow (Arrow IPC file), memory-mapped and read without a copy.
+    Exposes the same fetch_data / fetch_sector_data interface as MongoInteractor, so it can be given to DataProcessor.
+    """
+    file_formats = ['parquet', 'arrow']
+
+    def __init__(self, path, file_format='parquet') -> None:
+        if pa == None:
+            raise Exception("pyarrow is required for the local data source.")
+        if not file_format in self.file_formats:
+            raise Exception(f"Unknown file format : {file_format}")
+        self.path = path
+        self.file_format = file_format
+        os.makedirs(self.path, exist_ok=True)
+
+    def get_file_path(self, stock_name):
+        return os.path.join(self.path, f'{stock_name}.{self.file_format}')
+
+    def read_table(self, stock_name, columns=None):
+        """
+        Reads the table of a stock, memory-mapped. Returns None if the stock is not in the store.
+        """
+        file_path = self.get_file_path(stock_name)
+        if not os.path.exists(file_path):
+            return None
+        if self.file_format == 'parquet':
+            return pq.read_table(file_path, columns=columns, memory_map=True)
+        table = ipc.open_file(pa.memory_map(file_path, 'r')).read_all()
+        return table if columns == None else table.select(columns)
+
+    def write_table(self, stock_name, table):
+        file_path = self.get_file_path(stock_name)
+        tmp_path = file_path + '.tmp'
+        if self.file_format == 'parquet':
+            pq.write_table(table, tmp_path)
+        else:
+            with pa.OSFile(tmp_path, 'wb') as sink:
+                with ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        # Readers never see a partially written file.
+        os.replace(tmp_path, file_path)
+        return
+
+    def filter_dates(self, table, start_date=None, end_date=None):
+        date_type = table.schema.field('date').type
+        if not start_date == None:
+            table = table.filter(pc.greater_equal(table['date'], pa.scalar(start_date, type=date_type)))
+        if not end_date == None:
+            table = table.filter(pc.less_equal(table['date'], pa.scalar(end_date, type=date_type)))
+        return table
+
+    def fetch_data(self, stock_name, start_date=None, end_date=None):
+        """
+        Fetch data from the local store for a stock in the start_date - end_date interval.
+        If start_date or end_date are None, all the data available in that direction is fetched.
+        """
+        table = self.read_table(stock_name)
+        if table is None:
+            return pd.DataFrame()
+        return self.filter_dates(table, start_date, end_date).to_pandas()
+
+    def fetch_sector_data(self, stock_list, start_date=None, end_date=None):
+        """
+        Fetch the fields required to build the price panel for all the stocks in stock_list.
+        """
+        columns = ['date', 'underlying', 'open', 'close', 'sector']
+        tables = [self.read_table(stock_name, columns=columns) for stock_name in stock_list]
+        tables = [self.filter_dates(table, start_date, end_date) for table in tables if table is not None]
+        if tables == []:
+            return pd.DataFrame(columns=columns)
+        return pa.concat_tables(tables).to_pandas()
+
+    def get_last_date(self, stock_name):
+        table = self.read_table(stock_name, columns=['date'])
+        if table is None or table.num_rows == 0:
+            return None
+        return pc.max(table['date']).as_py()
+
+    def refresh_from_mongo(self, mongo_interactor, stock_list):
+        """
+        Incrementally fills the store from MongoDB: only the documents after the last date stored for a stock are fetched.
+        Returns {stock: number of new rows}.
+        """
+        new_rows = {}
+        for stock_name in stock_list:
+            last_date = self.get_last_date(stock_name)
+            mongo_query = {'instrument_name': f'EQTSTK_{stock_name}_XXXXXXXXX_XX_0'}
+            if not last_date == None:
+                mongo_query['date'] = {'$gt': last_date}
+            data = pd.DataFrame(mongo_interactor.data_collection.find(mongo_query, {'_id': 0}))
+            new_rows[stock_name] = len(data)
+            if data.empty:
+                continue
+            data.sort_values(by='date', inplace=True)
+            table = pa.Table.from_pandas(data, preserve_index=False)
+            existing_table = self.read_table(stock_name)
+            if existing_table is not None:
+                table = pa.concat_tables([existing_table, table.select(existing_table.schema.names).cast(existing_table.schema)])
+            self.write_table(stock_name, table)
+        return new_rows
+
+
+def create_data_source(config, mongo_interactor=None):
+    """
+    Creates the data source described by config['data_parameters'] -
+    {"source": "mongo" | "local", "local_store": {"path": folder of the local store, "format": "parquet" | "arrow"}}.
+    Defaults to MongoDB (through mongo_interactor) if no data_parameters are given.
+    """
+    data_params = config.get('data_parameters', {})
+    source = data_params.get('source', 'mongo')
+    if source == 'mongo':
+        if mongo_interactor == None:
+            raise Exception("A MongoInteractor is required for the mongo data source.")
+        return mongo_interactor
+    elif source == 'local':
+        return LocalDataSource(data_params['local_store']['path'], file_format=data_params['local_store'].get('format', 'parquet'))
+    raise Exception(f"Unknown data source : {source}")
+
+
+if __name__ == '__main__':
+    # Fills / refreshes the local store from MongoDB for all the stocks in sectors.json.
+    with open('config.json') as jfile:
+        config = json.load(jfile)
+
+    with open('sectors.json') as jfile:
+        sectors_dict = json.load(jfile)
+
+    mongo_interactor = MongoInteractor(config['database_parameters']['mongo'])
+    mongo_interactor.create_connections()
+    store_params = config['data_parameters']['local_store']
+    local_source = LocalDataSource(store_params['path'], file_format=store_params.get('format', 'parquet'))
+    stock_list = [stock for stock_list in sectors_dict.values() for stock in stock_list]
+    new_rows = local_source.refresh_from_mongo(mongo_interactor, stock_list)
+    mongo_interactor.destroy_connections()
+    print(f"Added {sum(new_rows.values())} rows for {len([stock for stock, rows in new_rows.items() if rows > 0])} stocks.")
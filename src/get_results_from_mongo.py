@@ -1,47 +1,160 @@
+import os
+import re
+import argparse
 import pymongo
+import numpy as np
 import pandas as pd
-import datetime as dt
-import os
 
-from collections import defaultdict
+from results import StreamingResultsAggregator, TradeMetricsAccumulator
+from report_writers import write_reports
 
-from results import ResultsCalculator
 
-if __name__ == '__main__':
-    results_config = {
-        "start_date": "2010-01-01",
-        "end_date": "2021-11-12",
-        'capital': 100000000
-    }
+def get_sector_filter(sectors):
+    """
+    Query on the _id (sector|stock_1|stock_2) of the pair documents of the given sectors, all of them if empty.
+    """
+    if not sectors:
+        return {}
+    return {'_id': {'$regex': '^(' + '|'.join(re.escape(sector) for sector in sectors) + r')\|'}}
 
-    simulation_name = 'Iter_3_Inf_Tech'
-    results_path = f'results/{simulation_name}'
-    try:
-        os.makedirs(results_path)
-    except:
-        pass
 
-    results_calc = ResultsCalculator(results_config)
+def get_trades_stages(sectors):
+    """
+    Aggregation stages yielding one document per trade - {sector, trade} - the trades of every pair document (and the
+    pending trades of the pairs run in incremental mode) being unwound.
+    """
+    return [
+        {'$match': get_sector_filter(sectors)},
+        {'$project': {
+            'sector': {'$arrayElemAt': [{'$split': ['$_id', '|']}, 0]},
+            'trade': {'$concatArrays': [{'$ifNull': ['$trades', []]}, {'$ifNull': ['$pending_trades', []]}]}
+        }},
+        {'$unwind': '$trade'}
+    ]
+
+
+def get_summary_pipeline(sectors):
+    """
+    Per sector counts and sums of the trades - the inputs of TradeMetricsAccumulator.add_summary - along with the PnL.
+    """
+    trade_return = '$trade.Trade_Return'
+    is_winner = {'$gt': [trade_return, 0]}
+    return get_trades_stages(sectors) + [
+        {'$group': {
+            '_id': '$sector',
+            'trades': {'$sum': 1},
+            'winners': {'$sum': {'$cond': [is_winner, 1, 0]}},
+            'win_return_sum': {'$sum': {'$cond': [is_winner, trade_return, 0]}},
+            'loss_return_sum': {'$sum': {'$cond': [is_winner, 0, trade_return]}},
+            'return_sum': {'$sum': trade_return},
+            'duration_sum': {'$sum': '$trade.Trade_Duration'},
+            'max_return': {'$max': trade_return},
+            'min_return': {'$min': trade_return},
+            'pnl': {'$sum': '$trade.Trade_PnL'},
+            'stock_pairs': {'$addToSet': '$trade.Stock_Pair'}
+        }}
+    ]
 
-    client = pymongo.MongoClient()
-    collection = client['Stat_Arb'][simulation_name]
 
-    pair_trades_list = list(collection.find())
+def get_mtm_pipeline(sectors):
+    """
+    Daily MtM of the trades summed per sector and day, along with the number of trades open on the day.
+    Handles both the layouts of the MtM - MtM_dict keyed by '%Y-%m-%d' strings and the compact MtM_days / MtM_values lists.
+    """
+    compact = {'$isArray': '$trade.MtM_days'}
+    return get_trades_stages(sectors) + [
+        {'$project': {
+            'sector': 1,
+            'compact': compact,
+            'mtm_values': '$trade.MtM_values',
+            'mtm': {'$cond': [compact, '$trade.MtM_days', {'$objectToArray': '$trade.MtM_dict'}]}
+        }},
+        {'$unwind': {'path': '$mtm', 'includeArrayIndex': 'mtm_idx'}},
+        {'$project': {
+            'sector': 1,
+            'day': {'$cond': ['$compact', '$mtm', '$mtm.k']},
+            'value': {'$cond': ['$compact', {'$arrayElemAt': ['$mtm_values', '$mtm_idx']}, '$mtm.v']}
+        }},
+        {'$group': {'_id': {'sector': '$sector', 'day': '$day'}, 'pnl': {'$sum': '$value'}, 'positions': {'$sum': 1}}}
+    ]
 
-    trades_dict = defaultdict(list)
 
-    for pair_doc in pair_trades_list:
-        sector, stock_1, stock_2 = pair_doc['_id'].split('|')
-        trades_dict[sector].extend(pair_doc['trades'])
+def get_day_numbers(days):
+    """
+    Days since 1970-01-01 of the days of the MtM rollup - ints for the compact layout, '%Y-%m-%d' strings otherwise.
+    """
+    return np.array([day if isinstance(day, (int, np.integer)) else np.datetime64(day, 'D').astype(np.int64) for day in days], dtype=np.int64)
 
-    all_trades_list = []
-    for key, val in trades_dict.items():
-        # results_calc.calculate_results(val, results_path, key)
-        all_trades_list.extend(val)
 
-    results_calc.calculate_results(all_trades_list, results_path, 'Combined')
-    
+def aggregate_results(collection, sectors, results_path, report_format='csv', excel=False, workers=1, combined_name='Combined'):
+    """
+    Builds the Trade_Metrics and MTM reports of every sector and of all of them combined from MongoDB aggregations -
+    the trades are reduced on the server and only the per sector sums and the per sector daily MtM are fetched.
+    Also writes Sector_Summary.csv (pairs, trades and PnL per sector). No tradesheet is written.
+    """
+    accumulators = {}
+    summary_rows = []
+    for summary in collection.aggregate(get_summary_pipeline(sectors), allowDiskUse=True):
+        sector = summary['_id']
+        summary['stock_pairs'] = [stock_pair for stock_pair in summary['stock_pairs'] if not stock_pair == None]
+        for name in [sector, combined_name]:
+            accumulators.setdefault(name, TradeMetricsAccumulator()).add_summary(summary)
+        summary_rows.append({'Sector': sector, 'Stock_Pairs': len(summary['stock_pairs']), 'Trades': summary['trades'], 'PnL': summary['pnl']})
+    if accumulators == {}:
+        raise Exception("Trades List is empty")
 
+    mtm_df = pd.DataFrame([{'sector': row['_id']['sector'], 'day': row['_id']['day'], 'pnl': row['pnl'], 'positions': row['positions']}
+        for row in collection.aggregate(get_mtm_pipeline(sectors), allowDiskUse=True)], columns=['sector', 'day', 'pnl', 'positions'])
+    mtm_df['day'] = get_day_numbers(mtm_df['day'].tolist())
+    for sector, sector_mtm in mtm_df.groupby('sector'):
+        for name in [sector, combined_name]:
+            accumulators[name].daily_mtm.add_mtm(sector_mtm['day'].values, sector_mtm['pnl'].values.astype(np.float64), sector_mtm['positions'].values)
 
+    summary_df = pd.DataFrame(summary_rows).sort_values(by='Sector').reset_index(drop=True)
+    summary_df.to_csv(os.path.join(results_path, 'Sector_Summary.csv'), index=False)
+    report_jobs = [(results_path, report_format, excel, name, accumulator.get_trade_metrics(), accumulator.get_mtm_sheet())
+        for name, accumulator in accumulators.items()]
+    write_reports(report_jobs, workers=workers)
+    return summary_df
 
 
+def stream_results(collection, sectors, results_path, report_format='csv', excel=False, workers=1, batch_size=100):
+    """
+    Builds the complete results, tradesheets included, by streaming the pair documents with a cursor (without their
+    window state) into a StreamingResultsAggregator - the trades are not all held in memory at once.
+    """
+    results_aggregator = StreamingResultsAggregator(results_path, report_format=report_format, excel=excel, workers=workers)
+    cursor = collection.find(get_sector_filter(sectors), {'trades': 1, 'pending_trades': 1}, batch_size=batch_size)
+    for pair_doc in cursor:
+        sector = pair_doc['_id'].split('|')[0]
+        # Trades of the last window of pairs run in incremental mode.
+        results_aggregator.add_trades(sector, pair_doc.get('trades', []) + pair_doc.get('pending_trades', []))
+    if results_aggregator.accumulators == {}:
+        raise Exception("Trades List is empty")
+    results_aggregator.write_results()
+    return
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuilds the results of a simulation from its trades in the strategy collection.")
+    parser.add_argument('simulation_name', help="strategy collection of the simulation")
+    parser.add_argument('--sectors', nargs='*', default=[], help="sectors to include, all of them if not given")
+    parser.add_argument('--tradesheets', action='store_true', help="stream the trades and also write the tradesheets")
+    parser.add_argument('--batch-size', type=int, default=100, help="pair documents per cursor batch when streaming the trades")
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet'], help="format of the tradesheets and MTM series")
+    parser.add_argument('--excel', action='store_true', help="also save the Excel workbooks")
+    parser.add_argument('--workers', type=int, default=1, help="processes writing the reports")
+    parser.add_argument('--strategy-db', default='Stat_Arb')
+    parser.add_argument('--results-path', default='results/')
+    args = parser.parse_args()
+
+    results_path = os.path.join(args.results_path, args.simulation_name)
+    os.makedirs(results_path, exist_ok=True)
+
+    client = pymongo.MongoClient()
+    collection = client[args.strategy_db][args.simulation_name]
+    if args.tradesheets:
+        stream_results(collection, args.sectors, results_path, report_format=args.format, excel=args.excel, workers=args.workers, batch_size=args.batch_size)
+    else:
+        print(aggregate_results(collection, args.sectors, results_path, report_format=args.format, excel=args.excel, workers=args.workers))
+    client.close()
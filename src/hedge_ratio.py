@@ -0,0 +1,105 @@
+import numpy as np
+
+
+def window_sums(values, starts, ends):
+    """
+    Sums of values[start:end] along the first axis for every (start, end) window, using a single cumulative sum.
+    values : (dates,) or (dates x pairs) array.
+    """
+    cumulative = np.concatenate((np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)), axis=0)
+    return cumulative[ends] - cumulative[starts]
+
+
+def _centered_moments(close_1, close_2, starts, ends):
+    """
+    Window means and centered second moments of close_1 (y) and close_2 (x).
+    The series are shifted by their first value before summing to keep the rolling sums well conditioned.
+    """
+    y_ref, x_ref = close_1[:1], close_2[:1]
+    y, x = close_1 - y_ref, close_2 - x_ref
+    n = (ends - starts).astype(float)
+    if close_1.ndim == 2:
+        n = n[:, None]
+    s_x, s_y = window_sums(x, starts, ends), window_sums(y, starts, ends)
+    s_xx, s_yy, s_xy = window_sums(x * x, starts, ends), window_sums(y * y, starts, ends), window_sums(x * y, starts, ends)
+    mean_x, mean_y = s_x / n, s_y / n
+    sxx = s_xx - s_x * mean_x
+    syy = s_yy - s_y * mean_y
+    sxy = s_xy - s_x * mean_y
+    return mean_x + x_ref, mean_y + y_ref, sxx, syy, sxy
+
+
+def ols_hedge_ratios(close_1, close_2, starts, ends):
+    """
+    Ordinary least squares fit of close_1 = intercept + slope * close_2 over every window.
+    """
+    mean_x, mean_y, sxx, _, sxy = _centered_moments(close_1, close_2, starts, ends)
+    slope = sxy / sxx
+    intercept = mean_y - slope * mean_x
+    return slope, intercept
+
+
+def tls_hedge_ratios(close_1, close_2, starts, ends):
+    """
+    Total least squares (orthogonal regression) fit of close_1 = intercept + slope * close_2 over every window.
+    Unlike OLS, the estimate does not depend on which stock is chosen as the dependent variable.
+    """
+    mean_x, mean_y, sxx, syy, sxy = _centered_moments(close_1, close_2, starts, ends)
+    slope = (syy - sxx + np.sqrt((syy - sxx) ** 2 + 4 * sxy ** 2)) / (2 * sxy)
+    intercept = mean_y - slope * mean_x
+    return slope, intercept
+
+
+def kalman_hedge_ratios(close_1, close_2, starts, ends, delta=1e-4, observation_variance=1e-3):
+    """
+    Kalman filter estimate of a time varying slope and intercept, with both following a random walk.
+    The filter runs over the whole series and the state at the last bar of every window is returned, i.e. the
+    estimate uses all the data up to the end of the window.
+    """
+    single_pair = close_1.ndim == 1
+    close_1 = close_1[:, None] if single_pair else close_1
+    close_2 = close_2[:, None] if single_pair else close_2
+    n_dates, n_pairs = close_1.shape
+    state_variance = delta / (1 - delta)
+    beta = np.zeros((n_pairs, 2))
+    covariance = np.zeros((n_pairs, 2, 2))
+    slopes = np.empty((n_dates, n_pairs))
+    intercepts = np.empty((n_dates, n_pairs))
+    for t in range(n_dates):
+        x = np.stack((close_2[t], np.ones(n_pairs)), axis=1)
+        prior = covariance + state_variance * np.eye(2)
+        forecast_error = close_1[t] - np.einsum('pi,pi->p', x, beta)
+        px = np.einsum('pij,pj->pi', prior, x)
+        error_variance = np.einsum('pi,pi->p', x, px) + observation_variance
+        gain = px / error_variance[:, None]
+        beta = beta + gain * forecast_error[:, None]
+        covariance = prior - np.einsum('pi,pj->pij', gain, px)
+        slopes[t], intercepts[t] = beta[:, 0], beta[:, 1]
+    slope, intercept = slopes[ends - 1], intercepts[ends - 1]
+    if single_pair:
+        return slope[:, 0], intercept[:, 0]
+    return slope, intercept
+
+
+hedge_ratio_estimators = {
+    'ols': ols_hedge_ratios,
+    'tls': tls_hedge_ratios,
+    'kalman': kalman_hedge_ratios,
+}
+
+
+def estimate_hedge_ratios(close_1, close_2, starts, ends, method='ols', **kwargs):
+    """
+    Estimates the hedge ratio (slope) and intercept of close_1 against close_2 for all the windows at once.
+    close_1, close_2 : (dates,) arrays for a single pair, or (dates x pairs) arrays for a group of pairs sharing the dates.
+    starts, ends : window boundaries, the window being close[start:end].
+    method : one of hedge_ratio_estimators.
+    Returns the slopes and intercepts as (windows,) or (windows x pairs) arrays.
+    """
+    if not method in hedge_ratio_estimators:
+        raise Exception(f"Unknown hedge ratio method : {method}")
+    close_1 = np.asarray(close_1, dtype=np.float64)
+    close_2 = np.asarray(close_2, dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    return hedge_ratio_estimators[method](close_1, close_2, starts, ends, **kwargs)
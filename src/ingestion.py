@@ -0,0 +1,145 @@
+import os
+import json
+import argparse
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from utils import MongoInteractor, YahooDataFetcher
+
+
+class LocalFixtureFetcher:
+    """
+    Fetcher reading the daily data from local csv files (<path>/<ticker>.csv, in the layout of a Yahoo Finance download :
+    a Date column followed by Open, High, Low, Close, Adj Close and Volume). Used to run the ingestion offline.
+    Has the fetch_data interface of YahooDataFetcher; the end_date is exclusive, as in a download.
+    """
+    def __init__(self, path) -> None:
+        self.path = path
+
+    def fetch_data(self, stock_name, start_date=None, end_date=None, period='1D'):
+        file_path = os.path.join(self.path, f'{stock_name}.csv')
+        if not os.path.exists(file_path):
+            return pd.DataFrame()
+        data = pd.read_csv(file_path, index_col='Date', parse_dates=['Date'])
+        if not start_date == None:
+            data = data[data.index >= pd.Timestamp(start_date)]
+        if not end_date == None:
+            data = data[data.index < pd.Timestamp(end_date)]
+        return data
+
+
+fetchers = {
+    'yahoo': lambda ingestion_params: YahooDataFetcher(),
+    'local': lambda ingestion_params: LocalFixtureFetcher(ingestion_params['fixture_path']),
+}
+
+
+def create_fetcher(ingestion_params):
+    fetcher = ingestion_params.get('fetcher', 'yahoo')
+    if not fetcher in fetchers:
+        raise Exception(f"Unknown fetcher : {fetcher}")
+    return fetchers[fetcher](ingestion_params)
+
+
+class IngestionPipeline:
+    """
+    Downloads the daily data of a universe and writes it to the data collection.
+    -> fetcher : object with the fetch_data / format_data interface of YahooDataFetcher (format_data defaults to YahooDataFetcher's).
+    -> workers : number of tickers fetched concurrently. At most 2 x workers downloads are in flight or waiting to be written.
+    -> checkpoint_path : json file recording the tickers already written for the date range, so that an interrupted run
+       resumes with the remaining ones. The documents are upserted on _id, so writing a ticker again is harmless.
+    """
+    def __init__(self, fetcher, mongo_interactor, workers=4, checkpoint_path=None) -> None:
+        self.fetcher = fetcher
+        self.formatter = fetcher if hasattr(fetcher, 'format_data') else YahooDataFetcher()
+        self.mongo_interactor = mongo_interactor
+        self.workers = workers
+        self.checkpoint_path = checkpoint_path
+
+    def load_checkpoint(self, start_date, end_date):
+        """
+        Tickers completed by a previous run over the same date range.
+        """
+        if self.checkpoint_path == None or not os.path.exists(self.checkpoint_path):
+            return set()
+        with open(self.checkpoint_path) as jfile:
+            checkpoint = json.load(jfile)
+        if not (checkpoint['start_date'], checkpoint['end_date']) == (str(start_date), str(end_date)):
+            return set()
+        return set(checkpoint['completed'])
+
+    def save_checkpoint(self, start_date, end_date, completed):
+        if self.checkpoint_path == None:
+            return
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as jfile:
+            json.dump({'start_date': str(start_date), 'end_date': str(end_date), 'completed': sorted(completed)}, jfile)
+        os.replace(tmp_path, self.checkpoint_path)
+        return
+
+    def fetch(self, sector, stock, start_date, end_date):
+        data = self.fetcher.fetch_data(stock, start_date, end_date, period='1D')
+        return self.formatter.format_data(stock, sector, data)
+
+    def run(self, sectors_dict, start_date, end_date):
+        """
+        Ingests every ticker of sectors_dict not completed yet. Returns the list of (sector, stock) that failed.
+        """
+        completed = self.load_checkpoint(start_date, end_date)
+        tasks = [(sector, stock) for sector, stock_list in sectors_dict.items() for stock in stock_list if not f'{sector}|{stock}' in completed]
+        print(f"{len(completed)} tickers already ingested, {len(tasks)} to go.")
+        issue_list = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {}
+            tasks = iter(tasks)
+            while True:
+                # Keep the number of downloads held in memory bounded.
+                for sector, stock in tasks:
+                    pending[executor.submit(self.fetch, sector, stock, start_date, end_date)] = (sector, stock)
+                    if len(pending) >= 2 * self.workers:
+                        break
+                if pending == {}:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    sector, stock = pending.pop(future)
+                    try:
+                        documents = self.mongo_interactor.upsert_data(future.result())
+                        completed.add(f'{sector}|{stock}')
+                        self.save_checkpoint(start_date, end_date, completed)
+                        print(f"Done with : {sector} | {stock} ({documents} documents written)")
+                    except Exception as error:
+                        print(error, f"{sector} | {stock}")
+                        issue_list.append((sector, stock))
+        return issue_list
+
+
+def update_database(config_dict, sectors_dict, start_date, end_date, fetcher=None, workers=4, checkpoint_path=None):
+    """
+    Downloads the data of all the stocks in sectors_dict (from Yahoo Finance unless another fetcher is given) and upserts
+    it in the data collection.
+    """
+    mongo_db = MongoInteractor(config_dict)
+    mongo_db.create_connections()
+    pipeline = IngestionPipeline(YahooDataFetcher() if fetcher == None else fetcher, mongo_db, workers=workers, checkpoint_path=checkpoint_path)
+    issue_list = pipeline.run(sectors_dict, start_date, end_date)
+    mongo_db.destroy_connections()
+    print(issue_list)
+    return issue_list
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingests the daily data of the stocks in sectors.json into the data collection.")
+    parser.add_argument('--start_date', default="2021-11-13")
+    parser.add_argument('--end_date', default="2023-12-01")
+    args = parser.parse_args()
+
+    with open('config.json') as jfile:
+        config = json.load(jfile)
+
+    with open('sectors.json') as jfile:
+        sectors_dict = json.load(jfile)
+
+    ingestion_params = config.get('ingestion_parameters', {})
+    update_database(config['database_parameters']['mongo'], sectors_dict, args.start_date, args.end_date, fetcher=create_fetcher(ingestion_params),
+        workers=ingestion_params.get('workers', 4), checkpoint_path=ingestion_params.get('checkpoint_path'))
@@ -0,0 +1,350 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from itertools import combinations
+
+from data_processor import DataProcessor
+from data_sources import create_data_source
+from hedge_ratio import estimate_hedge_ratios
+from pair_selection import select_pairs, load_formation_panel
+from utils import MongoInteractor, get_date_range
+
+
+class PanelBarSource:
+    """
+    Replayable source of daily bars read from a PricePanel (see DataProcessor.build_price_panel), e.g. of the local store.
+    bars() yields (date, close) for every date of the panel in order, close being the closes of all the tickers of the
+    panel (NaN for the tickers without a record on the date). It can be replayed any number of times, from any date.
+    """
+    def __init__(self, price_panel) -> None:
+        self.price_panel = price_panel
+        self.tickers = price_panel.tickers
+
+    def bars(self, start_date=None, end_date=None):
+        dates = self.price_panel.dates
+        first = 0 if start_date == None else np.searchsorted(dates, np.datetime64(start_date, 'ns'))
+        last = len(dates) if end_date == None else np.searchsorted(dates, np.datetime64(end_date, 'ns'), side='right')
+        for row in range(first, last):
+            yield dates[row], np.where(self.price_panel.present[row], self.price_panel.close[row], np.nan)
+
+
+class LiveSignalEngine:
+    """
+    Online version of Strategy.calculate_signals / generate_trades for many pairs at once. Every bar pushed updates the
+    state of all the pairs with a fixed number of array operations, whatever the mean period.
+    -> stock_pairs : (stock_1, stock_2) pairs, the spread being close_1 - hedge_ratio * close_2.
+    -> tickers : tickers of the close vectors pushed (see PanelBarSource).
+    -> mean_period, std_factors : as in signals.SignalSet ({band number: std factor}).
+    -> history_length : number of bars kept per pair (at least mean_period) - the hedge ratios are fitted on them.
+    Per pair, the closes of the last bars are kept in ring buffers and the rolling mean / standard deviation of the spread
+    under the current hedge ratio are updated with Welford's running sums (value in, value out), recomputed exactly from
+    the buffers every mean_period bars so that rounding errors do not build up. A pair is only updated on the bars on which
+    both its stocks have a close, as the dates of a pair are matched in the backtest.
+    The events (band breach / backtrack, mean breach) are those of calculate_signals, and the orders those of the state
+    machine of generate_trades - entries and exits at the next open.
+    """
+    def __init__(self, stock_pairs, tickers, mean_period, std_factors, history_length=None, entry='backtrack', capital_per_trade=10000) -> None:
+        ticker_index = {ticker: idx for idx, ticker in enumerate(tickers)}
+        self.stock_pairs = [tuple(stock_pair) for stock_pair in stock_pairs]
+        self.tickers = list(tickers)
+        self.mean_period = mean_period
+        self.std_factors = {int(band): std_factor for band, std_factor in std_factors.items()}
+        self.history_length = max(mean_period, mean_period if history_length == None else history_length)
+        self.entry = entry
+        self.capital_per_trade = capital_per_trade
+        n_pairs = len(self.stock_pairs)
+        self.ticker_idx_1 = np.array([ticker_index[stock_1] for stock_1, _ in self.stock_pairs], dtype=np.int64)
+        self.ticker_idx_2 = np.array([ticker_index[stock_2] for _, stock_2 in self.stock_pairs], dtype=np.int64)
+        self.close_1 = np.full((n_pairs, self.history_length), np.nan)
+        self.close_2 = np.full((n_pairs, self.history_length), np.nan)
+        # Position of the next bar in the ring buffers, and the number of bars pushed.
+        self.heads = np.zeros(n_pairs, dtype=np.int64)
+        self.bar_counts = np.zeros(n_pairs, dtype=np.int64)
+        self.hedge_ratios = np.full(n_pairs, np.nan)
+        # Rolling statistics of the spread over the last mean_period bars (Welford's mean and sum of squared deviations).
+        self.means = np.full(n_pairs, np.nan)
+        self.m2s = np.full(n_pairs, np.nan)
+        self.last_spreads = np.full(n_pairs, np.nan)
+        # 1 = Long the spread, -1 = Short, 0 = flat.
+        self.positions = np.zeros(n_pairs, dtype=np.int64)
+
+    def get_window_values(self, pairs, length):
+        """
+        Closes of the last `length` bars of the pairs, oldest first, as (pairs x length) arrays.
+        """
+        columns = (self.heads[pairs, None] - length + np.arange(length)[None, :]) % self.history_length
+        return np.take_along_axis(self.close_1[pairs], columns, axis=1), np.take_along_axis(self.close_2[pairs], columns, axis=1)
+
+    def recompute_statistics(self, pairs):
+        """
+        Exact mean and sum of squared deviations of the spread of the pairs over their last mean_period bars.
+        """
+        if len(pairs) == 0:
+            return
+        close_1, close_2 = self.get_window_values(pairs, self.mean_period)
+        spreads = close_1 - self.hedge_ratios[pairs, None] * close_2
+        # Only the bars pushed count while the pair has less than mean_period bars.
+        valid = np.arange(self.mean_period)[None, :] >= self.mean_period - np.minimum(self.bar_counts[pairs], self.mean_period)[:, None]
+        counts = valid.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(valid, spreads, 0).sum(axis=1) / counts
+            self.m2s[pairs] = np.where(valid, (spreads - means[:, None]) ** 2, 0).sum(axis=1)
+        self.means[pairs] = means
+        self.last_spreads[pairs] = np.where(counts > 0, spreads[:, -1], np.nan)
+        return
+
+    def get_statistics(self, pairs):
+        """
+        Rolling mean and standard deviation (NaN until mean_period bars have been pushed, as with pandas rolling).
+        """
+        full = self.bar_counts[pairs] >= self.mean_period
+        with np.errstate(invalid='ignore'):
+            std = np.sqrt(np.maximum(self.m2s[pairs], 0) / (self.mean_period - 1))
+        return np.where(full, self.means[pairs], np.nan), np.where(full, std, np.nan)
+
+    def set_hedge_ratios(self, pairs, hedge_ratios, flatten=True):
+        """
+        Sets the hedge ratio of the pairs, as at the start of a new walk-forward window - the statistics of the spread are
+        recomputed from the buffered closes under the new hedge ratio and, with flatten, the pairs start flat.
+        Returns the pairs whose open position was dropped without an exit order - close them first with close_positions.
+        """
+        pairs = np.asarray(pairs, dtype=np.int64)
+        self.hedge_ratios[pairs] = hedge_ratios
+        self.recompute_statistics(pairs)
+        dropped = pairs[self.positions[pairs] != 0] if flatten else pairs[:0]
+        if flatten:
+            self.positions[pairs] = 0
+        return dropped
+
+    def fit_hedge_ratios(self, pairs, train_period, method='ols', flatten=True):
+        """
+        Fits the hedge ratios of the pairs on their last train_period bars (see hedge_ratio.estimate_hedge_ratios) and
+        sets them. Pairs with less than train_period bars get no hedge ratio (and no signals).
+        """
+        pairs = np.asarray(pairs, dtype=np.int64)
+        train_period = min(train_period, self.history_length)
+        close_1, close_2 = self.get_window_values(pairs, train_period)
+        hedge_ratios = np.full(len(pairs), np.nan)
+        ready = self.bar_counts[pairs] >= train_period
+        if ready.any():
+            slopes, _ = estimate_hedge_ratios(close_1[ready].T, close_2[ready].T, [0], [train_period], method=method)
+            hedge_ratios[ready] = slopes[0]
+        return self.set_hedge_ratios(pairs, hedge_ratios, flatten=flatten)
+
+    def close_positions(self, date, pairs, reason):
+        """
+        Exit orders, to execute at the next open, for the open positions of the pairs (e.g. before their hedge ratio is
+        refitted), which are then flat.
+        """
+        pairs = np.asarray(pairs, dtype=np.int64)
+        pairs = pairs[self.positions[pairs] != 0]
+        orders = [self.create_order(date, pair, 'Exit', self.positions[pair], reason=reason) for pair in pairs]
+        self.positions[pairs] = 0
+        return orders
+
+    def flatten(self, pairs):
+        """
+        Drops the open positions of the pairs (e.g. when an entry could not be filled at the open). Returns the pairs that had one.
+        """
+        pairs = np.asarray(pairs, dtype=np.int64)
+        dropped = pairs[self.positions[pairs] != 0]
+        self.positions[pairs] = 0
+        return dropped
+
+    def push_bar(self, date, close, trade=True):
+        """
+        Updates the pairs with the closes of a bar (closes of all the tickers, NaN if missing).
+        trade : bool or per pair bool array - pairs not trading only update their statistics (no entries / exits).
+        Returns the events of the bar ({signal: per pair bool array}, False for the pairs not updated) and the orders
+        to execute at the next open.
+        """
+        close = np.asarray(close, dtype=np.float64)
+        price_1, price_2 = close[self.ticker_idx_1], close[self.ticker_idx_2]
+        pairs = np.flatnonzero(np.isfinite(price_1) & np.isfinite(price_2))
+        price_1, price_2 = price_1[pairs], price_2[pairs]
+        prev_mean, prev_std = self.get_statistics(pairs)
+        prev_spread = self.last_spreads[pairs]
+        hedge_ratio = self.hedge_ratios[pairs]
+
+        # Welford update of the running sums : the oldest spread leaves the window once it is full.
+        spread = price_1 - hedge_ratio * price_2
+        full = np.minimum(self.bar_counts[pairs], self.mean_period) == self.mean_period
+        oldest = (self.heads[pairs] - self.mean_period) % self.history_length
+        old_spread = self.close_1[pairs, oldest] - hedge_ratio * self.close_2[pairs, oldest]
+        counts = np.minimum(self.bar_counts[pairs] + 1, self.mean_period)
+        means, m2s = self.means[pairs], self.m2s[pairs]
+        means, m2s = np.where(counts == 1, 0.0, means), np.where(counts == 1, 0.0, m2s)
+        delta = np.where(full, spread - old_spread, spread - means)
+        new_means = means + delta / counts
+        self.m2s[pairs] = m2s + np.where(full, delta * (spread - new_means + old_spread - means), delta * (spread - new_means))
+        self.means[pairs] = new_means
+        self.last_spreads[pairs] = spread
+        self.close_1[pairs, self.heads[pairs]] = price_1
+        self.close_2[pairs, self.heads[pairs]] = price_2
+        self.heads[pairs] = (self.heads[pairs] + 1) % self.history_length
+        self.bar_counts[pairs] += 1
+        # Exact recomputation every mean_period bars.
+        self.recompute_statistics(pairs[self.bar_counts[pairs] % self.mean_period == 0])
+        mean, std = self.get_statistics(pairs)
+
+        events = self.get_events(spread, mean, std, prev_spread, prev_mean, prev_std)
+        trade = np.broadcast_to(np.asarray(trade, dtype=bool), (len(self.stock_pairs),))[pairs]
+        orders = self.update_positions(date, pairs, events, trade)
+        all_events = {}
+        for signal, values in events.items():
+            all_events[signal] = np.zeros(len(self.stock_pairs), dtype=bool)
+            all_events[signal][pairs] = values
+        return all_events, orders
+
+    def get_events(self, spread, mean, std, prev_spread, prev_mean, prev_std):
+        """
+        Signals of calculate_signals on the current bar - a comparison with NaN (not enough bars) is no signal.
+        """
+        events = {}
+        with np.errstate(invalid='ignore'):
+            for band, std_factor in self.std_factors.items():
+                upper, prev_upper = mean + std_factor * std, prev_mean + std_factor * prev_std
+                lower, prev_lower = mean - std_factor * std, prev_mean - std_factor * prev_std
+                events[f'upper_band_breach_{band}'] = (spread >= upper) & (prev_spread < prev_upper)
+                events[f'upper_band_backtrack_{band}'] = (spread < upper) & (prev_spread >= prev_upper)
+                events[f'lower_band_breach_{band}'] = (spread <= lower) & (prev_spread > prev_lower)
+                events[f'lower_band_backtrack_{band}'] = (spread > lower) & (prev_spread <= prev_lower)
+            events['mean_breach_from_above'] = spread <= mean
+            events['mean_breach_from_below'] = spread >= mean
+        return events
+
+    def create_order(self, date, pair, action, position, reason=None):
+        """
+        Entry or exit order of a pair. The quantities of an entry depend on the next open, so the capital of each leg is
+        given instead. Exits carry their reason - 'Mean_Breach', 'Expired' (end of the test period) or 'Refit'.
+        """
+        stock_1, stock_2 = self.stock_pairs[pair]
+        order = {'Date': pd.Timestamp(date), 'Stock_Pair': f'{stock_1}|{stock_2}', 'Action': action, 'Position': 'Long' if position == 1 else 'Short',
+            'Hedge_Ratio': float(self.hedge_ratios[pair])}
+        order['Long_Stock'], order['Short_Stock'] = (stock_1, stock_2) if position == 1 else (stock_2, stock_1)
+        if action == 'Entry':
+            # Split the capital based on the hedge_ratio.
+            capital_stock_1 = self.capital_per_trade / (abs(self.hedge_ratios[pair]) + 1)
+            capital_stock_2 = self.capital_per_trade - capital_stock_1
+            order['Long_Capital'], order['Short_Capital'] = (float(capital_stock_1), float(capital_stock_2)) if position == 1 else (float(capital_stock_2), float(capital_stock_1))
+        else:
+            order['Reason'] = reason
+        return order
+
+    def update_positions(self, date, pairs, events, trade):
+        """
+        State machine of generate_trades on the current bar. Returns the entry and exit orders, to execute at the next open.
+        The open positions of the pairs that are no longer trading (their test period is over) are exited.
+        """
+        positions = self.positions[pairs]
+        exits = trade & (((positions == 1) & events['mean_breach_from_below']) | ((positions == -1) & events['mean_breach_from_above']))
+        expired = ~trade & (positions != 0)
+        long_entries = trade & (positions == 0) & events[f'lower_band_{self.entry}_1']
+        short_entries = trade & (positions == 0) & ~long_entries & events[f'upper_band_{self.entry}_1']
+        orders = []
+        for idx in np.flatnonzero(exits | expired | long_entries | short_entries):
+            if exits[idx] or expired[idx]:
+                orders.append(self.create_order(date, pairs[idx], 'Exit', positions[idx], reason='Mean_Breach' if exits[idx] else 'Expired'))
+            else:
+                orders.append(self.create_order(date, pairs[idx], 'Entry', 1 if long_entries[idx] else -1))
+        self.positions[pairs[exits | expired]] = 0
+        self.positions[pairs[long_entries]] = 1
+        self.positions[pairs[short_entries]] = -1
+        return orders
+
+    state_arrays = ['close_1', 'close_2', 'heads', 'bar_counts', 'hedge_ratios', 'means', 'm2s', 'last_spreads', 'positions']
+
+    def save_checkpoint(self, path):
+        """
+        Saves the state of the engine (parameters, ring buffers, running sums and positions) to an npz file.
+        """
+        meta = {'stock_pairs': self.stock_pairs, 'tickers': self.tickers, 'mean_period': self.mean_period, 'std_factors': self.std_factors,
+            'history_length': self.history_length, 'entry': self.entry, 'capital_per_trade': self.capital_per_trade}
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, meta=np.array(json.dumps(meta)), **{name: getattr(self, name) for name in self.state_arrays})
+        os.replace(tmp_path, path)
+        return
+
+    @classmethod
+    def load_checkpoint(cls, path):
+        with np.load(path) as checkpoint:
+            meta = json.loads(str(checkpoint['meta']))
+            engine = cls(meta['stock_pairs'], meta['tickers'], meta['mean_period'], meta['std_factors'], history_length=meta['history_length'],
+                entry=meta['entry'], capital_per_trade=meta['capital_per_trade'])
+            for name in cls.state_arrays:
+                setattr(engine, name, checkpoint[name].copy())
+        return engine
+
+
+def run_live_replay(engine, bar_source, train_period, test_period, method='ols', start_date=None, end_date=None):
+    """
+    Replays the bars of bar_source through the engine on the walk-forward schedule of the backtest - every train_period
+    bars of a pair its hedge ratio is refitted on the last train_period bars and the pair trades the next test_period bars.
+    Unlike the backtest, no ADF test gates the windows (it is run on the whole window, test period included).
+    Positions still open when the test period of a pair ends, or when its hedge ratio is refitted, are exited rather than
+    dropped (the backtest does not trade them).
+    Returns the orders and the time taken by every bar.
+    """
+    all_orders, bar_times = [], []
+    for date, close in bar_source.bars(start_date=start_date, end_date=end_date):
+        start = time.perf_counter()
+        refit = np.flatnonzero((engine.bar_counts >= train_period) & (engine.bar_counts % train_period == 0))
+        if len(refit) > 0:
+            all_orders.extend(engine.close_positions(date, refit, 'Refit'))
+            engine.fit_hedge_ratios(refit, train_period, method=method)
+        trade = (engine.bar_counts >= train_period) & (engine.bar_counts % train_period < test_period)
+        _, orders = engine.push_bar(date, close, trade=trade)
+        bar_times.append(time.perf_counter() - start)
+        all_orders.extend(orders)
+    return all_orders, np.array(bar_times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replays the bars of the data source through the live signal engine and prints the next open orders.")
+    parser.add_argument('--checkpoint', default=None, help="engine checkpoint to resume from and to save to")
+    parser.add_argument('--start-date', default=None, help="first bar replayed (the bars before it are skipped)")
+    parser.add_argument('--end-date', default=None, help="last bar replayed")
+    args = parser.parse_args()
+
+    with open('config.json') as jfile:
+        config = json.load(jfile)
+    with open('sectors.json') as jfile:
+        sectors_dict = json.load(jfile)
+    if not config['sectors'] == ['All']:
+        sectors_dict = {key: val for key, val in sectors_dict.items() if key in config['sectors']}
+    strategy_params = config['strategy_parameters']
+
+    mongo_interactor = MongoInteractor(config['database_parameters']['mongo'])
+    mongo_interactor.create_connections()
+    data_processor = DataProcessor(create_data_source(config, mongo_interactor))
+    universe = list(dict.fromkeys(stock for stock_list in sectors_dict.values() for stock in stock_list))
+    start_date, end_date = get_date_range(config['date_parameters'])
+    price_panel = data_processor.build_price_panel(universe, start_date=start_date, end_date=end_date)
+    bar_source = PanelBarSource(price_panel)
+
+    if not args.checkpoint == None and os.path.exists(args.checkpoint):
+        engine = LiveSignalEngine.load_checkpoint(args.checkpoint)
+    else:
+        selection_params = config.get('pair_selection_parameters', {})
+        # The pairs are selected on the formation period before the bars replayed.
+        formation_panel = load_formation_panel(data_processor, universe, start_date, selection_params) if selection_params.get('enabled', False) else None
+        stock_pairs = []
+        for sector, stock_list in sectors_dict.items():
+            stock_list = [stock for stock in stock_list if stock in price_panel.ticker_index]
+            stock_pairs.extend(select_pairs(formation_panel, sector, stock_list, selection_params) if selection_params.get('enabled', False) else combinations(stock_list, 2))
+        engine = LiveSignalEngine(stock_pairs, price_panel.tickers, strategy_params['mean_period'], {1: strategy_params['std_factor_1'], 2: strategy_params['std_factor_2']},
+            history_length=strategy_params['train_period'], capital_per_trade=config['capital_parameters']['capital_per_trade'])
+    mongo_interactor.destroy_connections()
+
+    orders, bar_times = run_live_replay(engine, bar_source, strategy_params['train_period'], strategy_params['test_period'],
+        method=strategy_params.get('hedge_ratio_method', 'ols'), start_date=args.start_date, end_date=args.end_date)
+    if not args.checkpoint == None:
+        engine.save_checkpoint(args.checkpoint)
+    print(f"{len(engine.stock_pairs)} pairs, {len(bar_times)} bars, {len(orders)} orders - "
+          f"{1000 * bar_times.mean() if len(bar_times) > 0 else 0:.3f} ms per bar (max {1000 * bar_times.max() if len(bar_times) > 0 else 0:.3f} ms).")
+    for order in orders[-10:]:
+        print(order)
@@ -0,0 +1,112 @@
+import time
+import datetime as dt
+import numpy as np
+from itertools import combinations
+from scipy.cluster.hierarchy import linkage, fcluster
+from scipy.spatial.distance import squareform
+
+
+def get_pairwise_sums(values):
+    """
+    Sums over the dates on which both the stocks have a value, for every pair of columns of values (dates x stocks, NaN if
+    missing), as (stocks x stocks) matrices - count, sum of x, sum of x^2 (x being the row stock) and sum of x * y.
+    """
+    present = (~np.isnan(values)).astype(np.float64)
+    filled = np.where(present > 0, values, 0.0)
+    count = present.T @ present
+    sum_x = filled.T @ present
+    sum_xx = (filled * filled).T @ present
+    sum_xy = filled.T @ filled
+    return count, sum_x, sum_xx, sum_xy
+
+
+def correlation_scores(close):
+    """
+    Correlation of the daily returns of every pair of stocks, over the dates on which both have a return.
+    """
+    returns = close[1:] / close[:-1] - 1
+    count, sum_x, sum_xx, sum_xy = get_pairwise_sums(returns)
+    covariance = count * sum_xy - sum_x * sum_x.T
+    variance = count * sum_xx - sum_x * sum_x
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return covariance / np.sqrt(variance * variance.T)
+
+
+def distance_scores(close):
+    """
+    Negative mean squared distance between the normalized prices (price / first price) of every pair of stocks.
+    """
+    first_idx = np.argmax(~np.isnan(close), axis=0)
+    normalized = close / close[first_idx, np.arange(close.shape[1])]
+    count, _, sum_xx, sum_xy = get_pairwise_sums(normalized)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return -(sum_xx + sum_xx.T - 2 * sum_xy) / count
+
+
+def cluster_scores(close, clusters=10):
+    """
+    Correlation scores of the pairs whose stocks fall in the same cluster of a hierarchical clustering
+    (average linkage on 1 - correlation of returns); -inf for the other pairs. With at least as many clusters as stocks,
+    the correlation scores of all the pairs.
+    """
+    correlation = correlation_scores(close)
+    if close.shape[1] < 3 or clusters >= close.shape[1]:
+        # Every stock would be a cluster of its own - the pairs are ranked on their correlation alone.
+        return correlation
+    distance = 1 - np.nan_to_num(correlation, nan=0.0)
+    np.fill_diagonal(distance, 0)
+    labels = fcluster(linkage(squareform(np.clip((distance + distance.T) / 2, 0, None), checks=False), method='average'), t=clusters, criterion='maxclust')
+    return np.where(labels[:, None] == labels[None, :], correlation, -np.inf)
+
+
+score_functions = {
+    'correlation': correlation_scores,
+    'distance': distance_scores,
+    'cluster': cluster_scores,
+}
+
+
+def get_formation_range(start_date, selection_params):
+    """
+    First and last dates of the formation period the pairs are scored on - the formation_days (calendar days) before the
+    start of the backtest, so that the selection does not look at the data it is backtested on.
+    """
+    if start_date == None:
+        raise Exception("Pair selection requires a start_date : the pairs are scored on the formation period before it.")
+    return start_date - dt.timedelta(days=selection_params.get('formation_days', 365)), start_date - dt.timedelta(days=1)
+
+
+def load_formation_panel(data_processor, stock_list, start_date, selection_params):
+    """
+    Price panel of the stocks over the formation period before start_date (see get_formation_range).
+    """
+    formation_start, formation_end = get_formation_range(start_date, selection_params)
+    return data_processor.build_price_panel(stock_list, start_date=formation_start, end_date=formation_end)
+
+
+def select_pairs(price_panel, sector, stock_list, selection_params):
+    """
+    Ranks all the pairs of stock_list on the scores of selection_params['method'] (correlation of returns, distance of
+    normalized prices or clustering), computed as matrix operations on the price panel, and keeps the top_k of them.
+    The panel is that of the formation period (see load_formation_panel), before the backtest.
+    Pairs with stocks missing from the panel or without a score are dropped.
+    Returns the kept pairs in the order of combinations(stock_list, 2).
+    """
+    start = time.perf_counter()
+    method = selection_params.get('method', 'correlation')
+    if not method in score_functions:
+        raise Exception(f"Unknown pair selection method : {method}")
+    stocks = [stock for stock in stock_list if stock in price_panel.ticker_index]
+    close = price_panel.close[:, [price_panel.ticker_index[stock] for stock in stocks]]
+    kwargs = {'clusters': selection_params['clusters']} if method == 'cluster' and 'clusters' in selection_params else {}
+    scores = score_functions[method](close, **kwargs)
+
+    stock_index = {stock: idx for idx, stock in enumerate(stocks)}
+    all_pairs = list(combinations(stock_list, 2))
+    pair_scores = np.array([scores[stock_index[stock_1], stock_index[stock_2]] if stock_1 in stock_index and stock_2 in stock_index else np.nan for stock_1, stock_2 in all_pairs])
+    valid = np.flatnonzero(np.isfinite(pair_scores))
+    top_k = selection_params.get('top_k')
+    ranked = valid[np.argsort(-pair_scores[valid], kind='stable')]
+    kept = np.sort(ranked if top_k == None else ranked[:top_k])
+    print(f"{sector} : {method} pair selection kept {len(kept)} of {len(all_pairs)} pairs in {time.perf_counter() - start:.3f}s.")
+    return [all_pairs[idx] for idx in kept]
@@ -0,0 +1,123 @@
+import json
+import os
+import pandas as pd
+import numpy as np
+
+from itertools import product
+from multiprocessing import Pool
+
+from strategy import Strategy
+from results import ResultsCalculator
+from scheduler import create_pair_chunks
+from simulator import simulate_trades
+
+
+def shift(values):
+    """
+    values shifted down by one row (first row NaN), like pandas' shift(1).
+    """
+    return np.concatenate((np.full((1,) + values.shape[1:], np.nan), values[:-1]), axis=0)
+
+
+def sweep_window(stock_df, test_period, mean_periods, std_factors, capital_per_trade, sector_name):
+    """
+    Trades the test period of a split for every (mean_period, std_factor_1) combination.
+    The rolling mean/std are computed once per mean_period and the bands of all the std factors are evaluated together
+    as (dates x factors) arrays, with the same arithmetic as Strategy.calculate_signals.
+    Returns {(mean_period, std_factor_1): trades_list}.
+    """
+    spread = stock_df['price_spread']
+    spread_values = spread.values[:, None]
+    factors = np.asarray(std_factors, dtype=np.float64)[None, :]
+    test_data = {column: stock_df[column].values[-test_period:] for column in ['date', 'next_date', 'underlying_1', 'underlying_2', 'close_1', 'close_2', 'next_open_1', 'next_open_2', 'hedge_ratio']}
+    sweep_trades = {}
+    for mean_period in mean_periods:
+        mean = spread.rolling(window=mean_period).mean().values
+        std = spread.rolling(window=mean_period).std().values
+        upper_band = mean[:, None] + factors * std[:, None]
+        lower_band = mean[:, None] - factors * std[:, None]
+        upper_band_backtrack = (spread_values < upper_band) & (shift(spread_values) >= shift(upper_band))
+        lower_band_backtrack = (spread_values > lower_band) & (shift(spread_values) <= shift(lower_band))
+        test_data['mean_breach_from_above'] = (spread.values <= mean)[-test_period:]
+        test_data['mean_breach_from_below'] = (spread.values >= mean)[-test_period:]
+        for factor_idx, std_factor in enumerate(std_factors):
+            test_data['upper_band_backtrack_1'] = upper_band_backtrack[-test_period:, factor_idx]
+            test_data['lower_band_backtrack_1'] = lower_band_backtrack[-test_period:, factor_idx]
+            sweep_trades[(mean_period, std_factor)] = simulate_trades(test_data, capital_per_trade, sector_name)
+    return sweep_trades
+
+
+def run_sweep_for_pairs(config, sector, stock_pairs, mean_periods, std_factors):
+    """
+    Runs the parameter sweep for a chunk of stock pairs of a given sector.
+    The hedge ratios and ADF tests of every split are computed once per pair and reused for the whole grid.
+    Returns {(mean_period, std_factor_1): list of trade summaries}.
+    """
+    stock_list = list(dict.fromkeys(stock for stock_pair in stock_pairs for stock in stock_pair))
+    strat = Strategy(config, sector, stock_list)
+    start_date, end_date = strat.get_date_range()
+    strat.price_panel = strat.data_processor.build_price_panel(stock_list, start_date=start_date, end_date=end_date)
+    train_period = config['strategy_parameters']['train_period']
+    test_period = config['strategy_parameters']['test_period']
+    capital_per_trade = config['capital_parameters']['capital_per_trade']
+    summary_columns = ['Trade_Return', 'Trade_PnL', 'Trade_Duration', 'Stock_Pair']
+    sweep_results = {combination: [] for combination in product(mean_periods, std_factors)}
+    for stock_1, stock_2 in stock_pairs:
+        for stock_df in strat.prepare_pair_windows(stock_1, stock_2, train_period, test_period):
+            for combination, trades in sweep_window(stock_df, test_period, mean_periods, std_factors, capital_per_trade, sector).items():
+                sweep_results[combination].extend({column: trade[column] for column in summary_columns} for trade in trades)
+    strat.destroy_connections()
+    return sweep_results
+
+
+def get_sweep_metrics(sweep_results, std_factors_2, results_calculator):
+    """
+    Builds the metrics table, one row per parameter set.
+    std_factor_2 does not affect the trades (the band 2 signals are not traded), so the rows only differ in that column.
+    """
+    rows = []
+    for (mean_period, std_factor_1), trades in sweep_results.items():
+        if trades == []:
+            trade_metrics = {'Trades': 0}
+        else:
+            trades_df = pd.DataFrame(trades)
+            trade_metrics = results_calculator.get_trade_metrics(trades_df)
+            trade_metrics['Total_PnL'] = trades_df['Trade_PnL'].sum()
+        for std_factor_2 in std_factors_2:
+            rows.append({'mean_period': mean_period, 'std_factor_1': std_factor_1, 'std_factor_2': std_factor_2, **trade_metrics})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    # Config
+    with open('config.json') as jfile:
+        config = json.load(jfile)
+
+    config['results_path'] += config['simulation_name']
+    os.makedirs(config['results_path'], exist_ok=True)
+
+    with open('sectors.json') as jfile:
+        sectors_dict = json.load(jfile)
+    if not config['sectors'] == ['All']:
+        sectors_dict = {key: val for key, val in sectors_dict.items() if key in config['sectors']}
+
+    sweep_params = config['sweep_parameters']
+    mean_periods, std_factors = sweep_params['mean_period'], sweep_params['std_factor_1']
+    workers = config.get('run_parameters', {}).get('workers', 6)
+    pair_chunks = create_pair_chunks(sectors_dict, workers)
+    pool = Pool(workers)
+    chunks_res = [pool.apply_async(run_sweep_for_pairs, args=(config, sector, stock_pairs, mean_periods, std_factors)) for sector, stock_pairs, _ in pair_chunks]
+    sweep_results = {combination: [] for combination in product(mean_periods, std_factors)}
+    for res in chunks_res:
+        for combination, trades in res.get().items():
+            sweep_results[combination].extend(trades)
+    pool.close()
+
+    results_config = {
+        'start_date': config['date_parameters']['start_date'],
+        'end_date': config['date_parameters']['end_date'],
+        'capital': config['capital_parameters']['total_capital']
+    }
+    sweep_metrics_df = get_sweep_metrics(sweep_results, sweep_params['std_factor_2'], ResultsCalculator(config=results_config))
+    sweep_metrics_df.to_csv(f"{config['results_path']}/Sweep_Metrics.csv", index=False)
+    print(sweep_metrics_df)
@@ -0,0 +1,80 @@
+import time
+import threading
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StockDataCache:
+    """
+    Data of the stocks of a group of pairs, fetched once per stock by the loader threads of the PairPrefetcher.
+    -> fetch_stock : f(stock) -> data of the stock.
+    The data of a stock is dropped once all the pairs it is part of have been loaded.
+    """
+    def __init__(self, fetch_stock, stock_pairs) -> None:
+        self.fetch_stock = fetch_stock
+        self.remaining_uses = Counter(stock for stock_pair in stock_pairs for stock in stock_pair)
+        self.stock_data = {}
+        self.stock_locks = {stock: threading.Lock() for stock in self.remaining_uses}
+        self.lock = threading.Lock()
+
+    def get(self, stock):
+        # A stock requested by 2 threads at once is only fetched by the first one.
+        with self.stock_locks[stock]:
+            if not stock in self.stock_data:
+                self.stock_data[stock] = self.fetch_stock(stock)
+            return self.stock_data[stock]
+
+    def release(self, stock_pair):
+        """
+        Marks a pair as loaded.
+        """
+        with self.lock:
+            for stock in stock_pair:
+                self.remaining_uses[stock] -= 1
+                if self.remaining_uses[stock] == 0:
+                    self.stock_data.pop(stock, None)
+        return
+
+
+class PairPrefetcher:
+    """
+    Loads the inputs of the upcoming pairs on a pool of threads while the current pair is being computed.
+    -> load_pair : f(stock_1, stock_2) -> inputs of the pair (see Strategy.load_pair).
+    -> depth : maximum number of pairs loaded ahead of the one being computed (bounds the memory held by the queue).
+    -> threads : number of loader threads.
+    Iterating yields (stock_pair, pair_inputs) in the order of stock_pairs. The time spent by each stage is kept in report -
+    load_seconds (busy time of the loaders), compute_wait_seconds (compute waiting for a pair to be loaded) and
+    loader_idle_seconds (loaders waiting for room in the queue, or for nothing left to load).
+    """
+    def __init__(self, load_pair, stock_pairs, depth=8, threads=2) -> None:
+        self.load_pair = load_pair
+        self.stock_pairs = list(stock_pairs)
+        self.depth = max(depth, 1)
+        self.threads = max(threads, 1)
+        self.report = {'load_seconds': 0.0, 'compute_wait_seconds': 0.0, 'loader_idle_seconds': 0.0}
+        self.lock = threading.Lock()
+
+    def timed_load(self, stock_pair):
+        start = time.perf_counter()
+        try:
+            return self.load_pair(*stock_pair)
+        finally:
+            with self.lock:
+                self.report['load_seconds'] += time.perf_counter() - start
+
+    def __iter__(self):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            pending = deque()
+            next_idx = 0
+            for stock_pair in self.stock_pairs:
+                # Keep the queue full.
+                while next_idx < len(self.stock_pairs) and len(pending) < self.depth:
+                    pending.append(executor.submit(self.timed_load, self.stock_pairs[next_idx]))
+                    next_idx += 1
+                wait_start = time.perf_counter()
+                pair_inputs = pending.popleft().result()
+                self.report['compute_wait_seconds'] += time.perf_counter() - wait_start
+                yield stock_pair, pair_inputs
+        self.report['loader_idle_seconds'] = max(self.threads * (time.perf_counter() - start) - self.report['load_seconds'], 0.0)
+        return
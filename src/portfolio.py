@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+
+from utils import get_mtm_arrays
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+class TradeBook:
+    """
+    Trades offered to the portfolio, kept as arrays (one entry per trade, the MtM of all the trades concatenated).
+    Trades are added in batches as the pairs finish. The MtM of every trade is held until the book is replayed, so the
+    memory used grows with the number of trades (unlike the streaming results).
+    """
+    def __init__(self) -> None:
+        self.stock_ids = {}
+        self.batches = []
+
+    def get_stock_id(self, stock):
+        if not stock in self.stock_ids:
+            self.stock_ids[stock] = len(self.stock_ids)
+        return self.stock_ids[stock]
+
+    def add_trades(self, trades_list):
+        if trades_list == []:
+            return
+        mtm_arrays = [get_mtm_arrays(trade) for trade in trades_list]
+        self.batches.append({
+            'entry_day': np.array([trade['Entry_Date'] for trade in trades_list], dtype='datetime64[D]').astype(np.int64),
+            'exit_day': np.array([trade['Exit_Date'] for trade in trades_list], dtype='datetime64[D]').astype(np.int64),
+            'capital': np.array([trade['Long_Entry_Price'] * trade['Long_Quantity'] + trade['Short_Entry_Price'] * trade['Short_Quantity'] for trade in trades_list], dtype=np.float64),
+            'pnl': np.array([trade['Trade_PnL'] for trade in trades_list], dtype=np.float64),
+            'long_stock': np.array([self.get_stock_id(trade['Long_Stock']) for trade in trades_list], dtype=np.int64),
+            'short_stock': np.array([self.get_stock_id(trade['Short_Stock']) for trade in trades_list], dtype=np.int64),
+            'stock_pair': np.array([trade.get('Stock_Pair', f"{trade['Long_Stock']}|{trade['Short_Stock']}") for trade in trades_list], dtype=object),
+            'mtm_count': np.array([len(mtm_days) for mtm_days, _ in mtm_arrays], dtype=np.int64),
+            'mtm_days': np.concatenate([mtm_days for mtm_days, _ in mtm_arrays]),
+            'mtm_values': np.concatenate([mtm_values for _, mtm_values in mtm_arrays]),
+        })
+        return
+
+    def get_arrays(self):
+        if self.batches == []:
+            return None
+        return {key: np.concatenate([batch[key] for batch in self.batches]) for key in self.batches[0]}
+
+
+# Priority rules : f(trade arrays, rng) -> score of every trade. Competing entries of a day are taken by decreasing score.
+priority_rules = {
+    'stock_pair': lambda arrays, rng: np.zeros(len(arrays['pnl'])),
+    'smallest_capital': lambda arrays, rng: -arrays['capital'],
+    'largest_capital': lambda arrays, rng: arrays['capital'],
+    'random': lambda arrays, rng: rng.random(len(arrays['pnl'])),
+}
+
+
+def _allocate(event_trade, event_is_entry, capital, pnl, long_stock, short_stock, n_stocks, total_capital, max_open_pairs, max_positions_per_stock, reinvest_pnl):
+    """
+    Walks the entry and exit events in order and takes every entry that the capital and position limits allow.
+    Returns the taken flag of every trade and, for the trades not taken, the limit that rejected them (1 = capital, 2 = positions).
+    """
+    n_trades = len(capital)
+    taken = np.zeros(n_trades, dtype=np.bool_)
+    rejection = np.zeros(n_trades, dtype=np.int64)
+    stock_positions = np.zeros(n_stocks, dtype=np.int64)
+    committed = 0.0
+    realized = 0.0
+    open_pairs = 0
+    for event in range(len(event_trade)):
+        trade = event_trade[event]
+        if event_is_entry[event]:
+            if open_pairs >= max_open_pairs or stock_positions[long_stock[trade]] >= max_positions_per_stock or stock_positions[short_stock[trade]] >= max_positions_per_stock:
+                rejection[trade] = 2
+            elif committed + capital[trade] > total_capital + (realized if reinvest_pnl else 0.0):
+                rejection[trade] = 1
+            else:
+                taken[trade] = True
+                committed += capital[trade]
+                open_pairs += 1
+                stock_positions[long_stock[trade]] += 1
+                stock_positions[short_stock[trade]] += 1
+        elif taken[trade]:
+            committed -= capital[trade]
+            realized += pnl[trade]
+            open_pairs -= 1
+            stock_positions[long_stock[trade]] -= 1
+            stock_positions[short_stock[trade]] -= 1
+    return taken, rejection
+
+
+if not njit == None:
+    _allocate = njit(cache=True)(_allocate)
+
+
+class PortfolioSimulator:
+    """
+    Portfolio level execution of the trades of all the pairs on a shared calendar.
+    -> total_capital : capital of the book. The gross notional of a trade (both legs) is committed from its entry to its exit.
+    -> max_open_pairs : maximum number of pairs held at the same time (None = no limit).
+    -> max_positions_per_stock : maximum number of open pairs a stock can be part of (None = no limit).
+    -> priority : rule ordering the entries of a day when they compete for capital - a name of priority_rules or a
+       f(trade arrays, rng) -> scores function. Ties are broken by stock pair.
+    -> reinvest_pnl : if True, the realized PnL is added to the capital available for new trades.
+    On a given day the exits (at the open) are processed before the entries, so their capital can be reused the same day.
+    """
+    def __init__(self, total_capital, max_open_pairs=None, max_positions_per_stock=None, priority='stock_pair', reinvest_pnl=False, seed=0) -> None:
+        if not callable(priority) and not priority in priority_rules:
+            raise Exception(f"Unknown priority rule : {priority}")
+        self.total_capital = total_capital
+        self.max_open_pairs = max_open_pairs
+        self.max_positions_per_stock = max_positions_per_stock
+        self.priority = priority if callable(priority) else priority_rules[priority]
+        self.reinvest_pnl = reinvest_pnl
+        self.seed = seed
+
+    def run(self, trade_book):
+        """
+        Returns the equity curve (Date, PnL, Equity, Committed_Capital, Open_Pairs), the portfolio metrics and the
+        portfolio tradesheet (every trade offered, with its status).
+        """
+        arrays = trade_book.get_arrays()
+        if arrays == None:
+            raise Exception("Trades List is empty")
+        n_trades = len(arrays['pnl'])
+        scores = np.asarray(self.priority(arrays, np.random.default_rng(self.seed)), dtype=np.float64)
+        _, pair_rank = np.unique(arrays['stock_pair'].astype(str), return_inverse=True)
+
+        # Events : (day, exits before entries, decreasing priority, stock pair).
+        event_trade = np.concatenate((np.arange(n_trades), np.arange(n_trades)))
+        event_is_entry = np.concatenate((np.zeros(n_trades, dtype=bool), np.ones(n_trades, dtype=bool)))
+        event_day = np.concatenate((arrays['exit_day'], arrays['entry_day']))
+        order = np.lexsort((pair_rank[event_trade], -scores[event_trade], event_is_entry, event_day))
+        no_limit = np.iinfo(np.int64).max
+        taken, rejection = _allocate(event_trade[order], event_is_entry[order], arrays['capital'], arrays['pnl'], arrays['long_stock'], arrays['short_stock'],
+            max(len(trade_book.stock_ids), 1), float(self.total_capital), no_limit if self.max_open_pairs == None else self.max_open_pairs,
+            no_limit if self.max_positions_per_stock == None else self.max_positions_per_stock, self.reinvest_pnl)
+
+        equity_curve = self.get_equity_curve(arrays, taken)
+        return equity_curve, self.get_metrics(arrays, taken, rejection, equity_curve), self.get_tradesheet(arrays, taken, rejection)
+
+    def get_equity_curve(self, arrays, taken):
+        """
+        Daily PnL of the trades taken - their MtM, plus the difference between the MtM and the PnL of a trade
+        (exit at the next open, transaction costs) on its exit day - with the equity, committed capital and open pairs.
+        """
+        mtm_taken = np.repeat(taken, arrays['mtm_count'])
+        mtm_days, mtm_values = arrays['mtm_days'][mtm_taken], arrays['mtm_values'][mtm_taken]
+        mtm_sums = np.bincount(np.repeat(np.arange(len(taken)), arrays['mtm_count']), weights=arrays['mtm_values'], minlength=len(taken))
+        entry_day, exit_day, capital = arrays['entry_day'][taken], arrays['exit_day'][taken], arrays['capital'][taken]
+        if len(entry_day) == 0:
+            return pd.DataFrame(columns=['Date', 'PnL', 'Equity', 'Committed_Capital', 'Open_Pairs'])
+        first_day = min(entry_day.min(), mtm_days.min() if len(mtm_days) > 0 else entry_day.min())
+        n_days = max(exit_day.max(), mtm_days.max() if len(mtm_days) > 0 else exit_day.max()) - first_day + 1
+        # bincount gives integers when there is no MtM at all.
+        day_pnl = np.bincount(mtm_days - first_day, weights=mtm_values, minlength=n_days).astype(np.float64)
+        day_pnl += np.bincount(exit_day - first_day, weights=arrays['pnl'][taken] - mtm_sums[taken], minlength=n_days)
+        # Committed capital and open pairs from the entry day (included) to the exit day (excluded).
+        committed = np.cumsum(np.bincount(entry_day - first_day, weights=capital, minlength=n_days + 1) - np.bincount(exit_day - first_day, weights=capital, minlength=n_days + 1))[:n_days]
+        open_pairs = np.cumsum(np.bincount(entry_day - first_day, minlength=n_days + 1) - np.bincount(exit_day - first_day, minlength=n_days + 1))[:n_days]
+        # Days on which something happened.
+        days = np.flatnonzero((day_pnl != 0) | (open_pairs > 0) | (np.bincount(exit_day - first_day, minlength=n_days) > 0))
+        equity_curve = pd.DataFrame()
+        equity_curve['Date'] = pd.to_datetime((days + first_day).astype('datetime64[D]'))
+        equity_curve['PnL'] = day_pnl[days]
+        equity_curve['Equity'] = self.total_capital + np.cumsum(day_pnl)[days]
+        equity_curve['Committed_Capital'] = committed[days]
+        equity_curve['Open_Pairs'] = open_pairs[days]
+        return equity_curve
+
+    def get_metrics(self, arrays, taken, rejection, equity_curve):
+        metrics = {}
+        metrics['Trades_Offered'] = len(taken)
+        metrics['Trades_Taken'] = int(taken.sum())
+        metrics['Rejected_Capital'] = int((rejection == 1).sum())
+        metrics['Rejected_Positions'] = int((rejection == 2).sum())
+        metrics['Total_PnL'] = float(arrays['pnl'][taken].sum())
+        metrics['Return_%'] = 100 * metrics['Total_PnL'] / self.total_capital
+        if not equity_curve.empty:
+            equity = equity_curve['Equity'].values
+            drawdown = 1 - equity / np.maximum.accumulate(np.maximum(equity, self.total_capital))
+            metrics['Max_Drawdown_%'] = float(100 * drawdown.max())
+            metrics['Maximum_Open_Pairs'] = int(equity_curve['Open_Pairs'].max())
+            metrics['Maximum_Committed_Capital'] = float(equity_curve['Committed_Capital'].max())
+            metrics['Average_Capital_Utilization_%'] = float(100 * equity_curve['Committed_Capital'].mean() / self.total_capital)
+        return metrics
+
+    def get_tradesheet(self, arrays, taken, rejection):
+        tradesheet = pd.DataFrame()
+        tradesheet['Entry_Date'] = pd.to_datetime(arrays['entry_day'].astype('datetime64[D]'))
+        tradesheet['Exit_Date'] = pd.to_datetime(arrays['exit_day'].astype('datetime64[D]'))
+        tradesheet['Stock_Pair'] = arrays['stock_pair']
+        tradesheet['Capital'] = arrays['capital']
+        tradesheet['Trade_PnL'] = arrays['pnl']
+        tradesheet['Status'] = np.where(taken, 'Taken', np.where(rejection == 1, 'Rejected_Capital', 'Rejected_Positions'))
+        return tradesheet.sort_values(by=['Entry_Date', 'Stock_Pair'], kind='stable').reset_index(drop=True)
+
+
+def create_portfolio_simulator(config):
+    """
+    Creates the PortfolioSimulator described by config['portfolio_parameters'], or None if it is not enabled.
+    """
+    portfolio_params = config.get('portfolio_parameters', {})
+    if not portfolio_params.get('enabled', False):
+        return None
+    return PortfolioSimulator(config['capital_parameters']['total_capital'], max_open_pairs=portfolio_params.get('max_open_pairs'),
+        max_positions_per_stock=portfolio_params.get('max_positions_per_stock'), priority=portfolio_params.get('priority', 'stock_pair'),
+        reinvest_pnl=portfolio_params.get('reinvest_pnl', False), seed=portfolio_params.get('seed', 0))
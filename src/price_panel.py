@@ -0,0 +1,154 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+
+
+class PricePanel:
+    """
+    Aligned date x ticker view of the close and open prices of a group of stocks.
+    -> dates : sorted union of the trading dates of all the stocks.
+    -> close, open : (dates x tickers) arrays, NaN where a stock has no data for a date.
+    -> present : (dates x tickers) boolean array marking the dates for which a stock has a record.
+    """
+    pair_columns = ['date', 'next_date', 'underlying_1', 'underlying_2', 'close_1', 'close_2', 'next_open_1', 'next_open_2', 'sector']
+
+    def __init__(self, dates, tickers, close, open_, present, sectors) -> None:
+        self.dates = dates
+        self.tickers = list(tickers)
+        self.ticker_index = {ticker: idx for idx, ticker in enumerate(self.tickers)}
+        self.close = close
+        self.open = open_
+        self.present = present
+        self.sectors = list(sectors)
+        # Shared memory block backing the arrays, if attached to one.
+        self.shared_memory = None
+
+    @classmethod
+    def from_records(cls, data_df, tickers=None):
+        """
+        Pivots the raw records (one row per stock per date) into the aligned panel.
+        data_df : DataFrame with the 'date', 'underlying', 'open', 'close' and 'sector' columns.
+        tickers : order of the columns of the panel. Defaults to the tickers present in data_df.
+        """
+        if tickers is None:
+            tickers = sorted(data_df['underlying'].unique()) if not data_df.empty else []
+        tickers = list(tickers)
+        if data_df.empty:
+            empty = np.empty((0, len(tickers)))
+            return cls(np.array([], dtype='datetime64[ns]'), tickers, empty, empty.copy(), empty.astype(bool), [None] * len(tickers))
+
+        data_df = data_df[data_df['underlying'].isin(tickers)].drop_duplicates(subset=['underlying', 'date'])
+        dates = np.sort(data_df['date'].unique()).astype('datetime64[ns]')
+        ticker_index = {ticker: idx for idx, ticker in enumerate(tickers)}
+        row_idx = np.searchsorted(dates, data_df['date'].values.astype('datetime64[ns]'))
+        col_idx = data_df['underlying'].map(ticker_index).values
+
+        close = np.full((len(dates), len(tickers)), np.nan)
+        open_ = np.full((len(dates), len(tickers)), np.nan)
+        present = np.zeros((len(dates), len(tickers)), dtype=bool)
+        close[row_idx, col_idx] = data_df['close'].values
+        open_[row_idx, col_idx] = data_df['open'].values
+        present[row_idx, col_idx] = True
+
+        sector_map = data_df.groupby('underlying')['sector'].first().to_dict()
+        sectors = [sector_map.get(ticker) for ticker in tickers]
+        return cls(dates, tickers, close, open_, present, sectors)
+
+    def _array_layout(self):
+        """
+        (name, dtype, shape) of the arrays of the panel, in the order they are laid out in shared memory or on disk.
+        """
+        n_dates, n_tickers = len(self.dates), len(self.tickers)
+        return [
+            ('dates', np.dtype('int64'), (n_dates,)),
+            ('close', np.dtype('float64'), (n_dates, n_tickers)),
+            ('open', np.dtype('float64'), (n_dates, n_tickers)),
+            ('present', np.dtype('bool'), (n_dates, n_tickers)),
+        ]
+
+    def to_shared_memory(self):
+        """
+        Copies the panel into a single multiprocessing shared memory block.
+        Returns the handle to be passed to attach_shared_memory in the worker processes, and the SharedMemory object.
+        The creator is responsible for calling close() and unlink() on the block once the workers are done.
+        """
+        layout = self._array_layout()
+        size = sum(dtype.itemsize * int(np.prod(shape)) for _, dtype, shape in layout)
+        block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        offset = 0
+        for name, dtype, shape in layout:
+            array = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)
+            array[...] = self.dates.astype('datetime64[ns]').view('int64') if name == 'dates' else getattr(self, name)
+            offset += array.nbytes
+        handle = {
+            'name': block.name,
+            'n_dates': len(self.dates),
+            'tickers': self.tickers,
+            'sectors': self.sectors,
+        }
+        return handle, block
+
+    @classmethod
+    def attach_shared_memory(cls, handle):
+        """
+        Creates a panel whose arrays are read-only views on the shared memory block described by handle (no copy is made).
+        """
+        block = shared_memory.SharedMemory(name=handle['name'])
+        panel = cls(np.empty(handle['n_dates'], dtype='datetime64[ns]'), handle['tickers'], None, None, None, handle['sectors'])
+        offset = 0
+        for name, dtype, shape in panel._array_layout():
+            array = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)
+            array.flags.writeable = False
+            offset += array.nbytes
+            setattr(panel, name, array.view('datetime64[ns]') if name == 'dates' else array)
+        panel.shared_memory = block
+        return panel
+
+    def save_npy(self, directory):
+        """
+        Saves the arrays of the panel as .npy files (plus the tickers and sectors as json) so that they can be memory-mapped.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name, _, _ in self._array_layout():
+            array = self.dates.astype('datetime64[ns]').view('int64') if name == 'dates' else getattr(self, name)
+            np.save(os.path.join(directory, f'{name}.npy'), array)
+        with open(os.path.join(directory, 'panel.json'), 'w') as jfile:
+            json.dump({'tickers': self.tickers, 'sectors': self.sectors}, jfile)
+        return
+
+    @classmethod
+    def load_npy(cls, directory, mmap_mode='r'):
+        """
+        Loads a panel saved by save_npy. With mmap_mode='r' the arrays are memory-mapped, so processes loading the
+        same directory share the pages of the OS file cache.
+        """
+        with open(os.path.join(directory, 'panel.json')) as jfile:
+            meta = json.load(jfile)
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode) for name in ['dates', 'close', 'open', 'present']}
+        return cls(arrays['dates'].view('datetime64[ns]'), meta['tickers'], arrays['close'], arrays['open'], arrays['present'], meta['sectors'])
+
+    def get_pair_data(self, stock_1, stock_2):
+        """
+        Creates the combined dataframe for the 2 stocks, identical in layout to DataProcessor.get_data.
+        Only the dates on which both the stocks have a record are retained.
+        """
+        if stock_1 not in self.ticker_index or stock_2 not in self.ticker_index:
+            return pd.DataFrame(columns=self.pair_columns)
+        idx_1, idx_2 = self.ticker_index[stock_1], self.ticker_index[stock_2]
+        rows = np.flatnonzero(self.present[:, idx_1] & self.present[:, idx_2])
+        dates = pd.Series(self.dates[rows])
+        combined_stock_df = pd.DataFrame()
+        combined_stock_df['date'] = dates
+        combined_stock_df['next_date'] = dates.shift(-1)
+        combined_stock_df['underlying_1'] = stock_1
+        combined_stock_df['underlying_2'] = stock_2
+        combined_stock_df['close_1'] = self.close[rows, idx_1]
+        combined_stock_df['close_2'] = self.close[rows, idx_2]
+        combined_stock_df['next_open_1'] = pd.Series(self.open[rows, idx_1]).shift(-1)
+        combined_stock_df['next_open_2'] = pd.Series(self.open[rows, idx_2]).shift(-1)
+        combined_stock_df['sector'] = self.sectors[idx_1]
+        combined_stock_df.dropna(inplace=True)
+        combined_stock_df.reset_index(inplace=True, drop=True)
+        return combined_stock_df
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import cProfile
+import pandas as pd
+
+from collections import defaultdict
+
+
+class StageTimer:
+    """
+    Accumulates the wall time and the number of calls of the stages of a run.
+    """
+    def __init__(self) -> None:
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def wrap(self, stage, function):
+        """
+        Returns function, timed as stage.
+        """
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.times[stage] += time.perf_counter() - start
+                self.calls[stage] += 1
+        return timed_function
+
+
+class StrategyProfiler(StageTimer):
+    """
+    Instruments the Strategy objects of a worker : wall time and calls of the stages, and the work done (pairs, windows
+    tested and passed, trades), per sector. The stages nest - trade_pairs includes the time of the other stages of the pair.
+    """
+    # (stage, object holding the method - 'strategy' or 'mongo_interactor', method)
+    instrumented_methods = [
+        ('trade_pairs', 'strategy', 'trade_pairs'),
+        ('trade_pairs', 'strategy', 'trade_pairs_incremental'),
+        ('hedge_ratio', 'strategy', 'create_pair_windows'),
+        ('hedge_ratio', 'strategy', 'fit_regression_model'),
+        ('adf', 'strategy', 'perform_adfuller_tests'),
+        ('adf_exact', 'strategy', 'perform_adfuller_test'),
+        ('signals', 'strategy', 'calculate_signals'),
+        ('generate_trades', 'strategy', 'generate_trades'),
+        ('save_trades', 'mongo_interactor', 'save_trades'),
+        ('save_trades', 'mongo_interactor', 'save_window_increment'),
+    ]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.counters = defaultdict(int)
+
+    def count(self, key, value):
+        self.counters[key] += value
+        return
+
+    def instrument(self, strat):
+        """
+        Wraps the methods of the strategy (and of its MongoInteractor) with the timers of their stage.
+        """
+        sector = strat.sector_name
+        objects = {'strategy': strat, 'mongo_interactor': strat.mongo_interactor}
+        for stage, obj, method in self.instrumented_methods:
+            setattr(objects[obj], method, self.wrap((sector, stage), getattr(objects[obj], method)))
+        # Work counters.
+        def counted(function, counter):
+            def counted_function(*args, **kwargs):
+                result = function(*args, **kwargs)
+                for key, value in counter(result).items():
+                    self.count((sector, key), value)
+                return result
+            return counted_function
+
+        strat.trade_pairs = counted(strat.trade_pairs, lambda trades: {'pairs': 1})
+        strat.trade_pairs_incremental = counted(strat.trade_pairs_incremental, lambda trades: {'pairs': 1})
+        strat.perform_adfuller_tests = counted(strat.perform_adfuller_tests, lambda test_results: {'windows_tested': len(test_results), 'windows_passed': sum(test_results)})
+        strat.generate_trades = counted(strat.generate_trades, lambda trades: {'trades': len(trades)})
+        return strat
+
+    def get_profile(self):
+        """
+        Profile of the worker, as returned to the parent process : {'worker': pid, 'stages': rows, 'counters': rows}.
+        """
+        return {
+            'worker': os.getpid(),
+            'stages': [{'sector': sector, 'stage': stage, 'seconds': seconds, 'calls': self.calls[(sector, stage)]} for (sector, stage), seconds in self.times.items()],
+            'counters': [{'sector': sector, 'counter': counter, 'value': value} for (sector, counter), value in self.counters.items()]
+        }
+
+
+class RunProfile:
+    """
+    Aggregates the profiles returned by the workers of the pool and writes the run profile :
+    -> Run_Profile.csv : seconds and calls of every stage per worker and sector.
+    -> Run_Profile.json : totals per stage, per sector (with the pairs, windows tested / passed and trades) and per worker.
+    """
+    def __init__(self) -> None:
+        self.stage_rows = []
+        self.counter_rows = []
+        self.start = time.perf_counter()
+
+    def add(self, profile):
+        if profile == None:
+            return
+        self.stage_rows.extend(dict(row, worker=profile['worker']) for row in profile['stages'])
+        self.counter_rows.extend(dict(row, worker=profile['worker']) for row in profile['counters'])
+        return
+
+    def get_summary(self):
+        stages_df = pd.DataFrame(self.stage_rows, columns=['worker', 'sector', 'stage', 'seconds', 'calls'])
+        counters_df = pd.DataFrame(self.counter_rows, columns=['worker', 'sector', 'counter', 'value'])
+        stage_totals = stages_df.groupby('stage')[['seconds', 'calls']].sum()
+        sector_seconds = stages_df.pivot_table(index='sector', columns='stage', values='seconds', aggfunc='sum', fill_value=0)
+        sector_counters = counters_df.pivot_table(index='sector', columns='counter', values='value', aggfunc='sum', fill_value=0)
+        worker_seconds = stages_df[stages_df['stage'] == 'trade_pairs'].groupby('worker')['seconds'].sum()
+        worker_counters = counters_df.pivot_table(index='worker', columns='counter', values='value', aggfunc='sum', fill_value=0)
+        sectors = sector_seconds.join(sector_counters, how='outer').fillna(0)
+        workers = worker_counters.join(worker_seconds.rename('busy_seconds'), how='outer').fillna(0)
+        return {
+            'wall_seconds': time.perf_counter() - self.start,
+            'stages': {stage: {'seconds': float(row['seconds']), 'calls': int(row['calls'])} for stage, row in stage_totals.iterrows()},
+            'sectors': {sector: {key: float(val) for key, val in row.items()} for sector, row in sectors.iterrows()},
+            'workers': {str(worker): {key: float(val) for key, val in row.items()} for worker, row in workers.iterrows()}
+        }
+
+    def write(self, results_path):
+        pd.DataFrame(self.stage_rows, columns=['worker', 'sector', 'stage', 'seconds', 'calls']).to_csv(os.path.join(results_path, 'Run_Profile.csv'), index=False)
+        with open(os.path.join(results_path, 'Run_Profile.json'), 'w') as jfile:
+            json.dump(self.get_summary(), jfile, indent=4)
+        return
+
+
+class ChunkProfiler:
+    """
+    Profiles the chunks of pairs run by a worker. Optionally runs cProfile during the chunks, the cumulative stats of the
+    worker being dumped to <cprofile_path>/cprofile_<pid>.prof after every chunk.
+    """
+    def __init__(self, cprofile_path=None) -> None:
+        self.cprofile_path = cprofile_path
+        self.cprofile = None if cprofile_path == None else cProfile.Profile()
+        self.strategy_profiler = None
+
+    def start(self):
+        self.strategy_profiler = StrategyProfiler()
+        if not self.cprofile == None:
+            self.cprofile.enable()
+        return self.strategy_profiler
+
+    def stop(self):
+        if not self.cprofile == None:
+            self.cprofile.disable()
+            os.makedirs(self.cprofile_path, exist_ok=True)
+            self.cprofile.dump_stats(os.path.join(self.cprofile_path, f'cprofile_{os.getpid()}.prof'))
+        return self.strategy_profiler.get_profile()
@@ -0,0 +1,145 @@
+import json
+import os
+import pandas as pd
+from multiprocessing import Pool
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+class CsvReportWriter:
+    """
+    Writes the tradesheet and the MTM series of a report as CSV files - Tradesheet_<name>.csv and MTM_<name>.csv.
+    The tradesheet is appended to as trades arrive.
+    """
+    extension = 'csv'
+
+    def __init__(self, results_path) -> None:
+        self.results_path = results_path
+        self.started = set()
+
+    def get_file_path(self, prefix, name):
+        return os.path.join(self.results_path, f'{prefix}_{name}.{self.extension}')
+
+    def append_trades(self, name, trades_df):
+        write_header = not name in self.started
+        trades_df.to_csv(self.get_file_path('Tradesheet', name), mode='w' if write_header else 'a', header=write_header, index=False)
+        self.started.add(name)
+        return
+
+    def close(self):
+        return
+
+    def read_trades(self, name):
+        return pd.read_csv(self.get_file_path('Tradesheet', name), parse_dates=['Entry_Date', 'Exit_Date'])
+
+    def write_table(self, prefix, name, df):
+        df.to_csv(self.get_file_path(prefix, name), index=False)
+        return
+
+    def write_mtm(self, name, mtm_sheet):
+        self.write_table('MTM', name, mtm_sheet)
+        return
+
+
+class ParquetReportWriter(CsvReportWriter):
+    """
+    Writes the tradesheet and the MTM series of a report as Parquet files - Tradesheet_<name>.parquet and MTM_<name>.parquet.
+    Every batch of trades is written as a row group of the open tradesheet file.
+    """
+    extension = 'parquet'
+
+    def __init__(self, results_path) -> None:
+        if pa == None:
+            raise Exception("pyarrow is required for the parquet report format.")
+        super().__init__(results_path)
+        self.tradesheet_writers = {}
+
+    def append_trades(self, name, trades_df):
+        table = pa.Table.from_pandas(trades_df, preserve_index=False)
+        if not name in self.tradesheet_writers:
+            self.tradesheet_writers[name] = pq.ParquetWriter(self.get_file_path('Tradesheet', name), table.schema)
+        writer = self.tradesheet_writers[name]
+        writer.write_table(table.cast(writer.schema))
+        return
+
+    def close(self):
+        for writer in self.tradesheet_writers.values():
+            writer.close()
+        self.tradesheet_writers = {}
+        return
+
+    def read_trades(self, name):
+        return pd.read_parquet(self.get_file_path('Tradesheet', name))
+
+    def write_table(self, prefix, name, df):
+        df.to_parquet(self.get_file_path(prefix, name), index=False)
+        return
+
+
+report_writers = {
+    'csv': CsvReportWriter,
+    'parquet': ParquetReportWriter,
+}
+
+
+def create_report_writer(report_format, results_path):
+    if not report_format in report_writers:
+        raise Exception(f"Unknown report format : {report_format}")
+    return report_writers[report_format](results_path)
+
+
+def get_trade_metrics_df(trade_metrics):
+    trade_metrics_df = pd.DataFrame()
+    trade_metrics_df['Metric'] = list(trade_metrics.keys())
+    trade_metrics_df['Values'] = list(trade_metrics.values())
+    return trade_metrics_df
+
+
+def write_trade_metrics_json(results_path, name, trade_metrics, prefix='Trade_Metrics'):
+    with open(os.path.join(results_path, f'{prefix}_{name}.json'), 'w') as jfile:
+        json.dump({key: val.item() if hasattr(val, 'item') else val for key, val in trade_metrics.items()}, jfile, indent=4)
+    return
+
+
+def write_excel_report(results_path, name, trade_metrics, trades_df, mtm_sheet):
+    """
+    Saves the results in an Excel workbook (Trade_Metrics, Tradesheet and MTM_Metrics sheets), as ResultsCalculator used to.
+    """
+    workbook = pd.ExcelWriter(path=f"{results_path}/Results_{name}.xlsx", engine='xlsxwriter')
+    get_trade_metrics_df(trade_metrics).to_excel(excel_writer=workbook, sheet_name='Trade_Metrics', index=False)
+    if not trades_df is None:
+        trades_df.to_excel(excel_writer=workbook, sheet_name='Tradesheet', index=False)
+    mtm_sheet.to_excel(excel_writer=workbook, sheet_name='MTM_Metrics', index=False)
+    workbook.close()
+    return
+
+
+def write_report(results_path, report_format, excel, name, trade_metrics, mtm_sheet):
+    """
+    Writes the summary parts of a report whose tradesheet has already been written by the report writer -
+    the Trade_Metrics json, the MTM series and, if requested, the Excel workbook (which reads the tradesheet back).
+    """
+    writer = create_report_writer(report_format, results_path)
+    write_trade_metrics_json(results_path, name, trade_metrics)
+    writer.write_mtm(name, mtm_sheet)
+    if excel:
+        write_excel_report(results_path, name, trade_metrics, writer.read_trades(name), mtm_sheet)
+    return
+
+
+def write_reports(report_jobs, workers=1):
+    """
+    Runs write_report for every (results_path, report_format, excel, name, trade_metrics, mtm_sheet) job,
+    in parallel over a pool of processes if workers > 1.
+    """
+    if workers > 1 and len(report_jobs) > 1:
+        with Pool(min(workers, len(report_jobs))) as pool:
+            pool.starmap(write_report, report_jobs)
+    else:
+        for report_job in report_jobs:
+            write_report(*report_job)
+    return
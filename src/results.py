@@ -1,7 +1,10 @@
 from os import path
 import pandas as pd
-import datetime as dt
-from collections import defaultdict
+import numpy as np
+
+from utils import get_mtm_arrays
+from report_writers import create_report_writer, write_reports, write_trade_metrics_json
+from portfolio import TradeBook
 
 class ResultsCalculator:
     trades_columns_order = ['Entry_Date', 'Exit_Date', 'Sector', 'Long_Stock', 'Long_Entry_Price', 'Long_Exit_Price', 'Long_Quantity', 'Short_Stock', 'Short_Entry_Price', 'Short_Exit_Price', 'Short_Quantity', \
@@ -13,17 +16,19 @@ class ResultsCalculator:
         config = {
             "start_date": datetime,
             "end_date": datetime,
-            "capital": int
+            "capital": int,
+            "report_format": "csv" | "parquet" (format of the tradesheet and MTM series, default csv),
+            "excel": bool (also save the Excel workbook, default False)
         }
         """
         self.config = config
 
     def calculate_results(self, trades_list, results_path, name):
         """
-        Calculates the relevant metrics and saves them in an Excel workbook.
+        Calculates the relevant metrics and saves them through the report writer of the configured format.
         trades_list : List of trades generated by the strategy.
-        results_path : folder where the workbook needs to be saved.
-        name : name of the notebook.
+        results_path : folder where the reports need to be saved.
+        name : name of the report.
         """
         if trades_list == []:
             raise Exception("Trades List is empty")
@@ -41,16 +46,12 @@ class ResultsCalculator:
             trade_metrics['Maximum_Open_Pairs'] = 0
             trade_metrics['Average_Open_Pairs'] = 0
 
-        trade_metrics_df = pd.DataFrame()
-        trade_metrics_df['Metric'] = list(trade_metrics.keys())
-        trade_metrics_df['Values'] = list(trade_metrics.values())
-
-        # Save results in a workbook.
-        workbook = pd.ExcelWriter(path=f"{results_path}/Results_{name}.xlsx", engine='xlsxwriter')
-        trade_metrics_df.to_excel(excel_writer=workbook, sheet_name='Trade_Metrics', index=False)
-        trades_df[self.trades_columns_order].to_excel(excel_writer=workbook, sheet_name='Tradesheet', index=False)
-        mtm_metrics_df.to_excel(excel_writer=workbook, sheet_name='MTM_Metrics', index=False)
-        workbook.save()
+        # Save the results.
+        report_format = self.config.get('report_format', 'csv')
+        report_writer = create_report_writer(report_format, results_path)
+        report_writer.append_trades(name, trades_df[self.trades_columns_order])
+        report_writer.close()
+        write_reports([(results_path, report_format, self.config.get('excel', False), name, trade_metrics, mtm_metrics_df)])
         return
 
     def get_trade_metrics(self, trades_df):
@@ -80,18 +81,211 @@ class ResultsCalculator:
     def get_mtm_metrics(self, trades_list):
         """
         Calculates capital related metrics.
+        The MtM of all the trades is reduced in one pass over a daily calendar (see DailyMtM).
         """
-        day_pnl = defaultdict(float)
-        open_position_dict = defaultdict(int)
-        for trade in trades_list:
-            unrealized_pnl_dict = trade['MtM_dict']
-            for key, val in unrealized_pnl_dict.items():
-                day_pnl[dt.datetime.strptime(key, '%Y-%m-%d')] += val
-                open_position_dict[dt.datetime.strptime(key, '%Y-%m-%d')] += 1
+        daily_mtm = DailyMtM()
+        daily_mtm.add_trades(trades_list)
+        return daily_mtm.get_mtm_sheet(), daily_mtm.get_open_position_dict()
+
+
+class DailyMtM:
+    """
+    Daily PnL and number of open positions of a set of trades, kept as dense arrays over a calendar of days
+    (days since 1970-01-01, offset by first_day). Trades are added with a bincount reduction of their MtM arrays.
+    """
+    def __init__(self) -> None:
+        self.first_day = None
+        self.day_pnl = np.zeros(0)
+        self.open_positions = np.zeros(0, dtype=np.int64)
+
+    def add_trades(self, trades_list):
+        if trades_list == []:
+            return
+        mtm_arrays = [get_mtm_arrays(trade) for trade in trades_list]
+        days = np.concatenate([mtm_days for mtm_days, _ in mtm_arrays])
+        values = np.concatenate([mtm_values for _, mtm_values in mtm_arrays])
+        self.add_mtm(days, values)
+        return
+
+    def add_mtm(self, days, values, positions=None):
+        """
+        Adds MtM values on days (days since 1970-01-01).
+        positions : number of open positions each value stands for - 1 each if None, or the counts of MtM values already
+        summed per day (e.g. by a MongoDB aggregation).
+        """
+        if len(days) == 0:
+            return
+        first_day = days.min() if self.first_day == None else min(days.min(), self.first_day)
+        if not self.first_day == None and first_day < self.first_day:
+            # Extend the calendar backwards.
+            padding = self.first_day - first_day
+            self.day_pnl = np.concatenate((np.zeros(padding), self.day_pnl))
+            self.open_positions = np.concatenate((np.zeros(padding, dtype=np.int64), self.open_positions))
+        self.first_day = first_day
+        offsets = days - first_day
+        n_days = max(offsets.max() + 1, len(self.day_pnl))
+        self.day_pnl = np.concatenate((self.day_pnl, np.zeros(n_days - len(self.day_pnl))))
+        self.open_positions = np.concatenate((self.open_positions, np.zeros(n_days - len(self.open_positions), dtype=np.int64)))
+        self.day_pnl += np.bincount(offsets, weights=values, minlength=n_days)
+        self.open_positions += np.bincount(offsets, weights=positions, minlength=n_days).astype(np.int64)
+        return
+
+    def get_trading_days(self):
+        """
+        Offsets of the days with at least one open position.
+        """
+        return np.flatnonzero(self.open_positions)
+
+    def get_dates(self, offsets):
+        first_day = self.first_day if not self.first_day == None else 0
+        return pd.to_datetime((offsets + first_day).astype('datetime64[D]'))
+
+    def get_mtm_sheet(self):
+        trading_days = self.get_trading_days()
         mtm_sheet = pd.DataFrame()
-        mtm_sheet['Date'] = list(day_pnl.keys())
-        mtm_sheet['PnL'] = list(day_pnl.values())
-        mtm_sheet.sort_values(by='Date', ascending=True, inplace=True)
-        mtm_sheet.reset_index(inplace=True, drop=True)
+        mtm_sheet['Date'] = self.get_dates(trading_days)
+        mtm_sheet['PnL'] = self.day_pnl[trading_days]
         mtm_sheet['Cumulative_PnL'] = mtm_sheet['PnL'].cumsum()
-        return mtm_sheet, open_position_dict
\ No newline at end of file
+        return mtm_sheet
+
+    def get_open_position_dict(self):
+        trading_days = self.get_trading_days()
+        return dict(zip(self.get_dates(trading_days), self.open_positions[trading_days].tolist()))
+
+
+class TradeMetricsAccumulator:
+    """
+    Running version of the metrics of ResultsCalculator for a stream of trades.
+    Keeps counters and per-date sums only, so the memory used depends on the number of dates (and stock pairs), not trades.
+    """
+    def __init__(self) -> None:
+        self.trades = 0
+        self.winners = 0
+        self.win_return_sum = 0
+        self.loss_return_sum = 0
+        self.return_sum = 0
+        self.duration_sum = 0
+        self.max_return = None
+        self.min_return = None
+        self.stock_pairs = set()
+        self.daily_mtm = DailyMtM()
+
+    def add_trades(self, trades_list):
+        for trade in trades_list:
+            trade_return = trade['Trade_Return']
+            self.trades += 1
+            if trade_return > 0:
+                self.winners += 1
+                self.win_return_sum += trade_return
+            else:
+                self.loss_return_sum += trade_return
+            self.return_sum += trade_return
+            self.duration_sum += trade['Trade_Duration']
+            self.max_return = trade_return if self.max_return == None else max(self.max_return, trade_return)
+            self.min_return = trade_return if self.min_return == None else min(self.min_return, trade_return)
+            if 'Stock_Pair' in trade:
+                self.stock_pairs.add(trade['Stock_Pair'])
+        self.daily_mtm.add_trades(trades_list)
+        return
+
+    def add_summary(self, summary):
+        """
+        Adds trades already reduced to their counts and sums (e.g. by a MongoDB aggregation) - trades, winners, win_return_sum,
+        loss_return_sum, return_sum, duration_sum, max_return, min_return and stock_pairs. Their MtM is added to daily_mtm separately.
+        """
+        if summary['trades'] == 0:
+            return
+        self.trades += summary['trades']
+        self.winners += summary['winners']
+        self.win_return_sum += summary['win_return_sum']
+        self.loss_return_sum += summary['loss_return_sum']
+        self.return_sum += summary['return_sum']
+        self.duration_sum += summary['duration_sum']
+        self.max_return = summary['max_return'] if self.max_return == None else max(self.max_return, summary['max_return'])
+        self.min_return = summary['min_return'] if self.min_return == None else min(self.min_return, summary['min_return'])
+        self.stock_pairs.update(summary.get('stock_pairs', []))
+        return
+
+    def get_trade_metrics(self):
+        """
+        Same metrics as ResultsCalculator.get_trade_metrics, plus the open pairs metrics.
+        """
+        if self.trades == 0:
+            raise Exception("Trades List is empty")
+        losers = self.trades - self.winners
+        trade_metrics = {}
+        trade_metrics['Trades'] = self.trades
+        trade_metrics['Winners'] = self.winners
+        trade_metrics['Losers'] = losers
+        trade_metrics['Hit_Rate'] = round(self.winners / self.trades, 3)
+        if not losers == 0:
+            trade_metrics['Win_Loss_Rate'] = round(self.winners / losers, 3)
+            trade_metrics['Average_Win_to_Average_Loss'] = abs(round((self.win_return_sum / self.winners if self.winners > 0 else float('nan')) / \
+                (self.loss_return_sum / losers), 3))
+        else:
+            trade_metrics['Win_Loss_Rate'] = 'Invalid Metric'
+            trade_metrics['Average_Win_to_Average_Loss'] = 'Invalid Metric'
+        trade_metrics['Max_Profit_%'] = self.max_return
+        trade_metrics['Max_Loss_%'] = self.min_return
+        trade_metrics['Average_Trade_Duration'] = self.duration_sum / self.trades
+        trade_metrics['Average_Trade_Return'] = self.return_sum / self.trades
+        if not self.stock_pairs == set():
+            trade_metrics['Stock_Pairs_Traded'] = len(self.stock_pairs)
+        open_positions = self.daily_mtm.open_positions[self.daily_mtm.get_trading_days()]
+        if not len(open_positions) == 0:
+            trade_metrics['Maximum_Open_Pairs'] = int(open_positions.max())
+            trade_metrics['Average_Open_Pairs'] = int(open_positions.sum()) // len(open_positions)
+        else:
+            trade_metrics['Maximum_Open_Pairs'] = 0
+            trade_metrics['Average_Open_Pairs'] = 0
+        return trade_metrics
+
+    def get_mtm_sheet(self):
+        return self.daily_mtm.get_mtm_sheet()
+
+
+class StreamingResultsAggregator:
+    """
+    Builds the sector wise and combined results in a single pass over the trades, as the pairs finish.
+    -> The metrics and the daily PnL / open positions are updated incrementally (TradeMetricsAccumulator).
+    -> The tradesheet rows are appended to the tradesheet file of the report writer as they arrive instead of being kept in memory.
+    write_results() then saves the Trade_Metrics, MTM series (and Excel workbook if requested) of every sector and "Combined",
+    the reports being written in parallel over `workers` processes.
+    With a portfolio_simulator (see portfolio.PortfolioSimulator), the trades are also kept in a TradeBook and replayed
+    under the capital and position limits of the book - Portfolio_Equity, Portfolio_Tradesheet and Portfolio_Metrics reports.
+    """
+    def __init__(self, results_path, report_format='csv', excel=False, workers=1, combined_name='Combined', portfolio_simulator=None) -> None:
+        self.results_path = results_path
+        self.report_format = report_format
+        self.excel = excel
+        self.workers = workers
+        self.combined_name = combined_name
+        self.report_writer = create_report_writer(report_format, results_path)
+        self.accumulators = {}
+        self.portfolio_simulator = portfolio_simulator
+        self.trade_book = None if portfolio_simulator == None else TradeBook()
+
+    def add_trades(self, sector, trades_list):
+        if trades_list == []:
+            return
+        trades_df = pd.DataFrame(trades_list, columns=ResultsCalculator.trades_columns_order)
+        for name in [sector, self.combined_name]:
+            if not name in self.accumulators:
+                self.accumulators[name] = TradeMetricsAccumulator()
+            self.accumulators[name].add_trades(trades_list)
+            self.report_writer.append_trades(name, trades_df)
+        if not self.trade_book == None:
+            self.trade_book.add_trades(trades_list)
+        return
+
+    def write_results(self):
+        self.report_writer.close()
+        report_jobs = [(self.results_path, self.report_format, self.excel, name, accumulator.get_trade_metrics(), accumulator.get_mtm_sheet())
+            for name, accumulator in self.accumulators.items()]
+        write_reports(report_jobs, workers=self.workers)
+        if not self.portfolio_simulator == None and not self.accumulators == {}:
+            equity_curve, portfolio_metrics, portfolio_tradesheet = self.portfolio_simulator.run(self.trade_book)
+            self.report_writer.write_table('Portfolio_Equity', self.combined_name, equity_curve)
+            self.report_writer.write_table('Portfolio_Tradesheet', self.combined_name, portfolio_tradesheet)
+            write_trade_metrics_json(self.results_path, self.combined_name, portfolio_metrics, prefix='Portfolio_Metrics')
+        return
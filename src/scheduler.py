@@ -0,0 +1,70 @@
+import numpy as np
+from itertools import combinations
+from math import ceil
+
+from utils import get_window_bounds
+
+
+def uniform_pair_cost(sector, stock_1, stock_2):
+    """
+    Default cost estimate - every pair is assumed to take the same time.
+    """
+    return 1
+
+
+def create_panel_pair_cost(price_panel, train_period, test_period):
+    """
+    Cost estimate read from the price panel - the number of train-test splits of the pair, from the number of dates on
+    which both its stocks have a record, plus one for loading the pair. Returns the cost function for create_pair_chunks.
+    """
+    def panel_pair_cost(sector, stock_1, stock_2):
+        if not stock_1 in price_panel.ticker_index or not stock_2 in price_panel.ticker_index:
+            return 1
+        rows = np.count_nonzero(price_panel.present[:, price_panel.ticker_index[stock_1]] & price_panel.present[:, price_panel.ticker_index[stock_2]])
+        # The last date of a pair has no next open.
+        rows = max(rows - 1, 0)
+        if rows < train_period + test_period:
+            # Not sufficient data available, the pair is only loaded.
+            return 1
+        return 1 + len(get_window_bounds(rows, train_period, test_period)[0])
+    return panel_pair_cost
+
+
+def create_pair_chunks(sectors_dict, workers, chunk_cost=None, cost_function=uniform_pair_cost, chunks_per_worker=4, sector_pairs_dict=None):
+    """
+    Splits the stock pairs of all the sectors into chunks of roughly equal estimated cost.
+    sectors_dict : {sector: stock_list}
+    workers : number of worker processes the chunks will be fed to.
+    chunk_cost : target cost of a chunk. If None, it is chosen so that every worker gets about chunks_per_worker chunks.
+    cost_function : f(sector, stock_1, stock_2) -> estimated cost of backtesting the pair.
+    sector_pairs_dict : {sector: stock_pairs} to split instead of all the pairs of each sector (e.g. the pre-selected pairs).
+    Returns a list of (sector, stock_pairs, cost) with the costliest chunks first, so that the pool finishes evenly.
+    A chunk never spans 2 sectors.
+    """
+    sector_pairs = {}
+    total_cost = 0
+    for sector, stock_list in sectors_dict.items():
+        stock_pairs = combinations(stock_list, 2) if sector_pairs_dict == None else sector_pairs_dict.get(sector, [])
+        pairs = [(stock_1, stock_2, cost_function(sector, stock_1, stock_2)) for stock_1, stock_2 in stock_pairs]
+        sector_pairs[sector] = pairs
+        total_cost += sum(pair[2] for pair in pairs)
+    if chunk_cost == None:
+        chunk_cost = max(total_cost / (workers * chunks_per_worker), 1)
+
+    chunks = []
+    for sector, pairs in sector_pairs.items():
+        if pairs == []:
+            continue
+        n_chunks = ceil(sum(pair[2] for pair in pairs) / chunk_cost)
+        sector_chunk_cost = sum(pair[2] for pair in pairs) / n_chunks
+        stock_pairs, cost = [], 0
+        for stock_1, stock_2, pair_cost in pairs:
+            stock_pairs.append((stock_1, stock_2))
+            cost += pair_cost
+            if cost >= sector_chunk_cost:
+                chunks.append((sector, stock_pairs, cost))
+                stock_pairs, cost = [], 0
+        if not stock_pairs == []:
+            chunks.append((sector, stock_pairs, cost))
+    chunks.sort(key=lambda chunk: chunk[2], reverse=True)
+    return chunks
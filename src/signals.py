@@ -0,0 +1,67 @@
+import numpy as np
+
+
+class SignalSet:
+    """
+    Declarative definitions of the signals calculated on the price spread, evaluated lazily.
+    Every signal is defined by the signals (or columns) it depends on and a function of their values. calculate() only
+    evaluates the requested signals and their dependencies, each once - e.g. the rolling mean / std are shared by the
+    bands of all the std factors.
+    -> mean_period : window of the rolling mean and standard deviation.
+    -> std_factors : {band number: std factor}. Band 1 is named upper_band / lower_band, band n upper_band_n / lower_band_n.
+    """
+    def __init__(self, mean_period, std_factors) -> None:
+        self.mean_period = mean_period
+        self.std_factors = std_factors
+        self.definitions = self.get_definitions()
+
+    def get_definitions(self):
+        """
+        {signal: (dependencies, function of the values of the dependencies)}.
+        """
+        definitions = {
+            'mean': (['price_spread'], lambda spread: spread.rolling(window=self.mean_period).mean()),
+            'std': (['price_spread'], lambda spread: spread.rolling(window=self.mean_period).std()),
+        }
+        # Bands above 1 can be used as a level of doubling down or stop loss. Yet to be tested.
+        bands = {band: ('' if band == 1 else f'_{band}') for band in self.std_factors}
+        for band, suffix in bands.items():
+            definitions[f'upper_band{suffix}'] = (['mean', 'std'], lambda mean, std, std_factor=self.std_factors[band]: mean + std_factor * std)
+            definitions[f'lower_band{suffix}'] = (['mean', 'std'], lambda mean, std, std_factor=self.std_factors[band]: mean - std_factor * std)
+        for band, suffix in bands.items():
+            # Short the spread
+            definitions[f'upper_band_breach_{band}'] = (['price_spread', f'upper_band{suffix}'], lambda spread, level: np.where((spread >= level) & (spread.shift(1) < level.shift(1)), 1, 0))
+            definitions[f'upper_band_backtrack_{band}'] = (['price_spread', f'upper_band{suffix}'], lambda spread, level: np.where((spread < level) & (spread.shift(1) >= level.shift(1)), 1, 0))
+            # Long the spread
+            definitions[f'lower_band_breach_{band}'] = (['price_spread', f'lower_band{suffix}'], lambda spread, level: np.where((spread <= level) & (spread.shift(1) > level.shift(1)), 1, 0))
+            definitions[f'lower_band_backtrack_{band}'] = (['price_spread', f'lower_band{suffix}'], lambda spread, level: np.where((spread > level) & (spread.shift(1) <= level.shift(1)), 1, 0))
+        # Mean breach
+        definitions['mean_breach_from_above'] = (['price_spread', 'mean'], lambda spread, mean: np.where(spread <= mean, 1, 0))
+        definitions['mean_breach_from_below'] = (['price_spread', 'mean'], lambda spread, mean: np.where(spread >= mean, 1, 0))
+        return definitions
+
+    def calculate(self, data, signal_names=None):
+        """
+        Evaluates the given signals (all the defined signals if None) and the signals they depend on, and adds them as
+        columns of data (a DataFrame or a windows.PairWindow).
+        """
+        if signal_names == None:
+            signal_names = list(self.definitions.keys())
+        values = {}
+
+        def evaluate(name):
+            if not name in values:
+                if not name in self.definitions:
+                    # Column of the data.
+                    values[name] = data[name]
+                else:
+                    dependencies, function = self.definitions[name]
+                    values[name] = function(*[evaluate(dependency) for dependency in dependencies])
+                    data[name] = values[name]
+            return values[name]
+
+        for name in signal_names:
+            if not name in self.definitions:
+                raise Exception(f"Unknown signal : {name}")
+            evaluate(name)
+        return data
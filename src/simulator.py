@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+from math import floor
+
+from utils import get_transaction_costs
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _simulate_positions(long_entry, short_entry, long_exit, short_exit, next_open_1, next_open_2):
+    """
+    Walks the signals and returns the entry index, exit index and direction (1 = Long, -1 = Short) of every completed trade.
+    Mirrors the state machine of Strategy.generate_trades_reference. Positions open at the end of the data are not traded;
+    their direction (0 if flat) and entry index are returned as the last 2 values.
+    """
+    n = len(long_entry)
+    entry_idx = np.empty(n, dtype=np.int64)
+    exit_idx = np.empty(n, dtype=np.int64)
+    positions = np.empty(n, dtype=np.int64)
+    n_trades = 0
+    in_trade = False
+    position = 0
+    entry = -1
+    for i in range(n):
+        if in_trade:
+            if (position == 1 and long_exit[i]) or (position == -1 and short_exit[i]):
+                # Exit Signal obtained.
+                entry_idx[n_trades] = entry
+                exit_idx[n_trades] = i
+                positions[n_trades] = position
+                n_trades += 1
+                in_trade = False
+                position = 0
+        else:
+            if long_entry[i]:
+                in_trade = True
+                position = 1
+            elif short_entry[i]:
+                in_trade = True
+                position = -1
+            if in_trade:
+                long_price, short_price = (next_open_1[i], next_open_2[i]) if position == 1 else (next_open_2[i], next_open_1[i])
+                if not (long_price > 0 and short_price > 0):
+                    # Issue in the data.
+                    in_trade = False
+                    position = 0
+                else:
+                    entry = i
+    return entry_idx[:n_trades], exit_idx[:n_trades], positions[:n_trades], position, entry
+
+
+if not njit == None:
+    _simulate_positions = njit(cache=True)(_simulate_positions)
+
+
+def get_trade_signals(entry='backtrack'):
+    """
+    Signals read by the simulator : long entry, short entry, long exit and short exit.
+    """
+    return [f'lower_band_{entry}_1', f'upper_band_{entry}_1', 'mean_breach_from_below', 'mean_breach_from_above']
+
+
+def get_signal_arrays(data, entry='backtrack'):
+    long_entry, short_entry, long_exit, short_exit = [np.asarray(data[signal]) == 1 for signal in get_trade_signals(entry)]
+    next_open_1 = np.asarray(data['next_open_1'], dtype=np.float64)
+    next_open_2 = np.asarray(data['next_open_2'], dtype=np.float64)
+    return long_entry, short_entry, long_exit, short_exit, next_open_1, next_open_2
+
+
+def get_open_position(data, entry='backtrack'):
+    """
+    Position still open at the end of the signals, as {'Position', 'Entry_Date', 'Long_Entry_Price', 'Short_Entry_Price'}.
+    Returns None if flat.
+    """
+    signal_arrays = get_signal_arrays(data, entry=entry)
+    _, _, _, position, entry_row = _simulate_positions(*signal_arrays)
+    if position == 0:
+        return None
+    next_open_1, next_open_2 = signal_arrays[4], signal_arrays[5]
+    open_position = {'Position': 'Long' if position == 1 else 'Short', 'Entry_Date': pd.Timestamp(np.asarray(data['next_date'])[entry_row])}
+    open_position['Long_Entry_Price'], open_position['Short_Entry_Price'] = (float(next_open_1[entry_row]), float(next_open_2[entry_row])) if position == 1 else (float(next_open_2[entry_row]), float(next_open_1[entry_row]))
+    return open_position
+
+
+def simulate_trades(data, capital_per_trade, sector_name, entry='backtrack'):
+    """
+    Simulates the trade execution on the signal columns of a test window and logs execution info.
+    data : DataFrame (or mapping of column name to array) with the columns produced by Strategy.calculate_signals.
+    Returns the same list of trade dicts as Strategy.generate_trades_reference, except that the MtM is carried as the
+    MtM_days / MtM_values arrays instead of MtM_dict.
+    """
+    signal_arrays = get_signal_arrays(data, entry=entry)
+    next_open_1, next_open_2 = signal_arrays[4], signal_arrays[5]
+    entry_idx, exit_idx, positions, _, _ = _simulate_positions(*signal_arrays)
+    if len(entry_idx) == 0:
+        return []
+
+    close_1 = np.asarray(data['close_1'], dtype=np.float64)
+    close_2 = np.asarray(data['close_2'], dtype=np.float64)
+    hedge_ratio = np.asarray(data['hedge_ratio'], dtype=np.float64)
+    underlying_1 = np.asarray(data['underlying_1'])
+    underlying_2 = np.asarray(data['underlying_2'])
+    dates = np.asarray(data['date'], dtype='datetime64[ns]')
+    next_dates = np.asarray(data['next_date'], dtype='datetime64[ns]')
+
+    trades_list = []
+    for entry_row, exit_row, position in zip(entry_idx.tolist(), exit_idx.tolist(), positions.tolist()):
+        is_long = position == 1
+        trade_dict = {}
+        trade_dict['Position'] = 'Long' if is_long else 'Short'
+        trade_dict['Entry_Date'] = pd.Timestamp(next_dates[entry_row])
+        trade_dict['Long_Stock'], trade_dict['Short_Stock'] = (underlying_1[entry_row], underlying_2[entry_row]) if is_long else (underlying_2[entry_row], underlying_1[entry_row])
+        trade_dict['Long_Entry_Price'], trade_dict['Short_Entry_Price'] = (next_open_1[entry_row], next_open_2[entry_row]) if is_long else (next_open_2[entry_row], next_open_1[entry_row])
+        # Split the capital based on the hedge_ratio.
+        capital_split_factor = abs(hedge_ratio[entry_row]) + 1
+        capital_stock_1 = capital_per_trade / capital_split_factor
+        capital_stock_2 = capital_per_trade - capital_stock_1
+        trade_dict['Long_Quantity'] = floor((capital_stock_1 if is_long else capital_stock_2) / trade_dict['Long_Entry_Price'])
+        trade_dict['Short_Quantity'] = floor((capital_stock_1 if not is_long else capital_stock_2) / trade_dict['Short_Entry_Price'])
+
+        # Mark-to-market of every bar in the trade, the exit bar included.
+        long_close, short_close = (close_1, close_2) if is_long else (close_2, close_1)
+        span = slice(entry_row + 1, exit_row + 1)
+        gain_till_date = (long_close[span] - trade_dict['Long_Entry_Price']) * trade_dict['Long_Quantity'] + \
+            (trade_dict['Short_Entry_Price'] - short_close[span]) * trade_dict['Short_Quantity']
+        daily_mtm = gain_till_date - np.concatenate(([0.0], gain_till_date[:-1]))
+        # Carried as days since 1970-01-01 and values; converted to MtM_dict only when the trade is stored (see utils.serialize_mtm).
+        trade_dict['MtM_days'] = dates[span].astype('datetime64[D]').astype(np.int64)
+        trade_dict['MtM_values'] = daily_mtm
+
+        trade_dict['Exit_Date'] = pd.Timestamp(next_dates[exit_row])
+        trade_dict['Long_Exit_Price'], trade_dict['Short_Exit_Price'] = (next_open_1[exit_row], next_open_2[exit_row]) if is_long else (next_open_2[exit_row], next_open_1[exit_row])
+        trade_dict['Long_Points'] = trade_dict['Long_Exit_Price'] - trade_dict['Long_Entry_Price']
+        trade_dict['Long_PnL'] = trade_dict['Long_Points'] * trade_dict['Long_Quantity']
+        trade_dict['Short_Points'] = trade_dict['Short_Entry_Price'] - trade_dict['Short_Exit_Price']
+        trade_dict['Short_PnL'] = trade_dict['Short_Points'] * trade_dict['Short_Quantity']
+        trade_dict['Net_Points'] = trade_dict['Long_Points'] + trade_dict['Short_Points']
+        transaction_costs = get_transaction_costs(trade_dict['Long_Entry_Price'], trade_dict['Long_Exit_Price'], trade_dict['Long_Quantity']) + \
+            get_transaction_costs(trade_dict['Short_Exit_Price'], trade_dict['Short_Entry_Price'], trade_dict['Short_Quantity'])
+        trade_dict['Trade_PnL'] = trade_dict['Long_PnL'] + trade_dict['Short_PnL'] - transaction_costs
+        trade_dict['Trade_Return'] = 100 * trade_dict['Trade_PnL'] / capital_per_trade
+        trade_dict['Trade_Duration'] = (trade_dict['Exit_Date'] - trade_dict['Entry_Date']).total_seconds()/3600/24
+        trade_dict['Sector'] = sector_name
+        trade_dict['Hedge_Ratio'] = hedge_ratio[exit_row]
+        trade_dict['Stock_Pair'] = f"{underlying_1[exit_row]}|{underlying_2[exit_row]}"
+        trades_list.append(trade_dict)
+    return trades_list
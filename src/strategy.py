@@ -1,30 +1,46 @@
 import json
 import pandas as pd
 import os
-import datetime as dt
+import time
 import numpy as np
 from statsmodels.tsa.stattools import adfuller
-from statsmodels.regression.linear_model import OLS
-import statsmodels.api as sm
 
 from itertools import combinations
+from collections import defaultdict
 from math import floor
 from multiprocessing import Pool
 
 from data_processor import DataProcessor
-from results import ResultsCalculator
-from utils import MongoInteractor, get_transaction_costs, create_train_test_split
+from data_sources import create_data_source
+from results import StreamingResultsAggregator
+from portfolio import create_portfolio_simulator
+from scheduler import create_pair_chunks, create_panel_pair_cost, uniform_pair_cost
+from pair_selection import select_pairs, load_formation_panel
+from profiling import ChunkProfiler, RunProfile
+from pipeline import PairPrefetcher, StockDataCache
+from simulator import simulate_trades, get_open_position, get_trade_signals
+from signals import SignalSet
+from hedge_ratio import estimate_hedge_ratios
+from cointegration import screen_adf
+from price_panel import PricePanel
+from windows import PairWindows
+from window_cache import WindowCache, create_window_cache
+from utils import MongoInteractor, get_transaction_costs, get_window_bounds, get_date_range
 
 import warnings
 warnings.filterwarnings("ignore")
 
 class Strategy:
-    def __init__(self, config, sector, stock_list) -> None:
+    def __init__(self, config, sector, stock_list, price_panel=None) -> None:
         self.config = config
         self.stock_list = stock_list
         self.sector_name = sector
         self.mongo_interactor = None
         self.data_processor = None
+        self.window_cache = None
+        self.stock_data_cache = None
+        self.price_panel = price_panel
+        self.adf_report = defaultdict(int)
 
         # Indicator Variables
         self.in_trade = False
@@ -40,30 +56,138 @@ class Strategy:
         """
         self.mongo_interactor = MongoInteractor(self.config['database_parameters']['mongo'])
         self.mongo_interactor.create_connections()
-        self.data_processor = DataProcessor(self.mongo_interactor)
+        self.data_processor = DataProcessor(create_data_source(self.config, self.mongo_interactor))
+        self.window_cache = create_window_cache(self.config)
+        if not self.window_cache == None:
+            self.window_cache.create_connections()
         return
 
-    def fit_regression_model(self, combined_stock_df, train_split_idx):
+    def get_date_range(self):
+        """
+        Parses the start and end dates of the backtest from the config. Empty strings imply no bound in that direction.
+        """
+        return get_date_range(self.config['date_parameters'])
+
+    def fit_regression_model(self, combined_stock_df, train_split_idx, coefficient=None):
         """
         Fits a regression model and calculates the price spread using the hedge ratio (coefficient estimated by the regression model).
+        coefficient : hedge ratio already estimated for this split (see estimate_window_hedge_ratios). Estimated here if None.
         """
-        X = combined_stock_df[:train_split_idx]['close_2']
-        Y = combined_stock_df[:train_split_idx]['close_1']
-        X_1 = sm.add_constant(X)
-        regression_model = OLS(Y, X_1)
-        model_results = regression_model.fit()
-        coefficient = model_results.params.values[1]
+        if coefficient == None:
+            train_len = min(train_split_idx, len(combined_stock_df))
+            slopes, _ = estimate_hedge_ratios(combined_stock_df['close_1'].values, combined_stock_df['close_2'].values, [0], [train_len],
+                method=self.config['strategy_parameters'].get('hedge_ratio_method', 'ols'))
+            coefficient = slopes[0]
         combined_stock_df['price_spread'] = combined_stock_df['close_1'] - coefficient * combined_stock_df['close_2']
         combined_stock_df['hedge_ratio'] = coefficient
         return combined_stock_df
 
-    def perform_adfuller_test(self, combined_stock_df):
+    def estimate_window_hedge_ratios(self, combined_stock_df, train_period, test_period, windows=None):
+        """
+        Estimates the hedge ratio and the intercept of every train-test split of the pair in one batch, using the train part of each split.
+        windows : indices of the splits to estimate, all of them if None.
+        """
+        starts, train_ends, _ = get_window_bounds(len(combined_stock_df), train_period, test_period)
+        if not windows is None:
+            starts, train_ends = starts[windows], train_ends[windows]
+        return estimate_hedge_ratios(combined_stock_df['close_1'].values, combined_stock_df['close_2'].values, starts, train_ends,
+            method=self.config['strategy_parameters'].get('hedge_ratio_method', 'ols'))
+
+    def create_pair_windows(self, combined_stock_df, train_period, test_period, cached_stats=None, first_window=0):
+        """
+        Creates the train-test splits of a pair as views on its arrays (see windows.PairWindows), with the hedge ratio
+        and the price spread of every split fitted in one batch.
+        cached_stats : {split index: statistics} of the splits found in the window cache - their hedge ratios are not estimated.
+        first_window : index of the first split to create, the earlier ones are left out. The hedge ratios are still estimated
+        on the whole data, the kalman estimate of a split depending on all the earlier rows.
+        """
+        starts, _, _ = get_window_bounds(len(combined_stock_df), train_period, test_period)
+        # The splits start every train_period rows, so splitting the data from the first split to create gives the same splits.
+        window_df = combined_stock_df if first_window == 0 else combined_stock_df[starts[first_window]:].reset_index(drop=True)
+        pair_windows = PairWindows(window_df, train_period, test_period)
+        cached_stats = {} if cached_stats == None else cached_stats
+        hedge_ratios, intercepts = np.full(len(pair_windows), np.nan), np.full(len(pair_windows), np.nan)
+        for index, (hedge_ratio, intercept, *_) in cached_stats.items():
+            hedge_ratios[index], intercepts[index] = np.nan if hedge_ratio == None else hedge_ratio, np.nan if intercept == None else intercept
+        missing = np.array([index for index in range(len(pair_windows)) if not index in cached_stats], dtype=np.int64)
+        if len(missing) > 0:
+            hedge_ratios[missing], intercepts[missing] = self.estimate_window_hedge_ratios(combined_stock_df, train_period, test_period,
+                windows=missing + first_window)
+        pair_windows.set_hedge_ratios(hedge_ratios, intercepts)
+        return pair_windows
+
+    def fit_pair_windows(self, stock_1, stock_2, combined_stock_df, train_period, test_period, first_window=0):
+        """
+        Creates the train-test splits of a pair with their hedge ratios and tests their price spreads for stationarity.
+        With the window cache enabled, the statistics of the splits already in the cache are read from it and only the
+        other splits are fitted and tested (their statistics being added to the cache).
+        first_window : index of the first split to create (see create_pair_windows).
+        Returns the PairWindows and the ADF verdict of every split.
+        """
+        if self.window_cache == None:
+            pair_windows = self.create_pair_windows(combined_stock_df, train_period, test_period, first_window=first_window)
+            return pair_windows, self.perform_adfuller_tests(list(pair_windows))
+
+        strategy_params = self.config['strategy_parameters']
+        hedge_ratio_method = strategy_params.get('hedge_ratio_method', 'ols')
+        stock_pair, settings = f'{stock_1}|{stock_2}', WindowCache.get_settings(hedge_ratio_method, strategy_params.get('adf_screen', {}))
+        keys = WindowCache.get_window_keys(combined_stock_df, train_period, test_period, hedge_ratio_method)[first_window:]
+        cached_stats = self.window_cache.load(stock_pair, train_period, settings, keys)
+        self.adf_report['cache_hits'] += len(cached_stats)
+        pair_windows = self.create_pair_windows(combined_stock_df, train_period, test_period, cached_stats=cached_stats, first_window=first_window)
+        missing = [index for index in range(len(pair_windows)) if not index in cached_stats]
+        adf_statistics = []
+        missing_results = self.perform_adfuller_tests([pair_windows[index] for index in missing], statistics=adf_statistics) if len(missing) > 0 else []
+        new_stats = {index: (pair_windows.hedge_ratios[index], pair_windows.intercepts[index], adf_statistic, adf_pvalue, adf_test_passed)
+            for index, adf_test_passed, (adf_statistic, adf_pvalue) in zip(missing, missing_results, adf_statistics)}
+        self.window_cache.store(stock_pair, train_period, settings, keys, new_stats, hits=list(cached_stats))
+        adf_test_results = [cached_stats[index][4] == 1 if index in cached_stats else None for index in range(len(pair_windows))]
+        for index, adf_test_passed in zip(missing, missing_results):
+            adf_test_results[index] = adf_test_passed
+        return pair_windows, adf_test_results
+
+    def perform_adfuller_test(self, combined_stock_df, statistics=None):
         """
         Performs the Augmented Dickey Fuller test on the price spread.
+        statistics : if a list is given, the ADF statistic and p-value are appended to it.
         """
         adf_test_result = adfuller(combined_stock_df['price_spread'])
+        if not statistics == None:
+            statistics.append((float(adf_test_result[0]), float(adf_test_result[1])))
         return self.analyze_adf_test(adf_test_result)
 
+    def perform_adfuller_tests(self, stock_df_list, statistics=None):
+        """
+        Performs the stationarity test on the price spread of every train-test split of a pair.
+        With the adf_screen enabled, a fixed lag ADF statistic is computed for all the splits in one batch and only the
+        splits close to the critical value go through perform_adfuller_test. The outcome of each stage is counted in adf_report.
+        statistics : if a list is given, the (ADF statistic, p-value) of every split is appended to it - the fixed lag
+        statistic and no p-value for the splits decided by the screen.
+        """
+        screen_params = self.config['strategy_parameters'].get('adf_screen', {})
+        self.adf_report['windows'] += len(stock_df_list)
+        if not screen_params.get('enabled', False):
+            test_results = [self.perform_adfuller_test(stock_df, statistics=statistics) for stock_df in stock_df_list]
+            self.adf_report['exact_tested'] += len(test_results)
+            self.adf_report['exact_rejected'] += test_results.count(False)
+            return test_results
+
+        verdicts, screen_statistics = screen_adf([stock_df['price_spread'].values for stock_df in stock_df_list], lags=screen_params.get('lags', 1),
+            tolerance=screen_params.get('tolerance', 0.5), return_statistics=True)
+        test_results = []
+        for stock_df, verdict, screen_statistic in zip(stock_df_list, verdicts, screen_statistics):
+            if verdict == 'exact':
+                test_result = self.perform_adfuller_test(stock_df, statistics=statistics)
+                self.adf_report['exact_tested'] += 1
+                self.adf_report['exact_rejected'] += 0 if test_result else 1
+            else:
+                test_result = verdict == 'accept'
+                self.adf_report['screen_accepted' if test_result else 'screen_rejected'] += 1
+                if not statistics == None:
+                    statistics.append((screen_statistic, None))
+            test_results.append(test_result)
+        return test_results
+
     def analyze_adf_test(self, adf_test_result):
         """
         Validates the results of the Augmented Dickey Fuller test and gives the go ahead for trading if the test is successful (i.e. price spread is stationary).
@@ -71,73 +195,178 @@ class Strategy:
     #     return adf_test_result[1] < 0.05 and (adf_test_result[0] < min(adf_test_result[4].values()))
         return adf_test_result[1] < 0.05 and adf_test_result[0] <= adf_test_result[4]['5%']
     
-    def calculate_signals(self, data, mean_period, sd_factor_1, sd_factor_2):
+    def calculate_signals(self, data, mean_period, sd_factor_1, sd_factor_2, signal_names=None):
         """
         Calculates the rolling mean, rolling standard deviation, upper band and lower bands using the given parameters.
         Generates the signals for buying and selling the spread.
+        signal_names : signals to generate (see signals.SignalSet). Only these and the ones they depend on are calculated; all if None.
         """
-        data['mean'] = data['price_spread'].rolling(window=mean_period).mean()
-        data['std'] = data['price_spread'].rolling(window=mean_period).std()
-        data['upper_band'] = data['mean'] + sd_factor_1 * data['std']
-        data['lower_band'] = data['mean'] - sd_factor_1 * data['std']
+        return SignalSet(mean_period, {1: sd_factor_1, 2: sd_factor_2}).calculate(data, signal_names)
 
-        # Higher band can be used as a level of doubling down or stop loss. Yet to be tested.
-        data['upper_band_2'] = data['mean'] + sd_factor_2 * data['std']
-        data['lower_band_2'] = data['mean'] - sd_factor_2 * data['std']
-        
-        # sd_factor_1
-        data['upper_band_breach_1'] = np.where((data['price_spread'] >= data['upper_band']) & (data['price_spread'].shift(1) < data['upper_band'].shift(1)), 1, 0) # Short the spread
-        data['upper_band_backtrack_1'] = np.where((data['price_spread'] < data['upper_band']) & (data['price_spread'].shift(1) >= data['upper_band'].shift(1)), 1, 0) # Short the spread
-        data['lower_band_breach_1'] = np.where((data['price_spread'] <= data['lower_band']) & (data['price_spread'].shift(1) > data['lower_band'].shift(1)), 1, 0) # Long the spread
-        data['lower_band_backtrack_1'] = np.where((data['price_spread'] > data['lower_band']) & (data['price_spread'].shift(1) <= data['lower_band'].shift(1)), 1, 0) # Long the spread
-        
-        # sd_factor_2
-        data['upper_band_breach_2'] = np.where((data['price_spread'] >= data['upper_band_2']) & (data['price_spread'].shift(1) < data['upper_band_2'].shift(1)), 1, 0) # Short the spread
-        data['upper_band_backtrack_2'] = np.where((data['price_spread'] < data['upper_band_2']) & (data['price_spread'].shift(1) >= data['upper_band_2'].shift(1)), 1, 0) # Short the spread
-        data['lower_band_breach_2'] = np.where((data['price_spread'] <= data['lower_band_2']) & (data['price_spread'].shift(1) > data['lower_band_2'].shift(1)), 1, 0) # Long the spread
-        data['lower_band_backtrack_2'] = np.where((data['price_spread'] > data['lower_band_2']) & (data['price_spread'].shift(1) <= data['lower_band_2'].shift(1)), 1, 0) # Long the spread
-        
-        # Mean breach
-        data['mean_breach_from_above'] = np.where(data['price_spread'] <= data['mean'], 1, 0)
-        data['mean_breach_from_below'] = np.where(data['price_spread'] >= data['mean'], 1, 0)
-        return data
+    def get_pair_data(self, stock_1, stock_2):
+        """
+        Obtains the aggregated data for the 2 stocks, from the price panel if one is loaded.
+        """
+        if not self.price_panel == None:
+            return self.price_panel.get_pair_data(stock_1, stock_2)
+        start_date, end_date = self.get_date_range()
+        return self.data_processor.get_data(stock_1, stock_2, start_date=start_date, end_date=end_date)
 
-    def trade_pairs(self, stock_1, stock_2, train_period, test_period, mean_period, std_factor_1, std_factor_2, capital_per_trade):
+    def load_pair(self, stock_1, stock_2):
         """
-        Master function to trade a particular pair. 
+        Loads the inputs of a pair - its aggregated data, and its saved window state in incremental mode.
+        This is the I/O stage of a pair, run ahead of the computation by the PairPrefetcher when the pipeline is enabled.
         """
-        start_date = self.config['date_parameters']['start_date'] if not self.config['date_parameters']['start_date'] == "" else None
-        end_date = self.config['date_parameters']['end_date'] if not self.config['date_parameters']['end_date'] == "" else None
-        start_date = dt.datetime.strptime(start_date, '%Y-%m-%d')
-        end_date = dt.datetime.strptime(end_date, '%Y-%m-%d')
-        
-        # Obtain the aggregated data for the 2 stocks.
-        combined_stock_df = self.data_processor.get_data(stock_1, stock_2, start_date=start_date, end_date=end_date)
+        if self.stock_data_cache == None:
+            pair_inputs = {'data': self.get_pair_data(stock_1, stock_2)}
+        else:
+            pair_inputs = {'data': self.data_processor.combine_data(self.stock_data_cache.get(stock_1), self.stock_data_cache.get(stock_2))}
+            self.stock_data_cache.release((stock_1, stock_2))
+        if self.config.get('run_parameters', {}).get('incremental', False):
+            pair_inputs['window_state'] = self.mongo_interactor.load_window_state(f'{self.sector_name}|{stock_1}|{stock_2}')
+        return pair_inputs
+
+    def prepare_pair_windows(self, stock_1, stock_2, train_period, test_period, combined_stock_df=None):
+        """
+        Creates the train-test splits of a pair, fits the hedge ratio of each split and returns the splits whose price
+        spread passed the Augmented Dickey Fuller test. These only depend on train_period and test_period.
+        combined_stock_df : data of the pair, if already loaded.
+        """
+        if combined_stock_df is None:
+            combined_stock_df = self.get_pair_data(stock_1, stock_2)
         if len(combined_stock_df) < train_period + test_period:
             # Not sufficient data available.
             return []
-        # Create train-test splits for the data.
-        stock_df_list = create_train_test_split(combined_stock_df, train_period, test_period)
+        # Create train-test splits for the data and fit the hedge ratios on the train data.
+        pair_windows, adf_test_results = self.fit_pair_windows(stock_1, stock_2, combined_stock_df, train_period, test_period)
+        stock_df_list = list(pair_windows)
+        return [stock_df for stock_df, adf_test_passed in zip(stock_df_list, adf_test_results) if adf_test_passed]
+
+    def trade_windows(self, stock_df_list, test_period, mean_period, std_factor_1, std_factor_2, capital_per_trade):
+        """
+        Calculates the signals on the splits that passed the Augmented Dickey Fuller test and trades their test period.
+        """
         all_trades_list = []
         for stock_df in stock_df_list:
-            # Fit the regression model for the train data
-            stock_df = self.fit_regression_model(stock_df, train_split_idx=train_period)
-            # print(stock_df)
-            if self.perform_adfuller_test(stock_df):
-                # Augmented Dickey Fuller test passed.
-                stock_df = self.calculate_signals(stock_df, mean_period, std_factor_1, std_factor_2)
-                test_df = stock_df[-test_period:]
-                test_df.reset_index(inplace=True, drop=True)
-                # Simulate trade execution and log the execution info.
-                trades = self.generate_trades(test_df, capital_per_trade=capital_per_trade)
-                all_trades_list.extend(trades)
+            # Only the signals read by the simulator are calculated.
+            stock_df = self.calculate_signals(stock_df, mean_period, std_factor_1, std_factor_2, signal_names=get_trade_signals())
+            test_df = stock_df[-test_period:]
+            # Simulate trade execution and log the execution info.
+            trades = self.generate_trades(test_df, capital_per_trade=capital_per_trade)
+            all_trades_list.extend(trades)
+        return all_trades_list
+
+    def trade_pairs(self, stock_1, stock_2, train_period, test_period, mean_period, std_factor_1, std_factor_2, capital_per_trade, pair_inputs=None):
+        """
+        Master function to trade a particular pair. 
+        pair_inputs : inputs of the pair loaded by load_pair, loaded here if None.
+        """
+        pair_inputs = self.load_pair(stock_1, stock_2) if pair_inputs == None else pair_inputs
+        stock_df_list = self.prepare_pair_windows(stock_1, stock_2, train_period, test_period, combined_stock_df=pair_inputs['data'])
+        if stock_df_list == []:
+            return []
+        all_trades_list = self.trade_windows(stock_df_list, test_period, mean_period, std_factor_1, std_factor_2, capital_per_trade)
         # Save the trades in MongoDB.
         self.mongo_interactor.save_trades(all_trades_list, doc_name=f'{self.sector_name}|{stock_1}|{stock_2}')
         return all_trades_list
 
+    def get_window_state_parameters(self):
+        """
+        Parameters the windows of a pair depend on. A saved window state is only resumed from if these are unchanged.
+        """
+        strategy_params = self.config['strategy_parameters']
+        return {
+            'start_date': self.config['date_parameters']['start_date'],
+            'train_period': strategy_params['train_period'],
+            'test_period': strategy_params['test_period'],
+            'mean_period': strategy_params['mean_period'],
+            'std_factor_1': strategy_params['std_factor_1'],
+            'std_factor_2': strategy_params['std_factor_2'],
+            'hedge_ratio_method': strategy_params.get('hedge_ratio_method', 'ols'),
+            'adf_screen': strategy_params.get('adf_screen', {}),
+            'capital_per_trade': self.config['capital_parameters']['capital_per_trade']
+        }
+
+    def is_window_state_valid(self, window_state, combined_stock_df):
+        """
+        Checks that a saved window state can be resumed from : same parameters, and the rows it has processed are
+        unchanged (same first and last dates at the same positions), i.e. the data was only appended to since.
+        """
+        if window_state == None or not window_state['parameters'] == self.get_window_state_parameters():
+            return False
+        rows = window_state['rows']
+        if rows == 0 or rows > len(combined_stock_df):
+            return False
+        return combined_stock_df['date'].iloc[0] == pd.Timestamp(window_state['first_date']) and \
+            combined_stock_df['date'].iloc[rows - 1] == pd.Timestamp(window_state['last_date'])
+
+    def trade_pairs_incremental(self, stock_1, stock_2, train_period, test_period, mean_period, std_factor_1, std_factor_2, capital_per_trade, pair_inputs=None):
+        """
+        Incremental version of trade_pairs. Resumes from the window state saved on the document of the pair and only
+        evaluates the windows touched by the bars added since the last run - the last (incomplete) window and the new ones.
+        The trades of the windows that are complete are final and appended to the pair's trades, the trades of the last
+        incomplete window are kept apart as pending trades and recomputed on the next run.
+        Falls back to evaluating every window if there is no valid state. Returns the trades of the evaluated windows.
+        pair_inputs : inputs of the pair loaded by load_pair, loaded here if None.
+        """
+        doc_name = f'{self.sector_name}|{stock_1}|{stock_2}'
+        pair_inputs = self.load_pair(stock_1, stock_2) if pair_inputs == None else pair_inputs
+        combined_stock_df = pair_inputs['data']
+        n_rows = len(combined_stock_df)
+        if n_rows < train_period + test_period:
+            # Not sufficient data available.
+            return []
+        window_state = pair_inputs['window_state']
+        reset = not self.is_window_state_valid(window_state, combined_stock_df)
+        if reset:
+            window_state = {'parameters': self.get_window_state_parameters(), 'completed_windows': 0, 'windows': []}
+        elif window_state['rows'] == n_rows:
+            # No new bars.
+            return []
+
+        starts, _, ends = get_window_bounds(n_rows, train_period, test_period)
+        first_window = window_state['completed_windows']
+        completed_windows = int(np.count_nonzero(ends - starts == train_period + test_period))
+        # The hedge ratios are fitted on the whole data of the pair - the kalman estimate of a window depends on all the earlier rows.
+        pair_windows, adf_test_results = self.fit_pair_windows(stock_1, stock_2, combined_stock_df, train_period, test_period, first_window=first_window)
+        stock_df_list, hedge_ratios = list(pair_windows), pair_windows.hedge_ratios
+
+        new_trades, pending_trades = [], []
+        windows = window_state['windows'][:first_window]
+        open_position = None
+        for window_idx, (stock_df, hedge_ratio, adf_test_passed) in enumerate(zip(stock_df_list, hedge_ratios, adf_test_results), start=first_window):
+            windows.append({'start_date': stock_df['date'].iloc[0], 'hedge_ratio': float(hedge_ratio), 'adf_passed': bool(adf_test_passed)})
+            if not adf_test_passed:
+                continue
+            trades = self.trade_windows([stock_df], test_period, mean_period, std_factor_1, std_factor_2, capital_per_trade)
+            if window_idx < completed_windows:
+                new_trades.extend(trades)
+            else:
+                pending_trades.extend(trades)
+                # trade_windows has added the signals to stock_df.
+                open_position = get_open_position(stock_df[-test_period:])
+
+        window_state.update({
+            'rows': n_rows,
+            'first_date': combined_stock_df['date'].iloc[0],
+            'last_date': combined_stock_df['date'].iloc[-1],
+            'completed_windows': completed_windows,
+            'windows': windows,
+            'open_position': open_position
+        })
+        self.mongo_interactor.save_window_increment(doc_name, window_state, new_trades, pending_trades, reset=reset)
+        return new_trades + pending_trades
+
     def generate_trades(self, data_df, capital_per_trade, entry='backtrack'):
         """
         Simulates the trade execution and logs execution info.
+        The signals are walked on NumPy arrays (compiled with numba when available) by simulator.simulate_trades.
+        """
+        return simulate_trades(data_df, capital_per_trade, self.sector_name, entry=entry)
+
+    def generate_trades_reference(self, data_df, capital_per_trade, entry='backtrack'):
+        """
+        Row by row implementation of generate_trades. Kept as the reference the array simulator is validated against.
         """
         self.trades_list = []
         for _, row in data_df.iterrows():
@@ -233,7 +462,23 @@ class Strategy:
         Creates all possible pairs in a given sector and runs the strategy on each pair.
         """
         print(self.sector_name)
-        stock_combinations = list(combinations(self.stock_list, 2))
+        return self.trade_stock_pairs(self.get_stock_pairs())
+
+    def get_stock_pairs(self):
+        """
+        All the pairs of the sector, or the top ranked ones on the formation period before the start date if pair selection
+        is enabled (see pair_selection.select_pairs).
+        """
+        selection_params = self.config.get('pair_selection_parameters', {})
+        if not selection_params.get('enabled', False):
+            return list(combinations(self.stock_list, 2))
+        formation_panel = load_formation_panel(self.data_processor, self.stock_list, self.get_date_range()[0], selection_params)
+        return select_pairs(formation_panel, self.sector_name, self.stock_list, selection_params)
+
+    def trade_stock_pairs(self, stock_pairs):
+        """
+        Runs the strategy on each of the given pairs of the sector.
+        """
         complete_trades_list = []
         train_period = self.config['strategy_parameters']['train_period']
         test_period = self.config['strategy_parameters']['test_period']
@@ -241,27 +486,99 @@ class Strategy:
         std_factor_1 = self.config['strategy_parameters']['std_factor_1']
         std_factor_2 = self.config['strategy_parameters']['std_factor_2']
         capital_per_trade = self.config['capital_parameters']['capital_per_trade']
-        for stock_pair in stock_combinations:
+        pipeline_params = self.config.get('pipeline_parameters', {})
+        incremental = self.config.get('run_parameters', {}).get('incremental', False)
+        # Pairs sliced out of a shared panel are not worth loader threads - unless their window state is read from MongoDB.
+        prefetch = pipeline_params.get('enabled', False) and (self.price_panel == None or incremental)
+        # Load the data for all the stocks once (unless a shared panel was given); the pairs are sliced out of the panel.
+        # With the pipeline, the stocks are instead fetched by the loader threads as the pairs need them, so that the
+        # first pairs are computed while the next ones are being fetched.
+        if self.price_panel == None and not prefetch:
+            start_date, end_date = self.get_date_range()
+            self.price_panel = self.data_processor.build_price_panel(self.stock_list, start_date=start_date, end_date=end_date)
+        # In incremental mode, only the windows touched by the new bars are evaluated (see trade_pairs_incremental).
+        trade_pair = self.trade_pairs_incremental if incremental else self.trade_pairs
+        prefetcher = None
+        if prefetch:
+            if self.price_panel == None:
+                # Every stock is fetched once by the loaders, rather than once per pair.
+                start_date, end_date = self.get_date_range()
+                self.stock_data_cache = StockDataCache(lambda stock: self.data_processor.data_source.fetch_data(stock, start_date, end_date), stock_pairs)
+            prefetcher = PairPrefetcher(self.load_pair, stock_pairs, depth=pipeline_params.get('depth', 8), threads=pipeline_params.get('threads', 2))
+            pairs = prefetcher
+        else:
+            pairs = ((stock_pair, None) for stock_pair in stock_pairs)
+        for stock_pair, pair_inputs in pairs:
             stock_1, stock_2 = stock_pair
-            stock_pair_trades = self.trade_pairs(stock_1, stock_2, train_period, test_period, mean_period, std_factor_1, std_factor_2, capital_per_trade)
+            stock_pair_trades = trade_pair(stock_1, stock_2, train_period, test_period, mean_period, std_factor_1, std_factor_2, capital_per_trade, pair_inputs=pair_inputs)
             complete_trades_list.extend(stock_pair_trades)
             print(stock_pair)
+        print(self.sector_name, dict(self.adf_report))
         self.destroy_connections()
+        if prefetch:
+            self.print_pipeline_report(prefetcher)
         return complete_trades_list
 
+    def print_pipeline_report(self, prefetcher):
+        """
+        Time spent by the stages of the pipeline - loading, compute waiting for the loaders and for the trade writer, and writing.
+        """
+        report = dict(prefetcher.report)
+        trade_sink = self.mongo_interactor.trade_sink
+        if not trade_sink == None:
+            report.update(trade_sink.report)
+        print(self.sector_name, 'pipeline', {stage: round(seconds, 3) for stage, seconds in report.items()})
+        return
+
     def destroy_connections(self):
         """
         Disconnecting from relevant modules.
         """
         self.mongo_interactor.destroy_connections()
+        if not self.window_cache == None:
+            self.window_cache.destroy_connections()
         return
 
-def run_strategy_for_sector(config, sector, stock_list):
+# Profiler of the chunks run by the worker, created with its first chunk if profiling is enabled.
+chunk_profiler = None
+
+def run_strategy_for_chunk(chunk_args):
     """
-    Runs the strategy for a given sector.
+    Pool wrapper of run_strategy_for_pairs; returns the sector along with the trades of the chunk and the profile of the
+    chunk (None unless profiling_parameters.enabled is set).
     """
-    strat = Strategy(config, sector, stock_list)
-    trades = strat.trade_sector()
+    global chunk_profiler
+    config, sector, stock_pairs = chunk_args
+    profiling_params = config.get('profiling_parameters', {})
+    if not profiling_params.get('enabled', False):
+        return sector, run_strategy_for_pairs(config, sector, stock_pairs), None
+    if chunk_profiler == None:
+        chunk_profiler = ChunkProfiler(os.path.join(config['results_path'], 'cprofile') if profiling_params.get('cprofile', False) else None)
+    trades = run_strategy_for_pairs(config, sector, stock_pairs, profiler=chunk_profiler.start())
+    return sector, trades, chunk_profiler.stop()
+
+# Price panel of the whole universe, attached by every worker of the pool to the block created by the parent.
+shared_price_panel = None
+
+def attach_shared_price_panel(handle):
+    """
+    Pool initializer attaching the worker to the shared memory price panel created by the parent process.
+    """
+    global shared_price_panel
+    shared_price_panel = PricePanel.attach_shared_memory(handle)
+    return
+
+def run_strategy_for_pairs(config, sector, stock_pairs, profiler=None):
+    """
+    Runs the strategy for a chunk of stock pairs of a given sector.
+    Uses the shared price panel if the worker is attached to one, otherwise the chunk loads its own data.
+    profiler : profiling.StrategyProfiler instrumenting the strategy, if any.
+    """
+    stock_list = list(dict.fromkeys(stock for stock_pair in stock_pairs for stock in stock_pair))
+    strat = Strategy(config, sector, stock_list, price_panel=shared_price_panel)
+    if not profiler == None:
+        profiler.instrument(strat)
+    trades = strat.trade_stock_pairs(stock_pairs)
     return trades
 
 if __name__ == '__main__':
@@ -289,23 +606,75 @@ if __name__ == '__main__':
     else:
         raise Exception("Sectors dictionary is empty.")
 
-    # print(sectors_dict)
-    pool = Pool(6)
-    sectors_res = {sector: pool.apply_async(run_strategy_for_sector, args=(config, sector, stock_list)) for sector, stock_list in sectors_dict.items()}
-    sector_trades = {key: res.get() for key, res in sectors_res.items()}
+    run_params = config.get('run_parameters', {})
+    workers = run_params.get('workers', 6)
+    selection_params = config.get('pair_selection_parameters', {})
+    price_panel = None
+    sector_pairs_dict = None
+    if run_params.get('shared_price_panel', False) or selection_params.get('enabled', False):
+        mongo_interactor = MongoInteractor(config['database_parameters']['mongo'])
+        mongo_interactor.create_connections()
+        data_processor = DataProcessor(create_data_source(config, mongo_interactor))
+        universe = list(dict.fromkeys(stock for stock_list in sectors_dict.values() for stock in stock_list))
+        start_date, end_date = get_date_range(config['date_parameters'])
+        if run_params.get('shared_price_panel', False):
+            # Load the whole universe once in the parent.
+            stage_start = time.perf_counter()
+            price_panel = data_processor.build_price_panel(universe, start_date=start_date, end_date=end_date)
+            print(f"Price panel of {len(universe)} stocks loaded in {time.perf_counter() - stage_start:.2f}s.")
+        if selection_params.get('enabled', False):
+            # Rank and prune the pairs of every sector on the formation period before the start date, before any walk-forward work.
+            stage_start = time.perf_counter()
+            formation_panel = load_formation_panel(data_processor, universe, start_date, selection_params)
+            sector_pairs_dict = {sector: select_pairs(formation_panel, sector, stock_list, selection_params) for sector, stock_list in sectors_dict.items()}
+            del formation_panel
+            print(f"Pair selection done in {time.perf_counter() - stage_start:.2f}s.")
+        mongo_interactor.destroy_connections()
 
-    results_config = {
-        'start_date': config['date_parameters']['start_date'],
-        'end_date': config['date_parameters']['end_date'],
-        'capital': config['capital_parameters']['total_capital']
-    }
-    results_calculator = ResultsCalculator(config=results_config)
-
-    # Calculate sector wise results.
-    for sector, trades in sector_trades.items():
-        results_calculator.calculate_results(trades, config['results_path'], sector)
-
-    # Generate the results for all sectors combined.
-    combined_sector_trades = sum(list(sector_trades.values()), [])
-    results_calculator.calculate_results(combined_sector_trades, config['results_path'], "Combined")
+    # Split the pairs of all the sectors into chunks of similar cost and feed them to the pool. The cost of a pair is
+    # estimated from its number of train-test splits when the panel is loaded in the parent.
+    cost_function = uniform_pair_cost if price_panel == None else create_panel_pair_cost(price_panel, config['strategy_parameters']['train_period'],
+        config['strategy_parameters']['test_period'])
+    pair_chunks = create_pair_chunks(sectors_dict, workers, chunk_cost=run_params.get('chunk_cost'), cost_function=cost_function, sector_pairs_dict=sector_pairs_dict)
+    print(f"{len(pair_chunks)} chunks of pairs across {len(sectors_dict)} sectors on {workers} workers.")
+    panel_block = None
+    if run_params.get('shared_price_panel', False):
+        # The workers attach to the panel without copying.
+        panel_handle, panel_block = price_panel.to_shared_memory()
+        pool = Pool(workers, initializer=attach_shared_price_panel, initargs=(panel_handle,))
+    else:
+        pool = Pool(workers)
+    del price_panel
+    stage_start = time.perf_counter()
+    # Aggregate the results as the chunks finish; the trades of a chunk are not kept once they are accounted for.
+    # In incremental mode a run only returns the trades of the windows touched by the new bars, so the complete results
+    # are built from the strategy collection by get_results_from_mongo.py instead.
+    incremental = run_params.get('incremental', False)
+    results_params = config.get('results_parameters', {})
+    results_aggregator = None if incremental else StreamingResultsAggregator(config['results_path'], report_format=results_params.get('format', 'csv'),
+        excel=results_params.get('excel', False), workers=results_params.get('workers', 1), portfolio_simulator=create_portfolio_simulator(config))
+    chunk_args = [(config, sector, stock_pairs) for sector, stock_pairs, _ in pair_chunks]
+    run_profile = RunProfile() if config.get('profiling_parameters', {}).get('enabled', False) else None
+    new_trades = 0
+    for sector, trades, profile in pool.imap_unordered(run_strategy_for_chunk, chunk_args):
+        new_trades += len(trades)
+        if not run_profile == None:
+            run_profile.add(profile)
+        if not results_aggregator == None:
+            results_aggregator.add_trades(sector, trades)
+    pool.close()
+    if not panel_block == None:
+        panel_block.close()
+        panel_block.unlink()
+    print(f"Backtest of {sum(len(stock_pairs) for _, stock_pairs, _ in pair_chunks)} pairs done in {time.perf_counter() - stage_start:.2f}s.")
+    if not run_profile == None:
+        # Time, calls and work done per stage, sector and worker.
+        run_profile.write(config['results_path'])
 
+    if incremental:
+        print(f"Incremental run : {new_trades} new or pending trades saved, run get_results_from_mongo.py {config['simulation_name']} for the results.")
+    else:
+        # Save the sector wise results and the results for all sectors combined.
+        stage_start = time.perf_counter()
+        results_aggregator.write_results()
+        print(f"Results written in {time.perf_counter() - stage_start:.2f}s.")
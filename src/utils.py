@@ -1,8 +1,13 @@
 import pymongo
 import datetime as dt
 import pandas as pd
+import numpy as np
 import yfinance as yf
-import json
+import time
+import queue
+import threading
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
 
 class MongoInteractor:
     """
@@ -16,6 +21,7 @@ class MongoInteractor:
         self.data_collection = None
         self.support_collection = None
         self.strategy_collection = None
+        self.trade_sink = None
 
     def create_connections(self):
         """
@@ -28,13 +34,19 @@ class MongoInteractor:
         self.data_collection = self.data_db[mongo_params['data_collection']]
         self.support_collection = self.data_db[mongo_params['support_collection']]
         self.strategy_collection = self.strategy_db[mongo_params['strategy_collection']]
+        if 'trade_sink' in mongo_params:
+            self.trade_sink = TradeSink(self.strategy_collection, **mongo_params['trade_sink'])
         return
 
     def destroy_connections(self):
         """
-        Closes the mongo client connection.
+        Writes out the buffered trades and closes the mongo client connection.
         """
-        self.client.close()
+        try:
+            if not self.trade_sink == None:
+                self.trade_sink.close()
+        finally:
+            self.client.close()
         return
 
     def fetch_data(self, stock_name, start_date=None, end_date=None):
@@ -54,15 +66,71 @@ class MongoInteractor:
             mongo_query['date'] = date_query_dict
         data = pd.DataFrame(self.data_collection.find(mongo_query))
         return data
+
+    def fetch_sector_data(self, stock_list, start_date=None, end_date=None):
+        """
+        Fetch data for all the stocks in stock_list with a single query in the start_date - end_date interval.
+        Only the fields required to build the price panel are fetched.
+        """
+        mongo_query = {
+            'instrument_name': {'$in': [f'EQTSTK_{stock_name}_XXXXXXXXX_XX_0' for stock_name in stock_list]}
+        }
+        date_query_dict = {}
+        if not start_date == None:
+            date_query_dict['$gte'] = start_date
+        if not end_date == None:
+            date_query_dict['$lte'] = end_date
+        if not date_query_dict == {}:
+            mongo_query['date'] = date_query_dict
+        projection = {'_id': 0, 'date': 1, 'underlying': 1, 'open': 1, 'close': 1, 'sector': 1}
+        data = pd.DataFrame(self.data_collection.find(mongo_query, projection))
+        return data
     
     def save_trades(self, trades_list, doc_name):
         """
-        Save the trades in MongoDB.
+        Save the trades in MongoDB. With a trade sink configured, the document is buffered and written in a batch.
         """
         if not trades_list == []:
-            self.strategy_collection.insert_one({'_id': doc_name, 'trades': trades_list})
+            if not self.trade_sink == None:
+                self.trade_sink.add(doc_name, trades_list)
+            else:
+                self.strategy_collection.insert_one({'_id': doc_name, 'trades': [serialize_mtm(trade) for trade in trades_list]})
+        return
+
+    def load_window_state(self, doc_name):
+        """
+        Window state saved on the document of a pair by the incremental mode. None if the pair has no saved state.
+        """
+        pair_doc = self.strategy_collection.find_one({'_id': doc_name}, {'window_state': 1})
+        return None if pair_doc == None else pair_doc.get('window_state')
+
+    def save_window_increment(self, doc_name, window_state, new_trades, pending_trades, reset=False):
+        """
+        Updates the document of a pair after an incremental run : the trades of the windows completed in this run are
+        appended to 'trades', while 'pending_trades' (trades of the last window, which is still growing) and
+        'window_state' are replaced. With reset, the stored trades are replaced as well.
+        These writes bypass the trade sink, since they update existing documents.
+        """
+        compact = False if self.trade_sink == None else self.trade_sink.compact_mtm
+        new_trades = [serialize_mtm(trade, compact) for trade in new_trades]
+        update = {'$set': {'window_state': window_state, 'pending_trades': [serialize_mtm(trade, compact) for trade in pending_trades]}}
+        if reset:
+            update['$set']['trades'] = new_trades
+        else:
+            update['$push'] = {'trades': {'$each': new_trades}}
+        self.strategy_collection.update_one({'_id': doc_name}, update, upsert=True)
         return
 
+    def upsert_data(self, data_list):
+        """
+        Writes the documents to the data collection with unordered bulk ReplaceOne upserts on _id, so rewriting
+        documents that are already present replaces them instead of failing.
+        """
+        if data_list == []:
+            raise Exception("data_list is empty.")
+        result = self.data_collection.bulk_write([ReplaceOne({'_id': document['_id']}, document, upsert=True) for document in data_list], ordered=False)
+        return result.upserted_count + result.modified_count
+
     def save_data(self, data_list):
         if not data_list == []:
             self.data_collection.insert_many(data_list)
@@ -70,6 +138,154 @@ class MongoInteractor:
             raise Exception("data_list is empty.")
         return
 
+class TradeSink:
+    """
+    Buffers the trade documents of the pairs and writes them to the strategy collection with unordered insert_many.
+    -> batch_size : number of documents written per batch.
+    -> flush_interval : maximum number of seconds a document stays in the buffer.
+    -> background : if True, the writes happen on a separate thread and add() never waits for MongoDB.
+    -> compact_mtm : if True, the MtM of every trade is stored as the parallel lists MtM_days / MtM_values instead of MtM_dict.
+    -> queue_size : maximum number of documents waiting for the background writer (0 = no limit). add() waits when it is full.
+    The time add() waited for the writer (add_wait_seconds) and the time spent writing (write_seconds) are kept in report.
+    A write error other than rejected documents stops the background writer; it is raised by the next add() or close().
+    """
+    def __init__(self, collection, batch_size=500, flush_interval=5, background=False, compact_mtm=False, queue_size=0) -> None:
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compact_mtm = compact_mtm
+        self.buffer = []
+        self.last_flush = time.time()
+        self.documents_written = 0
+        self.write_errors = 0
+        self.report = {'add_wait_seconds': 0.0, 'write_seconds': 0.0}
+        self.queue = None
+        self.writer_thread = None
+        self.writer_error = None
+        if background:
+            self.queue = queue.Queue(maxsize=queue_size)
+            self.writer_thread = threading.Thread(target=self.run_writer, daemon=True)
+            self.writer_thread.start()
+
+    def add(self, doc_name, trades_list):
+        trades_list = [serialize_mtm(trade, self.compact_mtm) for trade in trades_list]
+        document = {'_id': doc_name, 'trades': trades_list}
+        start = time.perf_counter()
+        if not self.queue == None:
+            self.put(document)
+        else:
+            self.buffer_document(document)
+        self.report['add_wait_seconds'] += time.perf_counter() - start
+        return
+
+    def put(self, document):
+        """
+        Puts a document on the queue of the background writer, waiting while the queue is full - unless the writer has
+        stopped on an error, which is raised instead of waiting on it forever.
+        """
+        while True:
+            self.raise_writer_error()
+            try:
+                self.queue.put(document, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def raise_writer_error(self):
+        if not self.writer_error == None:
+            raise self.writer_error
+        return
+
+    def buffer_document(self, document):
+        self.buffer.append(document)
+        if len(self.buffer) >= self.batch_size or time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+        return
+
+    def flush(self):
+        """
+        Writes the buffered documents in one unordered batch. Documents that fail (e.g. duplicate _id) do not stop the others.
+        """
+        start = time.perf_counter()
+        if not self.buffer == []:
+            try:
+                self.collection.insert_many(self.buffer, ordered=False)
+                self.documents_written += len(self.buffer)
+            except BulkWriteError as error:
+                n_errors = len(error.details['writeErrors'])
+                self.documents_written += len(self.buffer) - n_errors
+                self.write_errors += n_errors
+                print(f"{n_errors} trade documents could not be written : {error.details['writeErrors'][0]['errmsg']}")
+            self.buffer = []
+        self.last_flush = time.time()
+        self.report['write_seconds'] += time.perf_counter() - start
+        return
+
+    def run_writer(self):
+        """
+        Background writer loop. A None on the queue stops it after a final flush. Any other error stops it too and is
+        kept in writer_error.
+        """
+        try:
+            while True:
+                try:
+                    document = self.queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    self.flush()
+                    continue
+                if document == None:
+                    break
+                self.buffer_document(document)
+            self.flush()
+        except Exception as error:
+            self.writer_error = error
+        return
+
+    def close(self):
+        if not self.writer_thread == None:
+            writer_thread, self.writer_thread = self.writer_thread, None
+            self.put(None)
+            writer_thread.join()
+            self.raise_writer_error()
+        else:
+            self.flush()
+        return
+
+def get_mtm_arrays(trade):
+    """
+    Returns the daily mark-to-market of a trade as (days since 1970-01-01, values) arrays, whichever layout the trade uses -
+    MtM_days / MtM_values (arrays or lists) or MtM_dict keyed by '%Y-%m-%d' strings.
+    """
+    if 'MtM_days' in trade:
+        return np.asarray(trade['MtM_days'], dtype=np.int64), np.asarray(trade['MtM_values'], dtype=np.float64)
+    mtm_dict = trade['MtM_dict']
+    return np.array(list(mtm_dict.keys()), dtype='datetime64[D]').astype(np.int64), np.array(list(mtm_dict.values()), dtype=np.float64)
+
+def compact_mtm(trade):
+    """
+    Stores the mark-to-market of a trade as the parallel lists MtM_days (days since 1970-01-01) and MtM_values.
+    """
+    mtm_days, mtm_values = get_mtm_arrays(trade)
+    trade = {key: val for key, val in trade.items() if not key in ['MtM_dict', 'MtM_days', 'MtM_values']}
+    trade['MtM_days'] = mtm_days.tolist()
+    trade['MtM_values'] = mtm_values.tolist()
+    return trade
+
+def expand_mtm(trade):
+    """
+    Stores the mark-to-market of a trade as MtM_dict, keyed by '%Y-%m-%d' strings.
+    """
+    mtm_days, mtm_values = get_mtm_arrays(trade)
+    trade = {key: val for key, val in trade.items() if not key in ['MtM_dict', 'MtM_days', 'MtM_values']}
+    trade['MtM_dict'] = dict(zip(np.datetime_as_string(mtm_days.astype('datetime64[D]')).tolist(), mtm_values.tolist()))
+    return trade
+
+def serialize_mtm(trade, compact=False):
+    """
+    Converts the mark-to-market of a trade to the layout stored in MongoDB.
+    """
+    return compact_mtm(trade) if compact else expand_mtm(trade)
+
 class YahooDataFetcher:
     """
     Module to fetch data from Yahoo Finance.
@@ -82,30 +298,36 @@ class YahooDataFetcher:
         return data
 
     def format_data(self, stock_name, sector, data):
+        """
+        Builds the documents of the SP500 collection from the downloaded data, one per date, with column operations.
+        """
         if data.empty:
             raise Exception("data is empty")
-        data_list = []
-        for idx, row in data.iterrows():
-            dict_ = {}
-            dict_["date"] = idx
-            dict_["instrument_name"] = f"EQTSTK_{stock_name}_XXXXXXXXX_XX_0"
-            dict_["underlying"] = stock_name
-            dict_["asset_type"] = "EQT"
-            dict_["security_type"] = "STK"
-            dict_["expiry"] = dt.datetime(1970, 1, 1)
-            dict_["strike"] = 0
-            dict_["open"] = row["Open"]
-            dict_["high"] = row["High"]
-            dict_["low"] = row["Low"]
-            dict_["close"] = row["Close"]
-            dict_["adj_close"] = row["Adj Close"]
-            dict_["volume"] = row["Volume"]
-            dict_["freq"] = "1D"
-            dict_["sector"] = sector
-            dict_["name"] = stock_name
-            dict_["_id"] = f"EQTSTK_{stock_name}_XXXXXXXXX_XX_0|1D|{str(idx).split(' ')[0]}"
-            data_list.append(dict_)
-        return data_list
+        if isinstance(data.columns, pd.MultiIndex):
+            # (Price, Ticker) columns of a download of a single ticker.
+            data = data.droplevel(1, axis=1)
+        instrument_name = f"EQTSTK_{stock_name}_XXXXXXXXX_XX_0"
+        records = pd.DataFrame({
+            "date": data.index,
+            "instrument_name": instrument_name,
+            "underlying": stock_name,
+            "asset_type": "EQT",
+            "security_type": "STK",
+            "expiry": dt.datetime(1970, 1, 1),
+            "strike": 0,
+            "open": data["Open"].values,
+            "high": data["High"].values,
+            "low": data["Low"].values,
+            "close": data["Close"].values,
+            "adj_close": data["Adj Close"].values,
+            # Float, as in the rows of the download (read with the price columns).
+            "volume": data["Volume"].values.astype(np.float64),
+            "freq": "1D",
+            "sector": sector,
+            "name": stock_name,
+            "_id": f"{instrument_name}|1D|" + pd.DatetimeIndex(data.index).strftime('%Y-%m-%d')
+        })
+        return records.to_dict('records')
 
     # def push_data_to_mongo(self, data_list):
     #     mongo_db = MongoInteractor()
@@ -125,36 +347,23 @@ def create_train_test_split(combined_stock_df, train_period, test_period):
         i += train_period
     return split_df_list
 
-def get_transaction_costs(buy_price, sell_price, quantity):
-    return 0
-
-def update_database(config_dict, sectors_dict, start_date, end_date):
-    yahoo_data = YahooDataFetcher()
-    mongo_db = MongoInteractor(config_dict)
-    mongo_db.create_connections()
-    issue_list = []
-    for sector, stock_list in sectors_dict.items():
-        for stock in stock_list:
-            try:
-                data = yahoo_data.fetch_data(stock, start_date, end_date, period='1D')
-                data_list = yahoo_data.format_data(stock, sector, data)
-                mongo_db.save_data(data_list)
-                print(f"Done with : {sector} | {stock}")
-            except Exception as error:
-                print(error, f"{sector} | {stock}")
-                issue_list.append((sector, stock))
-    mongo_db.destroy_connections()
-    print(issue_list)
-    return
-
-if __name__ == "__main__":
-    with open('config.json') as jfile:
-        config_dict = json.load(jfile)
-    
-    with open('sectors.json') as jfile:
-        sectors_dict = json.load(jfile)
+def get_window_bounds(max_len, train_period, test_period):
+    """
+    Row boundaries of the train-test splits created by create_train_test_split.
+    Returns the start, end of the train period and end of the split for every split (the last split may be truncated).
+    """
+    starts = np.arange(0, max(max_len - test_period, 0), train_period)
+    ends = np.minimum(starts + train_period + test_period, max_len)
+    train_ends = np.minimum(starts + train_period, ends)
+    return starts, train_ends, ends
 
-    start_date = "2021-11-13"
-    end_date = "2023-12-01"
+def get_date_range(date_parameters):
+    """
+    Parses the start and end dates in the date_parameters of the config. Empty strings imply no bound in that direction.
+    """
+    start_date = dt.datetime.strptime(date_parameters['start_date'], '%Y-%m-%d') if not date_parameters['start_date'] == "" else None
+    end_date = dt.datetime.strptime(date_parameters['end_date'], '%Y-%m-%d') if not date_parameters['end_date'] == "" else None
+    return start_date, end_date
 
-    update_database(config_dict, sectors_dict, start_date, end_date)
\ No newline at end of file
+def get_transaction_costs(buy_price, sell_price, quantity):
+    return 0
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import numpy as np
+
+from utils import get_window_bounds
+
+
+class WindowCache:
+    """
+    On-disk cache (SQLite, in WAL mode) of the statistics of the train-test splits of the pairs - hedge ratio, intercept,
+    ADF statistic, p-value and verdict - so that runs which only change the trading parameters (bands, capital and so on)
+    skip the hedge ratio fitting and the ADF tests.
+    A split is keyed by the stock pair, its first and last dates, the train period, the settings the statistics depend on
+    (hedge ratio method, ADF screen) and the hash of the data it was computed on, so a change in the data is a miss.
+    -> max_entries : size bound of the cache. The least recently used splits are evicted beyond it (None = no bound).
+    Every worker opens its own connection; concurrent writers wait on the database lock (timeout seconds).
+    """
+    def __init__(self, path, max_entries=None, timeout=60) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.connection = None
+        # Splits written since the size of the cache was last checked.
+        self.unchecked_writes = 0
+
+    def create_connections(self):
+        if not os.path.dirname(self.path) == '':
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=self.timeout)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS windows (
+                    stock_pair TEXT, train_period INTEGER, settings TEXT, start_date TEXT, end_date TEXT, data_hash TEXT,
+                    hedge_ratio REAL, intercept REAL, adf_statistic REAL, adf_pvalue REAL, adf_passed INTEGER, last_used REAL,
+                    PRIMARY KEY (stock_pair, train_period, settings, start_date, end_date, data_hash)
+                ) WITHOUT ROWID""")
+            self.connection.execute('CREATE INDEX IF NOT EXISTS windows_last_used ON windows (last_used)')
+        return
+
+    def destroy_connections(self):
+        self.connection.close()
+        return
+
+    @staticmethod
+    def get_settings(hedge_ratio_method, adf_screen):
+        """
+        Settings the statistics of a split depend on, besides its data and train period.
+        """
+        adf_screen = adf_screen if adf_screen.get('enabled', False) else {}
+        return json.dumps({'hedge_ratio_method': hedge_ratio_method, 'adf_screen': adf_screen}, sort_keys=True)
+
+    @staticmethod
+    def get_window_keys(combined_stock_df, train_period, test_period, hedge_ratio_method):
+        """
+        (start date, end date, data hash) of every train-test split of a pair. The hash covers the dates and the close prices
+        of the split - from the first row of the data for the kalman filter, whose estimate depends on all the earlier rows.
+        """
+        dates = combined_stock_df['date'].to_numpy().astype('datetime64[D]')
+        columns = [np.ascontiguousarray(dates.view(np.int64)), np.ascontiguousarray(combined_stock_df['close_1'].to_numpy(dtype=np.float64)),
+            np.ascontiguousarray(combined_stock_df['close_2'].to_numpy(dtype=np.float64))]
+        starts, _, ends = get_window_bounds(len(combined_stock_df), train_period, test_period)
+        keys = []
+        prefix_hash, prefix_end = hashlib.blake2b(digest_size=16), 0
+        for start, end in zip(starts, ends):
+            if hedge_ratio_method == 'kalman':
+                for column in columns:
+                    prefix_hash.update(column[prefix_end:end])
+                prefix_end = end
+                data_hash = prefix_hash.copy()
+            else:
+                data_hash = hashlib.blake2b(digest_size=16)
+                for column in columns:
+                    data_hash.update(column[start:end])
+            keys.append((str(dates[start]), str(dates[end - 1]), data_hash.hexdigest()))
+        return keys
+
+    def load(self, stock_pair, train_period, settings, keys):
+        """
+        Cached statistics of the splits of keys, as {split index: (hedge_ratio, intercept, adf_statistic, adf_pvalue, adf_passed)},
+        adf_passed being 1 for the splits that passed the ADF test and 0 otherwise.
+        """
+        rows = self.connection.execute("""
+            SELECT start_date, end_date, data_hash, hedge_ratio, intercept, adf_statistic, adf_pvalue, adf_passed FROM windows
+            WHERE stock_pair = ? AND train_period = ? AND settings = ?""", (stock_pair, train_period, settings)).fetchall()
+        # Verdicts saved as blobs by earlier versions are not trusted - those splits are computed again.
+        cached_rows = {tuple(row[:3]): row[3:] for row in rows if isinstance(row[7], int)}
+        return {index: cached_rows[key] for index, key in enumerate(keys) if key in cached_rows}
+
+    @staticmethod
+    def get_row_values(hedge_ratio, intercept, adf_statistic, adf_pvalue, adf_passed):
+        """
+        Statistics of a split as plain floats and a 0 / 1 verdict - sqlite3 would store NumPy scalars (e.g. numpy.bool_) as blobs.
+        """
+        to_float = lambda value: None if value == None else float(value)
+        return to_float(hedge_ratio), to_float(intercept), to_float(adf_statistic), to_float(adf_pvalue), int(bool(adf_passed))
+
+    def store(self, stock_pair, train_period, settings, keys, window_stats, hits=()):
+        """
+        Saves the statistics of the splits in window_stats ({split index: (hedge_ratio, intercept, adf_statistic, adf_pvalue,
+        adf_passed)}) and marks the splits in hits as used, in one transaction. Evicts the least recently used splits if the
+        cache has grown beyond max_entries.
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO windows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(stock_pair, train_period, settings) + tuple(keys[index]) + self.get_row_values(*stats) + (now,) for index, stats in window_stats.items()])
+            self.connection.executemany("""
+                UPDATE windows SET last_used = ? WHERE stock_pair = ? AND train_period = ? AND settings = ? AND start_date = ?
+                AND end_date = ? AND data_hash = ?""", [(now, stock_pair, train_period, settings) + tuple(keys[index]) for index in hits])
+        self.unchecked_writes += len(window_stats)
+        if not self.max_entries == None and self.unchecked_writes >= max(self.max_entries // 100, 1):
+            self.evict()
+        return
+
+    def evict(self):
+        """
+        Deletes the least recently used splits beyond max_entries.
+        """
+        self.unchecked_writes = 0
+        with self.connection:
+            excess = self.connection.execute('SELECT COUNT(*) FROM windows').fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.connection.execute("""
+                    DELETE FROM windows WHERE (stock_pair, train_period, settings, start_date, end_date, data_hash) IN (
+                        SELECT stock_pair, train_period, settings, start_date, end_date, data_hash FROM windows ORDER BY last_used LIMIT ?)""", (excess,))
+        return
+
+
+def create_window_cache(config):
+    """
+    Creates the WindowCache described by config['window_cache_parameters'], or None if it is not enabled.
+    """
+    cache_params = config.get('window_cache_parameters', {})
+    if not cache_params.get('enabled', False):
+        return None
+    return WindowCache(cache_params['path'], max_entries=cache_params.get('max_entries'), timeout=cache_params.get('timeout', 60))
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils import get_window_bounds
+
+
+class PairWindows:
+    """
+    Train-test splits of a pair as views on the arrays of the pair, in place of the DataFrame copies of create_train_test_split.
+    The splits are the same as those of create_train_test_split (the last split may be truncated).
+    -> columns : arrays of the columns of the combined dataframe of the pair (see DataProcessor.get_data).
+    -> spreads : (splits x split length) buffer holding the price spread of every split.
+    -> hedge_ratios, intercepts : hedge ratio and intercept of every split.
+    -> buffers : one buffer (of the length of a split) per derived column - rolling mean, bands, signals and so on.
+       They are shared by all the splits of the pair, so the derived columns of a split are only valid until another
+       split writes them. The splits are processed one after the other.
+    """
+    window_columns = ['price_spread', 'hedge_ratio']
+
+    def __init__(self, combined_stock_df, train_period, test_period) -> None:
+        self.columns = {column: combined_stock_df[column].to_numpy() for column in combined_stock_df.columns}
+        self.train_period = train_period
+        self.window_length = train_period + test_period
+        self.starts, _, self.ends = get_window_bounds(len(combined_stock_df), train_period, test_period)
+        self.spreads = np.full((len(self.starts), self.window_length), np.nan)
+        self.hedge_ratios = np.full(len(self.starts), np.nan)
+        self.intercepts = np.full(len(self.starts), np.nan)
+        self.buffers = {}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        return PairWindow(self, index)
+
+    def __iter__(self):
+        return (PairWindow(self, index) for index in range(len(self)))
+
+    def get_column_windows(self, column):
+        """
+        (complete splits x split length) strided view of a column - no copy is made. The truncated last split is not included.
+        """
+        values = self.columns[column]
+        if len(values) < self.window_length:
+            return np.empty((0, self.window_length), dtype=values.dtype)
+        return sliding_window_view(values, self.window_length)[::self.train_period]
+
+    def get_buffer(self, column, dtype):
+        if not column in self.buffers:
+            self.buffers[column] = np.empty(self.window_length, dtype=dtype)
+        return self.buffers[column]
+
+    def set_hedge_ratios(self, hedge_ratios, intercepts=None):
+        """
+        Sets the hedge ratio (and intercept) of every split and calculates their price spreads (close_1 - hedge_ratio * close_2) in one batch.
+        """
+        self.hedge_ratios[:] = hedge_ratios
+        if not intercepts is None:
+            self.intercepts[:] = intercepts
+        close_1_windows, close_2_windows = self.get_column_windows('close_1'), self.get_column_windows('close_2')
+        complete = len(close_1_windows)
+        spreads = self.spreads[:complete]
+        np.multiply(self.hedge_ratios[:complete, None], close_2_windows, out=spreads)
+        np.subtract(close_1_windows, spreads, out=spreads)
+        for index in range(complete, len(self)):
+            rows = slice(self.starts[index], self.ends[index])
+            self.spreads[index, :rows.stop - rows.start] = self.columns['close_1'][rows] - self.hedge_ratios[index] * self.columns['close_2'][rows]
+        return
+
+
+class PairWindow:
+    """
+    One train-test split of a pair, used like the split dataframe : window[column] is a Series (indexed 0 ... len - 1) viewing
+    the arrays of the pair or the buffers of PairWindows, and window[a:b] is the window of those rows of the split.
+    Columns assigned to the window are written into the buffers of PairWindows.
+    """
+    def __init__(self, pair_windows, index, rows=None) -> None:
+        self.pair_windows = pair_windows
+        self.index = index
+        self.rows = slice(pair_windows.starts[index], pair_windows.ends[index]) if rows == None else rows
+        # Position of the first row in the split.
+        self.offset = self.rows.start - pair_windows.starts[index]
+
+    def __len__(self):
+        return self.rows.stop - self.rows.start
+
+    def get_values(self, column):
+        split_rows = slice(self.offset, self.offset + len(self))
+        if column == 'price_spread':
+            return self.pair_windows.spreads[self.index, split_rows]
+        if column == 'hedge_ratio':
+            return np.broadcast_to(self.pair_windows.hedge_ratios[self.index], (len(self),))
+        if column in self.pair_windows.buffers:
+            return self.pair_windows.buffers[column][split_rows]
+        return self.pair_windows.columns[column][self.rows]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, _ = key.indices(len(self))
+            return PairWindow(self.pair_windows, self.index, slice(self.rows.start + start, self.rows.start + max(stop, start)))
+        return pd.Series(self.get_values(key), copy=False)
+
+    def __setitem__(self, column, values):
+        if column == 'hedge_ratio':
+            self.pair_windows.hedge_ratios[self.index] = values
+            return
+        values = np.asarray(values)
+        target = self.pair_windows.spreads[self.index] if column == 'price_spread' else self.pair_windows.get_buffer(column, values.dtype)
+        target[self.offset:self.offset + len(self)] = values
+        return
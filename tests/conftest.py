@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import pytest
+import pyarrow as pa
+import pandas as pd
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC_PATH)
+
+from benchmark import generate_universe
+from data_sources import LocalDataSource
+from strategy import Strategy
+from utils import expand_mtm
+
+
+@pytest.fixture(scope='session')
+def universe():
+    """
+    One synthetic sector of 6 stocks (3 of them cointegrated) over 800 days, as {stock: DataFrame}.
+    """
+    return generate_universe(1, 6, 800, cointegrated_fraction=0.5, seed=0)
+
+
+@pytest.fixture
+def config(tmp_path, universe):
+    """
+    The config of the repository, reading the synthetic universe from a local store in tmp_path. The trades are not
+    buffered by a trade sink and the window cache and the pipeline are disabled.
+    """
+    with open(os.path.join(SRC_PATH, 'config.json')) as jfile:
+        config = json.load(jfile)
+    store_path = str(tmp_path / 'store')
+    data_source = LocalDataSource(store_path)
+    for stock, data in universe.items():
+        data_source.write_table(stock, pa.Table.from_pandas(data, preserve_index=False))
+    config['date_parameters'] = {'start_date': '', 'end_date': ''}
+    config['data_parameters'] = {'source': 'local', 'local_store': {'path': store_path, 'format': 'parquet'}}
+    config['window_cache_parameters'] = {'enabled': False, 'path': str(tmp_path / 'window_cache.sqlite')}
+    config['pipeline_parameters'] = {'enabled': False}
+    config['run_parameters']['incremental'] = False
+    config['database_parameters']['mongo'].pop('trade_sink', None)
+    return config
+
+
+class MemoryCollection:
+    """
+    Stands in for the strategy collection, keeping the inserted documents.
+    """
+    def __init__(self) -> None:
+        self.documents = []
+
+    def insert_one(self, document):
+        self.documents.append(document)
+
+    def insert_many(self, documents, ordered=True):
+        self.documents.extend(documents)
+
+
+@pytest.fixture
+def make_strategy(config, universe):
+    """
+    Creates a Strategy on the synthetic sector, its trades being kept in memory instead of MongoDB.
+    """
+    def make_strategy(config=config):
+        strat = Strategy(config, 'SEC0', list(universe))
+        strat.mongo_interactor.strategy_collection = MemoryCollection()
+        return strat
+    return make_strategy
+
+
+@pytest.fixture
+def get_trade_rows():
+    """
+    Sorted comparable rows (pair, dates, position, quantities, PnL and MtM) of trades in any of the MtM layouts.
+    """
+    def get_trade_rows(trades_list):
+        rows = []
+        for trade in trades_list:
+            trade = expand_mtm(trade)
+            rows.append((trade['Stock_Pair'], pd.Timestamp(trade['Entry_Date']), pd.Timestamp(trade['Exit_Date']), trade['Position'],
+                trade['Long_Quantity'], trade['Short_Quantity'], round(trade['Trade_PnL'], 6), tuple(trade['MtM_dict']),
+                tuple(round(value, 6) for value in trade['MtM_dict'].values())))
+        return sorted(rows)
+    return get_trade_rows
@@ -0,0 +1,26 @@
+import numpy as np
+from statsmodels.tsa.stattools import adfuller
+
+from itertools import combinations
+
+from cointegration import fixed_lag_adf_statistics
+
+
+def test_fixed_lag_statistics_match_adfuller(universe):
+    spreads = np.stack([universe[stock_1]['close'].values[:250] - universe[stock_2]['close'].values[:250]
+        for stock_1, stock_2 in combinations(universe, 2)])
+    for lags in [0, 1, 3]:
+        t_stats, n_obs = fixed_lag_adf_statistics(spreads, lags=lags)
+        for spread, t_stat in zip(spreads, t_stats):
+            adf_test_result = adfuller(spread, maxlag=lags, autolag=None)
+            np.testing.assert_allclose(t_stat, adf_test_result[0], rtol=1e-9)
+            assert n_obs == adf_test_result[3]
+
+
+def test_screen_is_disabled_by_default(make_strategy, config):
+    # Without the screen, every split goes through the exact test.
+    strat = make_strategy()
+    strategy_params = config['strategy_parameters']
+    for stock_1, stock_2 in combinations(strat.stock_list, 2):
+        strat.prepare_pair_windows(stock_1, stock_2, strategy_params['train_period'], strategy_params['test_period'])
+    assert strat.adf_report['exact_tested'] == strat.adf_report['windows']
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from data_processor import DataProcessor
+
+
+def make_stock_data(stock, dates, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'date': pd.to_datetime(dates), 'underlying': stock, 'open': rng.normal(100, 1, len(dates)),
+        'close': rng.normal(100, 1, len(dates)), 'sector': 'SEC0'})
+
+
+def test_date_matching_aligns_the_rows_by_date():
+    dates = pd.bdate_range('2020-01-01', periods=40)
+    # Shuffled, each leg with dates the other does not have, and a repeated date.
+    df_1 = make_stock_data('A', list(dates[:35]) + [dates[10]], 0).sample(frac=1, random_state=0)
+    df_2 = make_stock_data('B', list(dates[5:]) + [dates[20], dates[30]], 1).sample(frac=1, random_state=1)
+    data_processor = DataProcessor(None)
+    matched_1, matched_2 = data_processor.perform_date_matching(df_1, df_2)
+
+    # The first row of a repeated date is kept.
+    reference = pd.merge(df_1.drop_duplicates('date'), df_2.drop_duplicates('date'), on='date', suffixes=('_1', '_2')).sort_values(by='date', ignore_index=True)
+    assert len(reference) == 30
+    pd.testing.assert_series_equal(matched_1['date'], reference['date'])
+    pd.testing.assert_series_equal(matched_2['date'], reference['date'])
+    for column in ['open', 'close', 'underlying']:
+        pd.testing.assert_series_equal(matched_1[column], reference[f'{column}_1'], check_names=False)
+        pd.testing.assert_series_equal(matched_2[column], reference[f'{column}_2'], check_names=False)
+
+    combined_stock_df = data_processor.combine_data(df_1, df_2)
+    np.testing.assert_array_equal(combined_stock_df['close_1'], reference['close_1'][:-1])
+    np.testing.assert_array_equal(combined_stock_df['close_2'], reference['close_2'][:-1])
+    np.testing.assert_array_equal(combined_stock_df['next_open_2'], reference['open_2'][1:])
@@ -0,0 +1,44 @@
+import datetime as dt
+import mongomock
+import numpy as np
+import pandas as pd
+
+from data_sources import LocalDataSource
+
+
+class MongoStub:
+    """
+    Stands in for the MongoInteractor, with the data collection on mongomock.
+    """
+    def __init__(self) -> None:
+        self.data_collection = mongomock.MongoClient()['Data']['SP500']
+
+
+def make_documents(stock_name, dates, seed):
+    rng = np.random.default_rng(seed)
+    instrument_name = f'EQTSTK_{stock_name}_XXXXXXXXX_XX_0'
+    return [{'_id': f"{instrument_name}|1D|{date.strftime('%Y-%m-%d')}", 'date': date.to_pydatetime(), 'instrument_name': instrument_name,
+        'underlying': stock_name, 'open': float(price), 'close': float(price), 'volume': 1000.0, 'sector': 'SEC0', 'expiry': dt.datetime(1970, 1, 1)}
+        for date, price in zip(dates, rng.normal(100, 1, len(dates)))]
+
+
+def test_refresh_from_mongo_appends_the_new_rows(tmp_path):
+    mongo_interactor = MongoStub()
+    dates = pd.bdate_range('2021-01-01', periods=60)
+    mongo_interactor.data_collection.insert_many(make_documents('AAA', dates[:40], 0) + make_documents('BBB', dates[:20], 1))
+    data_source = LocalDataSource(str(tmp_path))
+    assert data_source.refresh_from_mongo(mongo_interactor, ['AAA', 'BBB', 'CCC']) == {'AAA': 40, 'BBB': 20, 'CCC': 0}
+    stored_data = data_source.fetch_data('AAA')
+
+    # Rows up to the last stored date are not fetched again, even if they changed in MongoDB.
+    mongo_interactor.data_collection.update_many({'underlying': 'AAA'}, {'$set': {'close': 0.0}})
+    new_documents = make_documents('AAA', dates[40:], 2)
+    mongo_interactor.data_collection.insert_many(new_documents[::-1])
+    assert data_source.refresh_from_mongo(mongo_interactor, ['AAA', 'BBB']) == {'AAA': 20, 'BBB': 0}
+    data = data_source.fetch_data('AAA')
+    assert list(data['date']) == list(dates)
+    pd.testing.assert_frame_equal(data[:40], stored_data)
+    np.testing.assert_array_equal(data['close'][40:], [document['close'] for document in new_documents])
+
+    assert data_source.refresh_from_mongo(mongo_interactor, ['AAA', 'BBB']) == {'AAA': 0, 'BBB': 0}
+    assert len(data_source.fetch_data('AAA')) == 60 and len(data_source.fetch_data('BBB')) == 20
@@ -0,0 +1,58 @@
+import json
+import mongomock
+import numpy as np
+import pandas as pd
+import pytest
+
+from itertools import combinations
+
+from get_results_from_mongo import aggregate_results, stream_results
+from utils import compact_mtm
+
+
+@pytest.fixture
+def strategy_collection(make_strategy, universe):
+    """
+    Pair documents of 2 sectors with the MtM of their trades in both layouts, some of them with pending trades.
+    """
+    strat = make_strategy()
+    strat.trade_stock_pairs(list(combinations(universe, 2)))
+    collection = mongomock.MongoClient()['Stat_Arb']['Test']
+    for idx, pair_doc in enumerate(strat.mongo_interactor.strategy_collection.documents):
+        trades = [compact_mtm(trade) for trade in pair_doc['trades']] if idx % 2 == 0 else pair_doc['trades']
+        collection.insert_one({'_id': pair_doc['_id'], 'trades': trades[:-1], 'pending_trades': trades[-1:]} if idx % 3 == 0 else
+            {'_id': pair_doc['_id'], 'trades': trades})
+        if idx % 4 == 0:
+            collection.insert_one({'_id': pair_doc['_id'].replace('SEC0', 'SEC1'), 'trades': trades})
+    return collection
+
+
+def read_report(results_path, name):
+    with open(results_path / f'Trade_Metrics_{name}.json') as jfile:
+        trade_metrics = json.load(jfile)
+    return trade_metrics, pd.read_csv(results_path / f'MTM_{name}.csv', parse_dates=['Date'])
+
+
+@pytest.mark.parametrize('sectors', [[], ['SEC1']])
+def test_aggregations_match_the_streamed_results(strategy_collection, tmp_path, sectors):
+    (tmp_path / 'aggregated').mkdir()
+    (tmp_path / 'streamed').mkdir()
+    summary_df = aggregate_results(strategy_collection, sectors, str(tmp_path / 'aggregated'))
+    stream_results(strategy_collection, sectors, str(tmp_path / 'streamed'), batch_size=3)
+
+    names = ['SEC0', 'SEC1', 'Combined'] if sectors == [] else ['SEC1', 'Combined']
+    assert list(summary_df['Sector']) == names[:-1]
+    for name in names:
+        aggregated_metrics, aggregated_mtm = read_report(tmp_path / 'aggregated', name)
+        streamed_metrics, streamed_mtm = read_report(tmp_path / 'streamed', name)
+        assert aggregated_metrics.keys() == streamed_metrics.keys()
+        for metric, value in streamed_metrics.items():
+            # Up to the order of the float sums.
+            assert aggregated_metrics[metric] == pytest.approx(value, rel=1e-9), metric
+        assert list(aggregated_mtm.columns) == list(streamed_mtm.columns)
+        pd.testing.assert_series_equal(aggregated_mtm['Date'], streamed_mtm['Date'])
+        for column in aggregated_mtm.columns.drop('Date'):
+            np.testing.assert_allclose(aggregated_mtm[column], streamed_mtm[column], rtol=1e-9, atol=1e-6, err_msg=column)
+    streamed_trades = pd.read_csv(tmp_path / 'streamed' / 'Tradesheet_Combined.csv')
+    assert summary_df['Trades'].sum() == len(streamed_trades)
+    assert summary_df['PnL'].sum() == pytest.approx(streamed_trades['Trade_PnL'].sum(), rel=1e-9)
@@ -0,0 +1,31 @@
+import numpy as np
+import statsmodels.api as sm
+
+from itertools import combinations
+
+from hedge_ratio import estimate_hedge_ratios
+from utils import get_window_bounds
+
+
+def test_ols_hedge_ratios_match_statsmodels(universe):
+    stocks = list(universe)
+    starts, train_ends, _ = get_window_bounds(800, 150, 100)
+    for stock_1, stock_2 in combinations(stocks, 2):
+        close_1, close_2 = universe[stock_1]['close'].values, universe[stock_2]['close'].values
+        slopes, intercepts = estimate_hedge_ratios(close_1, close_2, starts, train_ends, method='ols')
+        for start, train_end, slope, intercept in zip(starts, train_ends, slopes, intercepts):
+            params = sm.OLS(close_1[start:train_end], sm.add_constant(close_2[start:train_end])).fit().params
+            np.testing.assert_allclose([intercept, slope], params, rtol=1e-9, atol=1e-9)
+
+
+def test_hedge_ratios_of_a_group_match_single_pairs(universe):
+    stocks = list(universe)
+    close_1 = np.stack([universe[stock]['close'].values for stock in stocks[:-1]], axis=1)
+    close_2 = np.repeat(universe[stocks[-1]]['close'].values[:, None], len(stocks) - 1, axis=1)
+    starts, train_ends, _ = get_window_bounds(800, 150, 100)
+    for method in ['ols', 'tls', 'kalman']:
+        slopes, intercepts = estimate_hedge_ratios(close_1, close_2, starts, train_ends, method=method)
+        for pair in range(close_1.shape[1]):
+            pair_slopes, pair_intercepts = estimate_hedge_ratios(close_1[:, pair], close_2[:, pair], starts, train_ends, method=method)
+            np.testing.assert_allclose(slopes[:, pair], pair_slopes, rtol=1e-12)
+            np.testing.assert_allclose(intercepts[:, pair], pair_intercepts, rtol=1e-12)
@@ -0,0 +1,42 @@
+import copy
+import mongomock
+import pytest
+
+from itertools import combinations
+
+
+# The kalman estimate of a window depends on all the rows before it.
+@pytest.mark.parametrize('hedge_ratio_method', ['ols', 'kalman'])
+@pytest.mark.parametrize('window_cache', [False, True])
+def test_incremental_runs_match_a_full_run(make_strategy, config, universe, get_trade_rows, hedge_ratio_method, window_cache):
+    stock_pairs = list(combinations(universe, 2))
+    config['strategy_parameters']['hedge_ratio_method'] = hedge_ratio_method
+    full_trades = make_strategy().trade_stock_pairs(stock_pairs)
+    assert len(full_trades) > 0
+
+    incremental_config = copy.deepcopy(config)
+    incremental_config['window_cache_parameters']['enabled'] = window_cache
+    incremental_config['run_parameters']['incremental'] = True
+    collection = mongomock.MongoClient()['Stat_Arb']['Test']
+    # The bars arrive in 4 runs, the last one with no new bar.
+    for end_date in ['2011-06-30', '2012-03-15', '2012-03-16', '', '']:
+        incremental_config['date_parameters']['end_date'] = end_date
+        strat = make_strategy(incremental_config)
+        strat.mongo_interactor.strategy_collection = collection
+        strat.trade_stock_pairs(stock_pairs)
+    stored_trades = [trade for pair_doc in collection.find() for trade in pair_doc.get('trades', []) + pair_doc.get('pending_trades', [])]
+    assert get_trade_rows(stored_trades) == get_trade_rows(full_trades)
+
+
+def test_changed_parameters_reset_the_window_state(make_strategy, config, universe, get_trade_rows):
+    stock_pairs = list(combinations(universe, 2))
+    incremental_config = copy.deepcopy(config)
+    incremental_config['run_parameters']['incremental'] = True
+    collection = mongomock.MongoClient()['Stat_Arb']['Test']
+    for mean_period in [30, config['strategy_parameters']['mean_period']]:
+        incremental_config['strategy_parameters']['mean_period'] = mean_period
+        strat = make_strategy(incremental_config)
+        strat.mongo_interactor.strategy_collection = collection
+        strat.trade_stock_pairs(stock_pairs)
+    stored_trades = [trade for pair_doc in collection.find() for trade in pair_doc.get('trades', []) + pair_doc.get('pending_trades', [])]
+    assert get_trade_rows(stored_trades) == get_trade_rows(make_strategy().trade_stock_pairs(stock_pairs))
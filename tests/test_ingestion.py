@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pymongo
+import mongomock
+import pytest
+
+from ingestion import LocalFixtureFetcher, update_database
+from utils import YahooDataFetcher
+
+SECTORS = {'Tech': ['AAA', 'BBB'], 'Energy': ['CCC']}
+
+
+def write_fixture(path, ticker, seed):
+    """
+    Writes 30 days of data of ticker in the layout of a Yahoo Finance download.
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(size=30))
+    data = pd.DataFrame({'Date': pd.bdate_range('2021-01-01', periods=30), 'Open': close + rng.normal(size=30), 'High': close + 1, 'Low': close - 1,
+        'Close': close, 'Adj Close': close, 'Volume': rng.integers(1000, 2000, size=30)})
+    data.to_csv(path / f'{ticker}.csv', index=False)
+
+
+class RecordingFetcher(LocalFixtureFetcher):
+    def __init__(self, path) -> None:
+        super().__init__(path)
+        self.fetched = []
+
+    def fetch_data(self, stock_name, start_date=None, end_date=None, period='1D'):
+        self.fetched.append(stock_name)
+        return super().fetch_data(stock_name, start_date, end_date, period)
+
+
+def test_format_data_matches_the_row_by_row_documents(tmp_path):
+    write_fixture(tmp_path, 'AAA', 0)
+    data = LocalFixtureFetcher(str(tmp_path)).fetch_data('AAA')
+    documents = YahooDataFetcher().format_data('AAA', 'Tech', data)
+    for document, (date, row) in zip(documents, data.iterrows()):
+        assert document['_id'] == f"EQTSTK_AAA_XXXXXXXXX_XX_0|1D|{str(date).split(' ')[0]}" and document['date'] == date
+        for field, column in [('open', 'Open'), ('high', 'High'), ('low', 'Low'), ('close', 'Close'), ('adj_close', 'Adj Close'), ('volume', 'Volume')]:
+            assert document[field] == row[column] and isinstance(document[field], float), field
+    assert len(documents) == len(data)
+
+
+@pytest.fixture
+def data_collection(config, monkeypatch):
+    client = mongomock.MongoClient()
+    try:
+        client['Probe']['Probe'].bulk_write([pymongo.ReplaceOne({'_id': 0}, {'_id': 0}, upsert=True)])
+    except TypeError:
+        # pymongo >= 4.9 passes arguments to the bulk operations that the mongomock of the requirements does not take.
+        pytest.skip("mongomock does not support the bulk writes of this pymongo version")
+    monkeypatch.setattr(pymongo, 'MongoClient', lambda *args, **kwargs: client)
+    mongo_params = config['database_parameters']['mongo']
+    return client[mongo_params['data_db']][mongo_params['data_collection']]
+
+
+def test_ingestion_is_idempotent(config, data_collection, tmp_path):
+    for seed, ticker in enumerate(['AAA', 'BBB', 'CCC']):
+        write_fixture(tmp_path, ticker, seed)
+    fetcher = LocalFixtureFetcher(str(tmp_path))
+    assert update_database(config['database_parameters']['mongo'], SECTORS, '2021-01-01', '2021-03-01', fetcher=fetcher, workers=2) == []
+    documents = sorted(data_collection.find(), key=lambda document: document['_id'])
+    assert len(documents) == 90
+    assert documents[0]['_id'] == 'EQTSTK_AAA_XXXXXXXXX_XX_0|1D|2021-01-01' and documents[0]['sector'] == 'Tech'
+    # Written again, the documents are replaced rather than duplicated or rejected.
+    assert update_database(config['database_parameters']['mongo'], SECTORS, '2021-01-01', '2021-03-01', fetcher=fetcher, workers=2) == []
+    assert sorted(data_collection.find(), key=lambda document: document['_id']) == documents
+
+
+def test_ingestion_resumes_from_the_checkpoint(config, data_collection, tmp_path):
+    # No data for CCC on the first run.
+    for seed, ticker in enumerate(['AAA', 'BBB']):
+        write_fixture(tmp_path, ticker, seed)
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    fetcher = RecordingFetcher(str(tmp_path))
+    issue_list = update_database(config['database_parameters']['mongo'], SECTORS, '2021-01-01', '2021-03-01', fetcher=fetcher, workers=2,
+        checkpoint_path=checkpoint_path)
+    assert issue_list == [('Energy', 'CCC')] and data_collection.count_documents({}) == 60
+
+    write_fixture(tmp_path, 'CCC', 2)
+    fetcher = RecordingFetcher(str(tmp_path))
+    assert update_database(config['database_parameters']['mongo'], SECTORS, '2021-01-01', '2021-03-01', fetcher=fetcher, workers=2,
+        checkpoint_path=checkpoint_path) == []
+    assert fetcher.fetched == ['CCC'] and data_collection.count_documents({}) == 90
+    # Another date range does not resume from the checkpoint.
+    fetcher = RecordingFetcher(str(tmp_path))
+    update_database(config['database_parameters']['mongo'], SECTORS, '2021-01-01', '2021-02-01', fetcher=fetcher, workers=2, checkpoint_path=checkpoint_path)
+    assert sorted(fetcher.fetched) == ['AAA', 'BBB', 'CCC']
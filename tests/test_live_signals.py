@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from itertools import combinations
+
+from data_processor import DataProcessor
+from data_sources import create_data_source
+from live_signals import LiveSignalEngine, PanelBarSource, run_live_replay
+from signals import SignalSet
+from simulator import _simulate_positions, get_signal_arrays
+
+MEAN_PERIOD, STD_FACTORS = 45, {1: 2, 2: 3}
+EVENTS = [f'{band}_band_{event}_{number}' for number in STD_FACTORS for band in ['upper', 'lower'] for event in ['breach', 'backtrack']] + \
+    ['mean_breach_from_above', 'mean_breach_from_below']
+
+
+@pytest.fixture
+def price_panel(config, universe):
+    return DataProcessor(create_data_source(config)).build_price_panel(list(universe))
+
+
+def create_engine(price_panel, train_period):
+    stock_pairs = list(combinations(price_panel.tickers, 2))
+    return LiveSignalEngine(stock_pairs, price_panel.tickers, MEAN_PERIOD, STD_FACTORS, history_length=train_period)
+
+
+def get_backtest_signals(make_strategy, price_panel, train_period, test_period):
+    """
+    Signals of the test periods of every window of every pair (without the ADF test, which the live engine does not run),
+    as {(pair, date): {signal: value}}, and the orders of the trades of generate_trades as {(pair, date, action, position)}.
+    A position still open at the end of a test period is exited on the first bar after it, if there is one.
+    """
+    strat = make_strategy()
+    signal_set = SignalSet(MEAN_PERIOD, STD_FACTORS)
+    signals, orders = {}, set()
+    for pair, stock_pair in enumerate(combinations(price_panel.tickers, 2)):
+        combined_stock_df = price_panel.get_pair_data(*stock_pair)
+        # The engine also gets the last bar, which has no next open.
+        pair_dates = price_panel.dates[price_panel.present[:, price_panel.ticker_index[stock_pair[0]]] & price_panel.present[:, price_panel.ticker_index[stock_pair[1]]]]
+        for window_idx, stock_df in enumerate(strat.create_pair_windows(combined_stock_df, train_period, test_period)):
+            if len(stock_df) <= train_period:
+                continue
+            # The rows after the train period - the test period, or what there is of it in the truncated last window.
+            test_df = signal_set.calculate(stock_df)[train_period:]
+            dates = np.asarray(test_df['date'])
+            for row, date in enumerate(dates):
+                signals[(pair, date)] = {signal: bool(test_df[signal].values[row]) for signal in EVENTS}
+            entry_idx, exit_idx, positions, open_position, open_entry = _simulate_positions(*get_signal_arrays(test_df))
+            for entry_row, exit_row, position in zip(entry_idx, exit_idx, positions):
+                orders.add((pair, dates[entry_row], 'Entry', position))
+                orders.add((pair, dates[exit_row], 'Exit', position))
+            expiry_row = (window_idx + 1) * train_period + test_period
+            if not open_position == 0:
+                orders.add((pair, dates[open_entry], 'Entry', open_position))
+                if expiry_row < len(pair_dates):
+                    orders.add((pair, pair_dates[expiry_row], 'Exit', open_position))
+    return signals, orders
+
+
+def get_order_keys(engine, orders):
+    pair_index = {f'{stock_1}|{stock_2}': pair for pair, (stock_1, stock_2) in enumerate(engine.stock_pairs)}
+    return {(pair_index[order['Stock_Pair']], order['Date'].to_datetime64(), order['Action'], 1 if order['Position'] == 'Long' else -1) for order in orders}
+
+
+def test_live_engine_matches_the_backtest(make_strategy, price_panel):
+    train_period, test_period = 150, 100
+    signals, expected_orders = get_backtest_signals(make_strategy, price_panel, train_period, test_period)
+    engine = create_engine(price_panel, train_period)
+    orders, mismatches = [], 0
+    for date, close in PanelBarSource(price_panel).bars():
+        refit = np.flatnonzero((engine.bar_counts >= train_period) & (engine.bar_counts % train_period == 0))
+        if len(refit) > 0:
+            orders.extend(engine.close_positions(date, refit, 'Refit'))
+            engine.fit_hedge_ratios(refit, train_period)
+        trade = (engine.bar_counts >= train_period) & (engine.bar_counts % train_period < test_period)
+        events, bar_orders = engine.push_bar(date, close, trade=trade)
+        orders.extend(bar_orders)
+        for pair in range(len(engine.stock_pairs)):
+            for signal, value in signals.get((pair, date), {}).items():
+                mismatches += not events[signal][pair] == value
+    assert len(signals) > 0 and mismatches == 0
+    # The backtest has no next open for the last bar.
+    last_date = price_panel.dates[-1]
+    order_keys = {order_key for order_key in get_order_keys(engine, orders) if not order_key[1] == last_date}
+    assert order_keys == expected_orders
+    assert any(order['Reason'] == 'Expired' for order in orders if order['Action'] == 'Exit')
+
+
+@pytest.mark.parametrize('test_period', [100, 150])
+def test_every_entry_is_exited(price_panel, test_period):
+    # With test_period == train_period the pairs trade until their hedge ratio is refitted.
+    engine = create_engine(price_panel, 150)
+    orders, _ = run_live_replay(engine, PanelBarSource(price_panel), 150, test_period)
+    open_positions = {}
+    for order in orders:
+        if order['Action'] == 'Entry':
+            assert not order['Stock_Pair'] in open_positions
+            open_positions[order['Stock_Pair']] = order['Position']
+        else:
+            assert open_positions.pop(order['Stock_Pair']) == order['Position']
+    # Only the positions of the last test period are still open.
+    assert len(open_positions) == np.count_nonzero(engine.positions)
+    if test_period == 150:
+        assert any(order.get('Reason') == 'Refit' for order in orders)
+
+
+def test_checkpoint_resume_matches_an_uninterrupted_run(price_panel, tmp_path):
+    bar_source = PanelBarSource(price_panel)
+    split_date = price_panel.dates[400]
+    engine = create_engine(price_panel, 150)
+    orders, _ = run_live_replay(engine, bar_source, 150, 100)
+
+    first_engine = create_engine(price_panel, 150)
+    first_orders, _ = run_live_replay(first_engine, bar_source, 150, 100, end_date=split_date)
+    first_engine.save_checkpoint(str(tmp_path / 'engine.npz'))
+    resumed_engine = LiveSignalEngine.load_checkpoint(str(tmp_path / 'engine.npz'))
+    resumed_orders, _ = run_live_replay(resumed_engine, bar_source, 150, 100, start_date=price_panel.dates[401])
+
+    assert first_orders + resumed_orders == orders
+    for name in LiveSignalEngine.state_arrays:
+        np.testing.assert_array_equal(getattr(resumed_engine, name), getattr(engine, name))
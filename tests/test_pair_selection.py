@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from itertools import combinations
+
+from data_sources import LocalDataSource
+from pair_selection import cluster_scores, correlation_scores
+
+
+def test_clusters_beyond_the_stocks_fall_back_to_correlation(universe):
+    close = np.stack([data['close'].values for data in universe.values()], axis=1)
+    np.testing.assert_array_equal(cluster_scores(close, clusters=10), correlation_scores(close))
+    scores = cluster_scores(close, clusters=2)
+    assert np.isfinite(scores[np.triu_indices(close.shape[1], 1)]).any()
+
+
+def test_pairs_are_selected_on_the_formation_period(make_strategy, config, universe):
+    config['date_parameters']['start_date'] = '2011-06-01'
+    config['pair_selection_parameters'] = {'enabled': True, 'method': 'cluster', 'top_k': 5, 'clusters': 10, 'formation_days': 365}
+    stock_pairs = make_strategy(config).get_stock_pairs()
+    assert len(stock_pairs) == 5 and set(stock_pairs) <= set(combinations(universe, 2))
+
+    # Changing the data from the start date on does not change the selection.
+    data_source = LocalDataSource(config['data_parameters']['local_store']['path'])
+    rng = np.random.default_rng(1)
+    for stock, data in universe.items():
+        data = data.copy()
+        after_start = data['date'] >= pd.Timestamp('2011-06-01')
+        data.loc[after_start, 'close'] = 100 + np.cumsum(rng.normal(0, 1, after_start.sum()))
+        data_source.write_table(stock, pa.Table.from_pandas(data, preserve_index=False))
+    assert make_strategy(config).get_stock_pairs() == stock_pairs
+
+
+def test_pair_selection_requires_a_start_date(make_strategy, config):
+    config['pair_selection_parameters'] = {'enabled': True, 'method': 'correlation', 'top_k': 5}
+    with pytest.raises(Exception, match="start_date"):
+        make_strategy(config).get_stock_pairs()
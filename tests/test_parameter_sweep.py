@@ -0,0 +1,36 @@
+import copy
+import pandas as pd
+import pytest
+
+from itertools import combinations
+
+from parameter_sweep import run_sweep_for_pairs, get_sweep_metrics
+from results import ResultsCalculator
+
+SUMMARY_COLUMNS = ['Stock_Pair', 'Trade_Return', 'Trade_PnL', 'Trade_Duration']
+
+
+def get_summary_rows(trades_list):
+    return sorted(tuple(round(trade[column], 9) if isinstance(trade[column], float) else trade[column] for column in SUMMARY_COLUMNS) for trade in trades_list)
+
+
+def test_sweep_matches_the_strategy_runs(make_strategy, config, universe):
+    stock_pairs = list(combinations(universe, 2))
+    mean_periods, std_factors = [config['strategy_parameters']['mean_period'], 30], [config['strategy_parameters']['std_factor_1'], 1.5]
+    sweep_results = run_sweep_for_pairs(config, 'SEC0', stock_pairs, mean_periods, std_factors)
+    results_calculator = ResultsCalculator({'capital': config['capital_parameters']['total_capital']})
+    sweep_metrics = get_sweep_metrics(sweep_results, [config['strategy_parameters']['std_factor_2']], results_calculator)
+    assert len(sweep_metrics) == 4
+
+    for (mean_period, std_factor_1), sweep_trades in sweep_results.items():
+        point_config = copy.deepcopy(config)
+        point_config['strategy_parameters'].update({'mean_period': mean_period, 'std_factor_1': std_factor_1})
+        trades_list = make_strategy(point_config).trade_stock_pairs(stock_pairs)
+        assert len(trades_list) > 0
+        assert get_summary_rows(sweep_trades) == get_summary_rows(trades_list)
+
+        trade_metrics = results_calculator.get_trade_metrics(pd.DataFrame(trades_list))
+        trade_metrics['Total_PnL'] = sum(trade['Trade_PnL'] for trade in trades_list)
+        row = sweep_metrics[(sweep_metrics['mean_period'] == mean_period) & (sweep_metrics['std_factor_1'] == std_factor_1)].iloc[0]
+        for metric, value in trade_metrics.items():
+            assert row[metric] == pytest.approx(value, rel=1e-9), metric
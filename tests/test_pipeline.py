@@ -0,0 +1,76 @@
+import copy
+import time
+import threading
+import numpy as np
+
+from itertools import combinations
+from collections import Counter
+
+from data_processor import DataProcessor
+from data_sources import create_data_source
+from pipeline import PairPrefetcher, StockDataCache
+
+
+def test_prefetcher_yields_the_pairs_in_order_with_a_bounded_depth():
+    stock_pairs = list(combinations('ABCDEFG', 2))
+    depth, started, lock = 4, [], threading.Lock()
+    delays = np.random.default_rng(0).uniform(0, 0.005, len(stock_pairs))
+    def load_pair(stock_1, stock_2):
+        with lock:
+            started.append((stock_1, stock_2))
+        # The loads finish out of order.
+        time.sleep(delays[stock_pairs.index((stock_1, stock_2))])
+        return stock_1 + stock_2
+
+    prefetcher = PairPrefetcher(load_pair, stock_pairs, depth=depth, threads=3)
+    yielded = []
+    for idx, (stock_pair, pair_inputs) in enumerate(prefetcher):
+        assert pair_inputs == ''.join(stock_pair)
+        with lock:
+            # The pair being computed and at most depth - 1 pairs after it.
+            assert len(started) <= idx + depth
+        yielded.append(stock_pair)
+        time.sleep(0.001)
+    assert yielded == stock_pairs and sorted(started) == sorted(stock_pairs)
+    assert prefetcher.report['load_seconds'] > 0
+
+
+def test_stock_data_cache_fetches_once_and_releases_the_stocks():
+    stock_pairs = list(combinations('ABCD', 2))
+    fetches, lock = Counter(), threading.Lock()
+    def fetch_stock(stock):
+        with lock:
+            fetches[stock] += 1
+        time.sleep(0.002)
+        return stock.lower()
+
+    stock_data_cache = StockDataCache(fetch_stock, stock_pairs)
+    threads = [threading.Thread(target=stock_data_cache.get, args=(stock,)) for stock in 'ABCD' * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fetches == Counter('ABCD') and stock_data_cache.get('A') == 'a'
+
+    # A stock is dropped with the last pair it is part of.
+    for idx, stock_pair in enumerate(stock_pairs):
+        stock_data_cache.release(stock_pair)
+        assert set(stock_data_cache.stock_data) == {stock for other_pair in stock_pairs[idx + 1:] for stock in other_pair}
+    assert stock_data_cache.stock_data == {}
+
+
+def test_pipeline_gives_the_trades_of_a_sequential_run(make_strategy, config, universe, get_trade_rows):
+    stock_pairs = list(combinations(universe, 2))
+    sequential_trades = make_strategy().trade_stock_pairs(stock_pairs)
+    pipeline_config = copy.deepcopy(config)
+    pipeline_config['pipeline_parameters'] = {'enabled': True, 'depth': 3, 'threads': 2}
+    strat = make_strategy(pipeline_config)
+    assert get_trade_rows(strat.trade_stock_pairs(stock_pairs)) == get_trade_rows(sequential_trades)
+    assert strat.stock_data_cache.stock_data == {}
+
+    # The pairs of a shared panel are sliced without the loaders.
+    price_panel = DataProcessor(create_data_source(config)).build_price_panel(list(universe))
+    strat = make_strategy(pipeline_config)
+    strat.price_panel = price_panel
+    assert get_trade_rows(strat.trade_stock_pairs(stock_pairs)) == get_trade_rows(sequential_trades)
+    assert strat.stock_data_cache == None
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from itertools import combinations
+from collections import defaultdict
+
+from portfolio import PortfolioSimulator, TradeBook
+from utils import expand_mtm
+
+
+def make_trade(long_stock, short_stock, entry_date, exit_date, capital, pnl=0.0, mtm_dict=None):
+    """
+    Trade of capital (at a price of 1 on both legs) held from entry_date to exit_date.
+    """
+    return {'Stock_Pair': f'{long_stock}|{short_stock}', 'Long_Stock': long_stock, 'Short_Stock': short_stock, 'Entry_Date': entry_date,
+        'Exit_Date': exit_date, 'Long_Entry_Price': 1.0, 'Short_Entry_Price': 1.0, 'Long_Quantity': capital / 2, 'Short_Quantity': capital / 2,
+        'Trade_PnL': pnl, 'MtM_dict': {} if mtm_dict == None else mtm_dict}
+
+
+def get_status(trades_list, **kwargs):
+    trade_book = TradeBook()
+    trade_book.add_trades(trades_list)
+    _, metrics, tradesheet = PortfolioSimulator(**kwargs).run(trade_book)
+    return dict(zip(tradesheet['Stock_Pair'], tradesheet['Status'])), metrics
+
+
+def test_max_open_pairs():
+    trades_list = [make_trade('A', 'B', '2020-01-01', '2020-01-10', 10), make_trade('C', 'D', '2020-01-02', '2020-01-10', 10),
+        make_trade('E', 'F', '2020-01-03', '2020-01-10', 10), make_trade('G', 'H', '2020-01-10', '2020-01-15', 10)]
+    status, metrics = get_status(trades_list, total_capital=100, max_open_pairs=2)
+    assert status == {'A|B': 'Taken', 'C|D': 'Taken', 'E|F': 'Rejected_Positions', 'G|H': 'Taken'}
+    assert metrics['Maximum_Open_Pairs'] == 2 and metrics['Rejected_Positions'] == 1
+
+
+def test_max_positions_per_stock():
+    # Both legs count, long or short.
+    trades_list = [make_trade('A', 'B', '2020-01-01', '2020-01-10', 10), make_trade('C', 'A', '2020-01-02', '2020-01-10', 10),
+        make_trade('B', 'C', '2020-01-02', '2020-01-10', 10), make_trade('C', 'D', '2020-01-03', '2020-01-10', 10)]
+    status, _ = get_status(trades_list, total_capital=100, max_positions_per_stock=1)
+    assert status == {'A|B': 'Taken', 'B|C': 'Rejected_Positions', 'C|A': 'Rejected_Positions', 'C|D': 'Taken'}
+
+
+def test_capital_limit():
+    trades_list = [make_trade('A', 'B', '2020-01-01', '2020-01-10', 60), make_trade('C', 'D', '2020-01-02', '2020-01-10', 50),
+        make_trade('E', 'F', '2020-01-03', '2020-01-10', 40)]
+    status, metrics = get_status(trades_list, total_capital=100)
+    assert status == {'A|B': 'Taken', 'C|D': 'Rejected_Capital', 'E|F': 'Taken'}
+    assert metrics['Maximum_Committed_Capital'] == 100 and metrics['Rejected_Capital'] == 1
+
+
+def test_same_day_exit_frees_the_capital_of_an_entry():
+    trades_list = [make_trade('A', 'B', '2020-01-01', '2020-01-10', 60), make_trade('C', 'D', '2020-01-10', '2020-01-15', 60)]
+    status, _ = get_status(trades_list, total_capital=100, max_open_pairs=1)
+    assert status == {'A|B': 'Taken', 'C|D': 'Taken'}
+
+
+@pytest.mark.parametrize('priority, taken_pair', [('stock_pair', 'A|B'), ('smallest_capital', 'C|D'), ('largest_capital', 'A|B'),
+    (lambda arrays, rng: -abs(arrays['capital'] - 50), 'E|F')])
+def test_priority_orders_the_entries_of_a_day(priority, taken_pair):
+    trades_list = [make_trade('C', 'D', '2020-01-01', '2020-01-10', 40), make_trade('E', 'F', '2020-01-01', '2020-01-10', 50),
+        make_trade('A', 'B', '2020-01-01', '2020-01-10', 70)]
+    status, _ = get_status(trades_list, total_capital=100, max_open_pairs=1, priority=priority)
+    assert [stock_pair for stock_pair, trade_status in status.items() if trade_status == 'Taken'] == [taken_pair]
+
+
+@pytest.mark.parametrize('reinvest_pnl, pnl, status_2', [(False, 20, 'Rejected_Capital'), (True, 20, 'Taken'), (True, -20, 'Rejected_Capital')])
+def test_reinvest_pnl(reinvest_pnl, pnl, status_2):
+    trades_list = [make_trade('A', 'B', '2020-01-01', '2020-01-10', 100, pnl=pnl), make_trade('C', 'D', '2020-01-11', '2020-01-15', 110)]
+    status, _ = get_status(trades_list, total_capital=100, reinvest_pnl=reinvest_pnl)
+    assert status == {'A|B': 'Taken', 'C|D': status_2}
+
+
+@pytest.mark.parametrize('max_open_pairs', [None, 3])
+def test_equity_curve_matches_a_loop_over_the_trades(make_strategy, universe, max_open_pairs):
+    sector_trades = make_strategy().trade_stock_pairs(list(combinations(universe, 2)))
+    trade_book = TradeBook()
+    trade_book.add_trades(sector_trades)
+    total_capital = 100000000
+    portfolio_simulator = PortfolioSimulator(total_capital, max_open_pairs=max_open_pairs)
+    equity_curve, metrics, tradesheet = portfolio_simulator.run(trade_book)
+    taken = {(stock_pair, entry_date) for stock_pair, entry_date, status in zip(tradesheet['Stock_Pair'], tradesheet['Entry_Date'], tradesheet['Status'])
+        if status == 'Taken'}
+    assert (max_open_pairs == None) == (len(taken) == len(sector_trades))
+
+    day_pnl, committed, open_pairs, exit_days = defaultdict(float), defaultdict(float), defaultdict(int), set()
+    for trade in sector_trades:
+        if not (trade['Stock_Pair'], pd.Timestamp(trade['Entry_Date'])) in taken:
+            continue
+        trade = expand_mtm(trade)
+        for date, value in trade['MtM_dict'].items():
+            day_pnl[pd.Timestamp(date)] += value
+        # The PnL not in the MtM is booked on the exit day.
+        day_pnl[pd.Timestamp(trade['Exit_Date'])] += trade['Trade_PnL'] - sum(trade['MtM_dict'].values())
+        exit_days.add(pd.Timestamp(trade['Exit_Date']))
+        for date in pd.date_range(trade['Entry_Date'], pd.Timestamp(trade['Exit_Date']) - pd.Timedelta(days=1)):
+            committed[date] += trade['Long_Entry_Price'] * trade['Long_Quantity'] + trade['Short_Entry_Price'] * trade['Short_Quantity']
+            open_pairs[date] += 1
+    dates = sorted(date for date in set(day_pnl) | set(open_pairs) | exit_days if not day_pnl[date] == 0 or open_pairs[date] > 0 or date in exit_days)
+
+    assert list(equity_curve['Date']) == dates
+    np.testing.assert_allclose(equity_curve['PnL'], [day_pnl[date] for date in dates], rtol=1e-12, atol=1e-6)
+    np.testing.assert_allclose(equity_curve['Equity'], total_capital + np.cumsum([day_pnl[date] for date in dates]), rtol=1e-12)
+    np.testing.assert_allclose(equity_curve['Committed_Capital'], [committed[date] for date in dates], rtol=1e-12, atol=1e-6)
+    assert list(equity_curve['Open_Pairs']) == [open_pairs[date] for date in dates]
+    assert metrics['Total_PnL'] == pytest.approx(sum(day_pnl.values()), rel=1e-12)
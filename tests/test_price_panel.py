@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from itertools import combinations
+
+from data_processor import DataProcessor
+from data_sources import LocalDataSource
+from price_panel import PricePanel
+
+
+@pytest.fixture
+def data_processor(config, universe):
+    """
+    DataProcessor on the local store of the synthetic universe, with gaps in the data of 2 of the stocks.
+    """
+    data_source = LocalDataSource(config['data_parameters']['local_store']['path'])
+    stocks = list(universe)
+    data_source.write_table(stocks[1], pa.Table.from_pandas(universe[stocks[1]].drop(index=range(100, 130)), preserve_index=False))
+    data_source.write_table(stocks[4], pa.Table.from_pandas(universe[stocks[4]][::3], preserve_index=False))
+    return DataProcessor(data_source)
+
+
+@pytest.mark.parametrize('start_date, end_date', [(None, None), (pd.Timestamp('2010-06-01'), pd.Timestamp('2012-01-31'))])
+def test_pair_data_of_the_panel_matches_get_data(data_processor, universe, start_date, end_date):
+    stocks = list(universe)
+    price_panel = data_processor.build_price_panel(stocks, start_date=start_date, end_date=end_date)
+    for stock_1, stock_2 in combinations(stocks, 2):
+        combined_stock_df = data_processor.get_data(stock_1, stock_2, start_date=start_date, end_date=end_date)
+        # pandas >= 2 keeps the unit of the stored dates, the panel holds them in ns.
+        combined_stock_df[['date', 'next_date']] = combined_stock_df[['date', 'next_date']].astype('datetime64[ns]')
+        pd.testing.assert_frame_equal(price_panel.get_pair_data(stock_1, stock_2), combined_stock_df)
+    assert price_panel.get_pair_data(stocks[0], 'UNKNOWN').empty
+
+
+def check_shared_panel(price_panel, handle, block):
+    shared_panel = PricePanel.attach_shared_memory(handle)
+    assert shared_panel.tickers == price_panel.tickers and shared_panel.sectors == price_panel.sectors
+    for name in ['dates', 'close', 'open', 'present']:
+        np.testing.assert_array_equal(getattr(shared_panel, name), getattr(price_panel, name))
+        assert getattr(shared_panel, name).dtype == getattr(price_panel, name).dtype and not getattr(shared_panel, name).flags.writeable
+    with pytest.raises(ValueError):
+        shared_panel.close[0, 0] = 0.0
+    stock_1, stock_2 = price_panel.tickers[:2]
+    pd.testing.assert_frame_equal(shared_panel.get_pair_data(stock_1, stock_2), price_panel.get_pair_data(stock_1, stock_2))
+    # The arrays view the block - a write by the creator is seen by the attached panel.
+    np.ndarray(price_panel.close.shape, dtype=np.float64, buffer=block.buf, offset=price_panel.dates.nbytes)[0, 0] = -1.0
+    assert shared_panel.close[0, 0] == -1.0
+    return shared_panel.shared_memory
+
+
+def test_shared_memory_round_trip(data_processor, universe):
+    price_panel = data_processor.build_price_panel(list(universe))
+    handle, block = price_panel.to_shared_memory()
+    try:
+        # The views on the blocks are released with the attached panel.
+        check_shared_panel(price_panel, handle, block).close()
+    finally:
+        block.close()
+        block.unlink()
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from itertools import combinations
+from collections import defaultdict
+
+from results import DailyMtM, ResultsCalculator, StreamingResultsAggregator
+from utils import compact_mtm, expand_mtm
+
+
+@pytest.fixture
+def sector_trades(make_strategy, universe):
+    return make_strategy().trade_stock_pairs(list(combinations(universe, 2)))
+
+
+def test_streaming_results_match_results_calculator(sector_trades, tmp_path):
+    assert len(sector_trades) > 0
+    results_calculator = ResultsCalculator({'capital': 100000000})
+    trade_metrics = results_calculator.get_trade_metrics(pd.DataFrame(sector_trades))
+    mtm_sheet, open_positions_dict = results_calculator.get_mtm_metrics(sector_trades)
+    trade_metrics['Maximum_Open_Pairs'] = max(open_positions_dict.values())
+    trade_metrics['Average_Open_Pairs'] = sum(open_positions_dict.values()) // len(open_positions_dict)
+
+    # The chunks arrive in any order.
+    results_aggregator = StreamingResultsAggregator(str(tmp_path))
+    chunks = [sector_trades[idx:idx + 7] for idx in range(0, len(sector_trades), 7)]
+    for chunk in chunks[::-1]:
+        results_aggregator.add_trades('SEC0', chunk)
+    results_aggregator.write_results()
+    for name in ['SEC0', 'Combined']:
+        accumulator = results_aggregator.accumulators[name]
+        streamed_metrics = accumulator.get_trade_metrics()
+        assert streamed_metrics.keys() == trade_metrics.keys()
+        for metric, value in trade_metrics.items():
+            # Up to the order of the float sums in the averages.
+            assert streamed_metrics[metric] == pytest.approx(value, rel=1e-12), metric
+        streamed_mtm_sheet = accumulator.get_mtm_sheet()
+        pd.testing.assert_series_equal(streamed_mtm_sheet['Date'], mtm_sheet['Date'])
+        np.testing.assert_allclose(streamed_mtm_sheet['Cumulative_PnL'], mtm_sheet['Cumulative_PnL'], rtol=1e-9, atol=1e-6)
+        assert len(pd.read_csv(tmp_path / f'Tradesheet_{name}.csv')) == len(sector_trades)
+
+
+def test_daily_mtm_matches_the_dict_reduction(sector_trades):
+    # Reduction of the MtM_dict of the trades date by date.
+    day_pnl, open_positions = defaultdict(float), defaultdict(int)
+    for trade in sector_trades:
+        for date, value in expand_mtm(trade)['MtM_dict'].items():
+            day_pnl[pd.Timestamp(date)] += value
+            open_positions[pd.Timestamp(date)] += 1
+    dates = sorted(day_pnl)
+
+    for layout in [lambda trade: trade, expand_mtm, compact_mtm]:
+        daily_mtm = DailyMtM()
+        # Out of date order, across batches.
+        daily_mtm.add_trades([layout(trade) for trade in sector_trades[len(sector_trades) // 2:]])
+        daily_mtm.add_trades([layout(trade) for trade in sector_trades[:len(sector_trades) // 2]])
+        mtm_sheet = daily_mtm.get_mtm_sheet()
+        assert list(mtm_sheet['Date']) == dates
+        np.testing.assert_allclose(mtm_sheet['PnL'], [day_pnl[date] for date in dates], rtol=1e-12, atol=1e-9)
+        assert daily_mtm.get_open_position_dict() == {date: open_positions[date] for date in dates}
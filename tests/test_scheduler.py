@@ -0,0 +1,30 @@
+from itertools import combinations
+
+from data_processor import DataProcessor
+from data_sources import create_data_source
+from scheduler import create_pair_chunks, create_panel_pair_cost
+from utils import get_window_bounds
+
+
+def test_panel_pair_cost_counts_the_splits_of_the_pair(config, universe):
+    stocks = list(universe)
+    price_panel = DataProcessor(create_data_source(config)).build_price_panel(stocks)
+    # The second stock is missing the first 300 days.
+    price_panel.present[:300, 1] = False
+    cost_function = create_panel_pair_cost(price_panel, 150, 100)
+    for stock_1, stock_2 in combinations(stocks, 2):
+        rows = len(price_panel.get_pair_data(stock_1, stock_2))
+        assert cost_function('SEC0', stock_1, stock_2) == 1 + len(get_window_bounds(rows, 150, 100)[0])
+    assert cost_function('SEC0', stocks[0], stocks[1]) < cost_function('SEC0', stocks[0], stocks[2])
+    assert cost_function('SEC0', stocks[0], 'UNKNOWN') == 1
+
+
+def test_chunks_are_balanced_on_the_cost(config, universe):
+    stocks = list(universe)
+    costs = {(stock_1, stock_2): 10 if stock_1 == stocks[0] else 1 for stock_1, stock_2 in combinations(stocks, 2)}
+    pair_chunks = create_pair_chunks({'SEC0': stocks}, 2, cost_function=lambda sector, stock_1, stock_2: costs[(stock_1, stock_2)], chunks_per_worker=2)
+    assert sorted(stock_pair for _, stock_pairs, _ in pair_chunks for stock_pair in stock_pairs) == sorted(costs)
+    for _, stock_pairs, cost in pair_chunks:
+        assert cost == sum(costs[stock_pair] for stock_pair in stock_pairs)
+    # The costly pairs are spread over more chunks than their count alone would give.
+    assert len(pair_chunks[0][1]) < len(pair_chunks[-1][1])
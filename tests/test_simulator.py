@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from itertools import combinations
+
+import simulator
+from simulator import get_trade_signals
+from utils import expand_mtm
+
+
+def get_test_windows(strat, config):
+    """
+    Test periods, with their signals, of every split of every pair of the sector that passed the ADF test.
+    """
+    strategy_params = config['strategy_parameters']
+    columns = ['date', 'next_date', 'underlying_1', 'underlying_2', 'close_1', 'close_2', 'next_open_1', 'next_open_2', 'hedge_ratio'] + get_trade_signals()
+    test_windows = []
+    for stock_1, stock_2 in combinations(strat.stock_list, 2):
+        for stock_df in strat.prepare_pair_windows(stock_1, stock_2, strategy_params['train_period'], strategy_params['test_period']):
+            stock_df = strat.calculate_signals(stock_df, strategy_params['mean_period'], strategy_params['std_factor_1'],
+                strategy_params['std_factor_2'], signal_names=get_trade_signals())
+            test_df = stock_df[-strategy_params['test_period']:]
+            # The row by row reference iterates a dataframe.
+            test_windows.append(pd.DataFrame({column: np.array(test_df[column]) for column in columns}))
+    return test_windows
+
+
+@pytest.mark.parametrize('compiled', [True, False])
+def test_simulate_trades_matches_reference(make_strategy, config, monkeypatch, compiled):
+    if not compiled:
+        monkeypatch.setattr(simulator, '_simulate_positions', getattr(simulator._simulate_positions, 'py_func', simulator._simulate_positions))
+    strat = make_strategy()
+    capital_per_trade = config['capital_parameters']['capital_per_trade']
+    test_windows = get_test_windows(strat, config)
+    # A bad open price on the next bar of an entry signal cancels the entry.
+    bad_window = test_windows[0].copy()
+    entry_rows = np.flatnonzero((bad_window['lower_band_backtrack_1'] == 1) | (bad_window['upper_band_backtrack_1'] == 1))
+    assert len(entry_rows) > 0
+    bad_window.loc[entry_rows[:1], ['next_open_1', 'next_open_2']] = 0
+    test_windows.append(bad_window)
+
+    n_trades = 0
+    for test_df in test_windows:
+        reference_trades = strat.generate_trades_reference(test_df, capital_per_trade)
+        trades = [expand_mtm(trade) for trade in strat.generate_trades(test_df, capital_per_trade)]
+        assert len(trades) == len(reference_trades)
+        for trade, reference_trade in zip(trades, reference_trades):
+            assert trade.keys() == reference_trade.keys()
+            for field, value in reference_trade.items():
+                assert trade[field] == value, field
+        n_trades += len(trades)
+    assert n_trades > 0
@@ -0,0 +1,59 @@
+import threading
+import mongomock
+import pytest
+from pymongo.errors import AutoReconnect
+
+from utils import TradeSink
+
+
+class FailingCollection:
+    def insert_many(self, documents, ordered=True):
+        raise AutoReconnect("connection lost")
+
+
+def run_with_timeout(target, timeout=30):
+    """
+    Runs target on a thread and returns the exception it raised (None if it returned), failing if it is still running after timeout seconds.
+    """
+    outcome = {}
+    def run():
+        try:
+            target()
+        except Exception as error:
+            outcome['error'] = error
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "blocked on the trade writer"
+    return outcome.get('error')
+
+
+def test_writer_error_is_raised_by_add_and_close():
+    trade_sink = TradeSink(FailingCollection(), batch_size=1, background=True, queue_size=1)
+    def add_documents():
+        for idx in range(100):
+            trade_sink.add(f'SEC0|A|B{idx}', [])
+    assert isinstance(run_with_timeout(add_documents), AutoReconnect)
+    assert isinstance(run_with_timeout(trade_sink.close), AutoReconnect)
+
+
+def test_writer_error_on_the_final_flush_is_raised_by_close():
+    trade_sink = TradeSink(FailingCollection(), batch_size=100, background=True, queue_size=1000)
+    trade_sink.add('SEC0|A|B', [])
+    assert isinstance(run_with_timeout(trade_sink.close), AutoReconnect)
+
+
+def test_rejected_documents_do_not_stop_the_writer():
+    collection = mongomock.MongoClient()['Stat_Arb']['Test']
+    trade_sink = TradeSink(collection, batch_size=2, background=True, queue_size=1)
+    for doc_name in ['SEC0|A|B', 'SEC0|A|B', 'SEC0|A|C', 'SEC0|B|C']:
+        trade_sink.add(doc_name, [])
+    assert run_with_timeout(trade_sink.close) == None
+    assert trade_sink.write_errors == 1
+    assert sorted(collection.distinct('_id')) == ['SEC0|A|B', 'SEC0|A|C', 'SEC0|B|C']
+
+
+def test_synchronous_writes_raise_directly():
+    trade_sink = TradeSink(FailingCollection(), batch_size=1)
+    with pytest.raises(AutoReconnect):
+        trade_sink.add('SEC0|A|B', [])
@@ -0,0 +1,40 @@
+import copy
+import sqlite3
+
+from itertools import combinations
+
+
+def run_sector(make_strategy, config, universe):
+    strat = make_strategy(config)
+    trades = strat.trade_stock_pairs(list(combinations(universe, 2)))
+    return trades, dict(strat.adf_report)
+
+
+def test_warm_cache_gives_the_trades_of_a_cold_run(make_strategy, config, universe, get_trade_rows):
+    uncached_trades, _ = run_sector(make_strategy, config, universe)
+    cache_config = copy.deepcopy(config)
+    cache_config['window_cache_parameters']['enabled'] = True
+    cold_trades, cold_report = run_sector(make_strategy, cache_config, universe)
+    warm_trades, warm_report = run_sector(make_strategy, cache_config, universe)
+
+    assert cold_report.get('cache_hits', 0) == 0
+    assert warm_report['cache_hits'] == cold_report['windows'] and warm_report.get('windows', 0) == 0
+    assert get_trade_rows(cold_trades) == get_trade_rows(uncached_trades)
+    assert get_trade_rows(warm_trades) == get_trade_rows(uncached_trades)
+    with sqlite3.connect(cache_config['window_cache_parameters']['path']) as connection:
+        verdicts = connection.execute('SELECT typeof(adf_passed), adf_passed, COUNT(*) FROM windows GROUP BY 1, 2').fetchall()
+    # Both verdicts are stored, as integers.
+    assert sorted(verdict[:2] for verdict in verdicts) == [('integer', 0), ('integer', 1)]
+
+
+def test_blob_verdicts_are_computed_again(make_strategy, config, universe, get_trade_rows):
+    uncached_trades, _ = run_sector(make_strategy, config, universe)
+    cache_config = copy.deepcopy(config)
+    cache_config['window_cache_parameters']['enabled'] = True
+    _, cold_report = run_sector(make_strategy, cache_config, universe)
+    with sqlite3.connect(cache_config['window_cache_parameters']['path']) as connection:
+        # Layout of the verdicts written from numpy.bool_ values.
+        connection.execute("UPDATE windows SET adf_passed = CAST(char(adf_passed) AS BLOB)")
+    trades, report = run_sector(make_strategy, cache_config, universe)
+    assert report.get('cache_hits', 0) == 0 and report['windows'] == cold_report['windows']
+    assert get_trade_rows(trades) == get_trade_rows(uncached_trades)